@@ -0,0 +1,68 @@
+"""
+Compares the busy-x and top senders metrics grouped from the rows of a chat with those reduced from its
+activity cube
+
+For every chat, prints the time taken to build the activity cube and its memory, then the time taken by every
+busy-x metric grouped from the rows and reduced from the cube, and by a few payload metrics computed from the
+DataFrame (building the cube in the call) and from a cube built beforehand, as compute_analysis does. Date range
+filters are answered from the cube alone, the last line times one.
+
+Usage:
+    python benchmarks/bench_activity.py <chat.txt> [<chat.txt> ...] [--repeat N]
+"""
+import argparse
+import time
+from chatalyzer import analysis, chatalyzer
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def group_rows(df, x):
+    """
+    Returns the busy-x counts of a chat grouped from its rows, as get_busy_x did before the activity cube
+    """
+    df2 = analysis.drop_none_author(df)
+    return analysis.get_busy_x_df(df2[analysis.KEY_MESSAGE].groupby(analysis.get_x_values(df2, x)).count(), -1,
+                                  False)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    for chatfile in args.chatfiles:
+        df = chatalyzer.parse_chats(chatfile)
+        seconds, cube = time_best(lambda: analysis.get_activity_cube(df), args.repeat)
+        cube_bytes = sum(getattr(cube, name).nbytes for name in ('counts', 'letters', 'words', 'media'))
+        print('{}\t{:,} messages\t{} authors x {} days\tcube {:.3f}s {:,.1f} MiB'.format(
+            chatfile, df.shape[0], len(cube.authors), cube.n_days, seconds, cube_bytes / 1024 ** 2))
+
+        for x in analysis.CUBE_X:
+            rows, expected = time_best(lambda: group_rows(df, x), args.repeat)
+            reduced, result = time_best(lambda: analysis.get_busy_x(None, x, -1, cube=cube), args.repeat)
+            print('{}\tbusy {:<8}rows {:.4f}s\tcube {:.4f}s{}'.format(
+                chatfile, x, rows, reduced, '' if result.equals(expected) else '\tWARNING: results disagree'))
+        for metric in ('top_message_senders', 'word_count', 'authorwise_daywise_message_count'):
+            from_df, expected = time_best(lambda: analysis.get_metric(df, metric), args.repeat)
+            reduced, result = time_best(lambda: analysis.get_metric(None, metric, cube), args.repeat)
+            print('{}\t{:<34}df {:.4f}s\tcube {:.4f}s{}'.format(
+                chatfile, metric, from_df, reduced, '' if result == expected else '\tWARNING: results disagree'))
+
+        days = cube.get_days()
+        start, end = days[len(days) // 4].item(), days[len(days) // 2].item()
+        seconds, _ = time_best(lambda: analysis.get_metric(None, 'top_message_senders', cube.select(start, end)),
+                               args.repeat)
+        print('{}\ttop_message_senders from {} to {}\tcube {:.4f}s'.format(chatfile, start, end, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares the memory held by the parsed chats and the analysis time in the default and the compact schema
+
+Usage:
+    python benchmarks/bench_compact.py <chat.txt> [<chat.txt> ...] [--repeat N]
+"""
+import argparse
+import time
+from chatalyzer import analysis, chatalyzer
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    print('message dtype of the compact schema: {}'.format(analysis.get_message_dtype()))
+    for chatfile in args.chatfiles:
+        df = chatalyzer.parse_chats(chatfile)
+        compact_df = analysis.compact_chats(df)
+        results = {}
+        for name, chats in [('default', df), ('compact', compact_df)]:
+            seconds, results[name] = time_best(lambda: analysis.get_analysis(chats), args.repeat)
+            print('{}\t{}\t{:,.1f} MiB\tanalysis {:.3f}s'.format(
+                chatfile, name, analysis.get_memory_usage(chats) / 1024 ** 2, seconds))
+        saved = 1 - analysis.get_memory_usage(compact_df) / analysis.get_memory_usage(df)
+        print('{}\tmemory saved {:.0%}'.format(chatfile, saved))
+        if results['default'] != results['compact']:
+            print('{}\tWARNING: analyses disagree'.format(chatfile))
+
+
+if __name__ == '__main__':
+    main()
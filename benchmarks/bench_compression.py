@@ -0,0 +1,117 @@
+"""
+Compares the disk usage and the read and parse throughput of compressed chats against plain text
+
+For every chat and zlib level, prints the compression throughput, the size on disk, the time to read the
+whole text, to read and parse it at once (parsing.get_chats) and batch by batch (parsing.iter_chat_batches),
+and the mean time to read a line at a random offset, which is what sharding and incremental analyses do.
+
+Usage:
+    python benchmarks/bench_compression.py [<chat.txt> ...] [--messages 100000,1000000] [--levels 1,3,6,9]
+        [--repeat N]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import warnings
+from chatalyzer import compression, parsing
+from synthetic_chat import write_chat
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def read_all(chatfile):
+    with compression.open_chat(chatfile) as in_file:
+        return in_file.read()
+
+
+def parse_batches(chatfile):
+    for _ in parsing.iter_chat_batches(chatfile):
+        pass
+
+
+def random_reads(chatfile, n_reads=200, seed=0):
+    """
+    Returns the mean time to read the line at a random offset of a freshly opened chat
+    """
+    size = compression.get_chat_size(chatfile)
+    offsets = random.Random(seed).sample(range(max(size, 1)), min(n_reads, max(size, 1)))
+    start = time.perf_counter()
+    for offset in offsets:
+        with compression.open_chat(chatfile) as in_file:
+            in_file.seek(offset)
+            in_file.readline()
+    return (time.perf_counter() - start) / len(offsets)
+
+
+def bench_file(chatfile, repeat):
+    """
+    Returns the measurements of a plain or compressed chat file
+    """
+    size = compression.get_chat_size(chatfile) / 1024 ** 2
+    read = time_best(lambda: read_all(chatfile), repeat)
+    parse = time_best(lambda: parsing.get_chats(chatfile), repeat)
+    batches = time_best(lambda: parse_batches(chatfile), repeat)
+    return {
+        'disk_mib': os.path.getsize(chatfile) / 1024 ** 2,
+        'read_mib_s': size / read,
+        'parse_mib_s': size / parse,
+        'batches_mib_s': size / batches,
+        'random_read_ms': random_reads(chatfile) * 1000,
+    }
+
+
+def print_row(name, result, compress_mib_s=None):
+    print('  {:<10}{:>10.1f} MiB{:>12}{:>12.1f}{:>12.1f}{:>12.1f}{:>14.3f}'.format(
+        name, result['disk_mib'], '' if compress_mib_s is None else '{:.1f}'.format(compress_mib_s),
+        result['read_mib_s'], result['parse_mib_s'], result['batches_mib_s'], result['random_read_ms']))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='*', help="plain chat files, synthetic chats are used if omitted")
+    arg_parser.add_argument('--messages', default='100000,1000000',
+                            help="comma separated message counts of the synthetic chats")
+    arg_parser.add_argument('--levels', default='1,3,6,9', help="comma separated zlib levels")
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    work_dir = tempfile.mkdtemp(prefix='chatalyzer-bench-')
+    try:
+        chatfiles = args.chatfiles
+        if not chatfiles:
+            chatfiles = []
+            for n_messages in [int(n) for n in args.messages.split(',')]:
+                chatfile = os.path.join(work_dir, 'chat-{}.txt'.format(n_messages))
+                write_chat(chatfile, n_messages)
+                chatfiles.append(chatfile)
+
+        for chatfile in chatfiles:
+            print('{} ({:,.1f} MiB)'.format(chatfile, os.path.getsize(chatfile) / 1024 ** 2))
+            print('  {:<10}{:>14}{:>12}{:>12}{:>12}{:>12}{:>14}'.format(
+                'format', 'disk', 'compress', 'read', 'parse', 'batches', 'random read'))
+            print('  {:<10}{:>14}{:>12}{:>12}{:>12}{:>12}{:>14}'.format(
+                '', '', 'MiB/s', 'MiB/s', 'MiB/s', 'MiB/s', 'ms'))
+            print_row('plain', bench_file(chatfile, args.repeat))
+            size = os.path.getsize(chatfile) / 1024 ** 2
+            for level in [int(level) for level in args.levels.split(',')]:
+                target = os.path.join(work_dir, 'chat-{}{}'.format(level, compression.COMPRESSED_SUFFIX))
+                seconds = time_best(lambda: compression.compress_chat(chatfile, target, level), 1)
+                print_row('zlib-{}'.format(level), bench_file(target, args.repeat), size / seconds)
+                os.remove(target)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the parsing throughput of every chat dialect on synthetic exports
+
+For every platform, clock and date order, writes a synthetic chat and prints the dialect detected, the time
+taken to detect it, and the throughput of the single pass parser (parsing.parse_chat_text), of the batch parser
+(parsing.iter_chat_batches) and of the line by line reference (chatalyzer.get_chats_per_line).
+
+Usage:
+    python benchmarks/bench_dialects.py [--messages N] [--repeat N]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from chatalyzer import chatalyzer, dialects, parsing
+from synthetic_chat import write_chat
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def parse_batches(chatfile):
+    return sum(batch.shape[0] for batch in parsing.iter_chat_batches(chatfile))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=200000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='chatalyzer-bench-')
+    try:
+        print('{:<22}{:<14}{:>10}{:>12}{:>14}{:>12}{:>12}'.format(
+            'chat', 'dialect', 'detect', 'parse', 'parse', 'batches', 'per line'))
+        print('{:<22}{:<14}{:>10}{:>12}{:>14}{:>12}{:>12}'.format(
+            '', '', 'ms', 'MiB/s', 'messages/s', 'MiB/s', 'MiB/s'))
+        for platform in ('ios', 'android'):
+            for clock in ('24h', '12h'):
+                for date_order in ('dmy', 'mdy'):
+                    name = '{}-{}-{}'.format(platform, clock, date_order)
+                    chatfile = os.path.join(work_dir, name + '.txt')
+                    size = write_chat(chatfile, args.messages, clock=clock, date_order=date_order,
+                                      platform=platform) / 1024 ** 2
+                    text = parsing.read_chat_text(chatfile)
+
+                    detect, dialect = time_best(lambda: dialects.detect_dialect(text), args.repeat)
+                    parse, df = time_best(lambda: parsing.parse_chat_text(text, dialect), args.repeat)
+                    batches, _ = time_best(lambda: parse_batches(chatfile), args.repeat)
+                    per_line, reference = time_best(lambda: chatalyzer.get_chats_per_line(chatfile), 1)
+                    print('{:<22}{:<14}{:>10.2f}{:>12.1f}{:>14,.0f}{:>12.1f}{:>12.1f}{}'.format(
+                        name, dialect.name if dialect else '-', detect * 1000, size / parse, df.shape[0] / parse,
+                        size / batches, size / per_line, '' if df.equals(reference) else '  WARNING: parsers disagree'))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
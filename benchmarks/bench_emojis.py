@@ -0,0 +1,65 @@
+"""
+Checks the emoji scanner on multi-codepoint emojis and compares its throughput with a per character scan
+
+Usage:
+    python benchmarks/bench_emojis.py [<chat.txt> ...] [--repeat N]
+"""
+import argparse
+import time
+from chatalyzer import emoji_scanner, parsing
+
+# (text, emojis expected in order)
+CORRECTNESS_CASES = [
+    ('plain text, no emoji', []),
+    ('thumbs up 👍', ['👍']),
+    ('skin tone 👍🏽', ['👍🏽']),
+    ('family 👨‍👩‍👧 zwj', ['👨‍👩‍👧']),
+    ('flags 🇮🇳🇬🇧', ['🇮🇳', '🇬🇧']),
+    ('keycap #️⃣ and digits 123', ['#️⃣']),
+    ('variation selector ❤️❤️', ['❤️', '❤️']),
+    ('adjacent 😀😂👍🏽', ['😀', '😂', '👍🏽']),
+]
+
+
+def scan_per_character(messages, emojis):
+    found = []
+    for message in messages:
+        found.extend(c for c in message if c in emojis)
+    return found
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='*')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    scanner = emoji_scanner.get_scanner()
+    emojis = emoji_scanner.get_emoji_set()
+    for text, expected in CORRECTNESS_CASES:
+        scanned = scanner.findall(text)
+        per_character = scan_per_character([text], emojis)
+        print('{}\t{}\tscanner={} per_character={}'.format(
+            'ok' if scanned == expected else 'FAIL', text, scanned, per_character))
+
+    for chatfile in args.chatfiles:
+        messages = parsing.get_chats(chatfile)['Message']
+        seconds, (found, _) = time_best(lambda: scanner.scan(messages), args.repeat)
+        print('{}\tscanner\t{:.3f}s\t{:,.0f} messages/s\t{} emojis'.format(
+            chatfile, seconds, len(messages) / seconds, len(found)))
+        seconds, found = time_best(lambda: scan_per_character(messages, emojis), args.repeat)
+        print('{}\tper_character\t{:.3f}s\t{:,.0f} messages/s\t{} emojis'.format(
+            chatfile, seconds, len(messages) / seconds, len(found)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures the extraction of the system events of a chat and the group timeline built from them
+
+For every platform, writes a synthetic chat with a participant joining, leaving, being added or removed before
+a fraction of the messages, then prints the number of membership events, the time taken by analysis.get_events
+and by analysis.get_group_timeline, and that of a loop over the events computing the same intervals.
+
+Usage:
+    python benchmarks/bench_group_timeline.py [--messages N] [--membership-ratio R] [--repeat N]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+from chatalyzer import analysis, chatalyzer, events
+from synthetic_chat import write_chat
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def get_intervals_per_event(chat_events):
+    """
+    Returns the membership intervals of the participants of chat_events, walking the events one by one
+    """
+    is_member, joined, intervals = {}, {}, []
+    for row in chat_events.itertuples(index=False):
+        event, participant, date_time = row[1], row[3], row[0]
+        if event not in events.MEMBERSHIP:
+            continue
+        member = events.MEMBERSHIP[event]
+        if participant not in is_member:  # a member before the chat starts if they leave first
+            is_member[participant] = not member
+            if not member:
+                joined[participant] = pd.NaT
+        if member == is_member[participant]:
+            continue
+        is_member[participant] = member
+        if member:
+            joined[participant] = date_time
+        else:
+            intervals.append((participant, joined.pop(participant), date_time))
+    intervals.extend((participant, date_time, pd.NaT) for participant, date_time in joined.items())
+    return intervals
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=500000)
+    arg_parser.add_argument('--membership-ratio', type=float, default=0.02)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='chatalyzer-bench-')
+    try:
+        for platform in ('ios', 'android'):
+            chatfile = os.path.join(work_dir, platform + '.txt')
+            write_chat(chatfile, args.messages, n_authors=40, membership_ratio=args.membership_ratio,
+                       platform=platform)
+            df = chatalyzer.parse_chats(chatfile)
+
+            extract, chat_events = time_best(lambda: analysis.get_events(df), args.repeat)
+            timeline, (intervals, membership) = time_best(lambda: analysis.get_group_timeline(df, chat_events),
+                                                          args.repeat)
+            per_event, expected = time_best(lambda: get_intervals_per_event(chat_events), 1)
+            changes = chat_events[events.KEY_EVENT].isin(events.MEMBERSHIP).sum()
+            print('{}\t{:,} messages\t{:,} membership events\t{:,} intervals\tmembers {}..{}'.format(
+                platform, df.shape[0], changes, intervals.shape[0], membership[analysis.KEY_MEMBER_COUNT].min(),
+                membership[analysis.KEY_MEMBER_COUNT].max()))
+            found = intervals[intervals[events.KEY_PARTICIPANT].isin(chat_events[events.KEY_PARTICIPANT])]
+            agree = sorted(map(str, found.itertuples(index=False, name=None))) == sorted(map(str, expected))
+            print('{}\tevents {:.3f}s\ttimeline {:.3f}s\tper event loop {:.3f}s{}'.format(
+                platform, extract, timeline, per_event, '' if agree else '\tWARNING: intervals disagree'))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures the time taken to import the web app with python -X importtime, and fails when it goes over a budget
+
+Every run imports the module in a fresh interpreter. The best cumulative import time is compared to
+--budget-ms, and the modules the import must leave to the first analysis (the pandas based analysis stack,
+loaded lazily, see chatalyzer.lazy) must not have been imported. The slowest imports are listed to find
+what to defer when the budget is exceeded. Exits with status 1 when a check fails, so that it can guard
+against regressions in CI.
+
+Usage:
+    python benchmarks/bench_importtime.py [--module chatalyzer.chatalyzer] [--budget-ms MS] [--repeat N]
+        [--top N]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+# Modules importing the web app must not load
+DEFERRED_MODULES = ['pandas', 'numpy', 'tqdm', 'emoji', 'chatalyzer.analysis']
+
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(module):
+    """
+    Returns the imports of module in a fresh interpreter
+
+    Arguments:
+        module (str) - Name of the module imported
+
+    Returns:
+        list - (name, depth, self microseconds, cumulative microseconds) of every module imported
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            imports.append((match.group(4), len(match.group(3)) // 2, int(match.group(1)), int(match.group(2))))
+    return imports
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--module', default='chatalyzer.chatalyzer')
+    arg_parser.add_argument('--budget-ms', type=float, default=300.0)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--top', type=int, default=10, help="number of slowest imports listed")
+    args = arg_parser.parse_args()
+
+    best, best_imports = float('inf'), None
+    for _ in range(args.repeat):
+        imports = import_times(args.module)
+        cumulative = next(total for name, depth, _, total in imports if name == args.module and depth == 0)
+        if cumulative < best:
+            best, best_imports = cumulative, imports
+
+    print('slowest imports of {} (cumulative ms):'.format(args.module))
+    children = [(name, total) for name, depth, _, total in best_imports if depth == 1]
+    for name, total in sorted(children, key=lambda child: -child[1])[:args.top]:
+        print('  {:<40}{:>10.1f}'.format(name, total / 1000))
+
+    imported = {name for name, _, _, _ in best_imports}
+    deferred = [name for name in DEFERRED_MODULES if name in imported]
+    print('import time {:.1f} ms, budget {:.1f} ms'.format(best / 1000, args.budget_ms))
+    if deferred:
+        print('FAILED: imported eagerly: {}'.format(', '.join(deferred)))
+    if best / 1000 > args.budget_ms:
+        print('FAILED: over budget')
+    sys.exit(1 if deferred or best / 1000 > args.budget_ms else 0)
+
+
+if __name__ == '__main__':
+    main()
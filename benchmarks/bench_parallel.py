@@ -0,0 +1,36 @@
+"""
+Measures how sharded parsing and aggregation scales with the number of worker processes
+
+Usage:
+    python benchmarks/bench_parallel.py <chat.txt> [--max-workers N] [--repeat N]
+"""
+import argparse
+import os
+import time
+from chatalyzer import parallel
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfile')
+    arg_parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    baseline = None
+    reference = None
+    for workers in range(1, args.max_workers + 1):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            payload = parallel.aggregate_chat_file(args.chatfile, workers).get_analysis()
+            best = min(best, time.perf_counter() - start)
+        if baseline is None:
+            baseline, reference = best, payload
+        print('{} workers\t{:.3f}s\tspeedup {:.2f}x\tefficiency {:.0%}{}'.format(
+            workers, best, baseline / best, baseline / best / workers,
+            '' if payload == reference else '\tWARNING: results differ from 1 worker'))
+
+
+if __name__ == '__main__':
+    main()
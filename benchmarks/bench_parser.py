@@ -0,0 +1,48 @@
+"""
+Compares the throughput of the single pass chat parser against the line by line one
+
+Usage:
+    python benchmarks/bench_parser.py <chat.txt> [<chat.txt> ...] [--repeat N]
+"""
+import argparse
+import time
+from chatalyzer import chatalyzer, parsing
+
+
+def count_lines(chatfile):
+    with open(chatfile, "r", encoding="utf-8") as in_file:
+        return sum(1 for _ in in_file)
+
+
+def time_parser(parser, chatfile, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = parser(chatfile)
+        best = min(best, time.perf_counter() - start)
+    return best, df
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    parsers = [
+        ('per_line', chatalyzer.get_chats_per_line),
+        ('single_pass', parsing.get_chats),
+    ]
+    for chatfile in args.chatfiles:
+        n_lines = count_lines(chatfile)
+        results = {}
+        for name, parser in parsers:
+            seconds, df = time_parser(parser, chatfile, args.repeat)
+            results[name] = df
+            print('{}\t{}\t{:.3f}s\t{:,.0f} lines/s'.format(chatfile, name, seconds, n_lines / seconds))
+        if not results['per_line'].equals(results['single_pass']):
+            print('{}\tWARNING: parsers disagree'.format(chatfile))
+
+
+if __name__ == '__main__':
+    main()
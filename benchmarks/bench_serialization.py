@@ -0,0 +1,124 @@
+"""
+Compares the encodings of the analysis metrics served by the API, in bytes and encode time
+
+Every metric of a chat is computed once from its activity cube (or DataFrame for the word and emoji ones), then
+encoded the way the payload used to be (df.values.tolist() and json.dumps with analysis.DateTimeEncoder called
+for every date) and as rows with the dates converted by column (serialization.get_frame_rows).
+The bodies of the API are then timed the way the server builds them (chatalyzer.build_metric_body, the result
+cache of the bodies left out) for the whole chat and for its last 30 days, in the rows format, in the columnar
+format and in the binary formats whose package is installed, along with the columnar body converted from the
+rows of the cached payload ('rows->columnar'), as it used to be.
+Prints the best encode time and the size, plain and gzipped, of every encoding.
+
+Usage:
+    python benchmarks/bench_serialization.py <chat.txt> [<chat.txt> ...] [--repeat N]
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from chatalyzer import analysis, chatalyzer, serialization
+
+ANALYSIS_ID = 'benchmark'
+
+
+def time_best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def get_metric_frames(df, cube):
+    """
+    Returns the DataFrames of every metric made of rows, the authorwise ones as [author, DataFrame] lists
+    """
+    return {metric: analysis.get_metric_frames(df, metric, cube) for metric in analysis.METRIC_LAYOUTS}
+
+
+def get_rows(frames, to_rows):
+    if isinstance(frames, list):
+        return [[author, to_rows(frame)] for author, frame in frames]
+    return to_rows(frames)
+
+
+def encode_current(frames):
+    return json.dumps(get_rows(frames, lambda frame: frame.values.tolist()), cls=analysis.DateTimeEncoder)
+
+
+def encode_rows(frames):
+    return analysis.frames_to_json(frames)
+
+
+def encode_rows_to_columnar(payload, metric):
+    columnar = serialization.to_columnar(json.loads(payload[metric]), *analysis.METRIC_LAYOUTS[metric])
+    return serialization.to_compact_json(columnar)
+
+
+def print_row(metric, name, seconds, encoded, warning=''):
+    data = encoded.encode('utf-8') if isinstance(encoded, str) else encoded
+    print('{:<34}{:<16}{:>12.2f}{:>12,}{:>12,}{}'.format(
+        metric, name, seconds * 1000, len(data), len(gzip.compress(data, compresslevel=6)), warning))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('chatfiles', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    binary_formats = [data_format for data_format in serialization.FORMAT_MODULES
+                      if serialization.can_encode(data_format)]
+    print('binary formats installed: {}'.format(', '.join(binary_formats) or 'none'))
+    for chatfile in args.chatfiles:
+        work_dir = tempfile.mkdtemp(prefix='chatalyzer-bench-')
+        try:
+            upload_folder = os.path.join(work_dir, 'uploads')
+            os.makedirs(upload_folder)
+            shutil.copyfile(chatfile, os.path.join(upload_folder, ANALYSIS_ID + '.txt'))
+            app = chatalyzer.create_app({'ANALYSIS_JOBS': False, 'UPLOAD_FOLDER': upload_folder,
+                                         'RESULT_CACHE_FOLDER': os.path.join(work_dir, 'results')})
+            with app.app_context():
+                bench_chat(chatfile, binary_formats, args.repeat)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_chat(chatfile, binary_formats, repeat):
+    df = chatalyzer.load_chats(ANALYSIS_ID)
+    cube = analysis.get_activity_cube(df)
+    payload = chatalyzer.get_analysis(ANALYSIS_ID)  # caches the payload and the cube, as after an upload
+    content_hash = chatalyzer.get_content_hash(ANALYSIS_ID)
+    print('{}\t{:,} messages\t{} authors x {} days'.format(chatfile, df.shape[0], len(cube.authors), cube.n_days))
+    print('{:<34}{:<16}{:>12}{:>12}{:>12}'.format('metric', 'encoding', 'encode ms', 'bytes', 'gzip bytes'))
+
+    last_day = cube.get_days()[-1].astype(datetime.date) if cube.n_days else None
+    data_formats = [serialization.FORMAT_ROWS, serialization.FORMAT_COLUMNAR] + binary_formats
+    for metric, frames in get_metric_frames(df, cube).items():
+        seconds, expected = time_best(lambda: encode_current(frames), repeat)
+        print_row(metric, 'current', seconds, expected)
+        seconds, encoded = time_best(lambda: encode_rows(frames), repeat)
+        print_row(metric, 'rows', seconds, encoded, '\tWARNING: rows differ' if encoded != expected else '')
+        seconds, encoded = time_best(lambda: encode_rows_to_columnar(payload, metric), repeat)
+        print_row(metric, 'rows->columnar', seconds, encoded)
+
+        ranges = [('', None)]
+        if metric in analysis.ACTIVITY_METRICS and last_day is not None:
+            ranges.append((' 30d', last_day - datetime.timedelta(days=29)))
+        for suffix, start in ranges:
+            for data_format in data_formats:
+                if data_format == serialization.FORMAT_ARROW and metric in analysis.NESTED_METRICS:
+                    continue
+                seconds, encoded = time_best(lambda: chatalyzer.build_metric_body(
+                    ANALYSIS_ID, content_hash, metric, 'day', start, None, data_format), repeat)
+                print_row(metric, 'body ' + data_format + suffix, seconds, encoded)
+
+
+if __name__ == '__main__':
+    main()
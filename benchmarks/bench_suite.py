@@ -0,0 +1,249 @@
+"""
+Times every parsing and analysis stage, and the end to end render of show_analysis, on synthetic chats
+of several sizes and date/time styles, and saves the results as JSON for regression comparison
+
+Each stage is timed on its own (best of --repeat runs) and then run once more under tracemalloc to get
+the peak memory it allocates. The DataFrame stages are fed the output of the previous stage, so they
+measure exactly what parse_chats and get_analysis do.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 10000,100000,1000000,10000000] [--styles 24h-dmy,12h-mdy]
+        [--repeat N] [--no-memory] [--data-dir DIR] [--out results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+from chatalyzer import aggregates, analysis, parsing, store
+from chatalyzer import chatalyzer as chatalyzer_app
+from synthetic_chat import write_chat
+
+STYLES = ['24h-dmy', '24h-mdy', '12h-dmy', '12h-mdy']
+ANALYSIS_ID = 'benchmark'
+
+
+def measure(func, repeat, memory):
+    """
+    Returns the best time of func over repeat runs, the peak memory it allocates and its last result
+
+    Arguments:
+        func (callable) - Function without arguments
+        repeat (int) - Number of timed runs
+        memory (bool) - If True, runs func once more under tracemalloc
+
+    Returns:
+        (dict ('seconds', 'peak_bytes'), object)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    peak_bytes = None
+    if memory:
+        del result
+        tracemalloc.start()
+        result = func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak_bytes}, result
+
+
+def get_stages(chatfile):
+    """
+    Returns the (name, parent, function) stages benchmarked, each function taking the result of its parent
+    stage (None for the stages working on the chat file)
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+
+    Returns:
+        list
+    """
+    return [
+        ('parse', None, lambda _: parsing.get_chats(chatfile)),
+        ('add_date_time', 'parse', analysis.add_date_time),
+        ('add_letter_count', 'add_date_time', analysis.add_letter_count),
+        ('add_word_count', 'add_letter_count', analysis.add_word_count),
+        ('top_message_senders', 'add_word_count', lambda df: analysis.get_top_message_senders(df, -1)),
+        ('top_media_senders', 'add_word_count', lambda df: analysis.get_top_media_senders(df, -1)),
+        ('top_word_count', 'add_word_count', lambda df: analysis.get_top_x_count(df, analysis.KEY_WORD_COUNT, -1)),
+        ('top_letter_count', 'add_word_count',
+         lambda df: analysis.get_top_x_count(df, analysis.KEY_LETTER_COUNT, -1)),
+        ('daywise_message_count', 'add_word_count', lambda df: analysis.get_busy_x(df, analysis.KEY_DATE, -1)),
+        ('most_used_words', 'add_word_count', lambda df: analysis.get_most_used_words(df, 40)),
+        ('most_used_emojis', 'add_word_count', analysis.get_most_used_emojis),
+        ('authorwise_daywise_message_count', 'add_word_count',
+         lambda df: analysis.get_busy_x_authorwise(df, analysis.KEY_DATE, -1, return_json=True)),
+        ('authorwise_busiest_time', 'add_word_count',
+         lambda df: analysis.get_busy_x_authorwise(df, analysis.KEY_HOUR, -1, return_json=True)),
+        ('get_analysis', 'add_word_count', analysis.get_analysis),
+        ('streaming_analysis', None, lambda _: aggregates.aggregate_chat_file(chatfile).get_analysis()),
+    ]
+
+
+def setup_app(work_dir, chatfile):
+    """
+    Points the Flask app at a scratch upload folder and result cache holding only the benchmarked chat
+
+    Arguments:
+        work_dir (str) - Scratch folder
+        chatfile (str) - Path of the chat file
+
+    Returns:
+        flask.testing.FlaskClient
+    """
+    upload_folder = os.path.join(work_dir, 'uploads')
+    os.makedirs(upload_folder, exist_ok=True)
+    shutil.copyfile(chatfile, os.path.join(upload_folder, ANALYSIS_ID + '.txt'))
+
+    app = chatalyzer_app.create_app({'TESTING': True, 'ANALYSIS_JOBS': False, 'UPLOAD_FOLDER': upload_folder,
+                                     'RESULT_CACHE_FOLDER': os.path.join(work_dir, 'results')})
+    return app.test_client()
+
+
+def render_cold(client):
+    """
+    Renders the analysis page from the raw chat file, without chat store nor cached result
+    """
+    app = client.application
+    app.extensions['result_cache'].clear()
+    shutil.rmtree(app.config['RESULT_CACHE_FOLDER'], ignore_errors=True)
+    store.invalidate_chats(store.get_store_path(app.config['UPLOAD_FOLDER'], ANALYSIS_ID))
+    return render_warm(client)
+
+
+def render_warm(client):
+    """
+    Renders the analysis page of an already analyzed chat
+    """
+    response = client.get('/analysis/' + ANALYSIS_ID)
+    assert response.status_code == 200, response.status
+    return len(response.data)
+
+
+def bench_chat(chatfile, repeat, memory, work_dir):
+    """
+    Returns the measurements of every stage on a chat file
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        repeat (int) - Number of timed runs per stage
+        memory (bool) - If True, measures the peak memory of every stage
+        work_dir (str) - Scratch folder for the Flask app
+
+    Returns:
+        dict - Key: stage, Value: dict ('seconds', 'peak_bytes')
+    """
+    results, outputs = {}, {}
+    for name, parent, func in get_stages(chatfile):
+        argument = outputs[parent] if parent is not None else None
+        results[name], outputs[name] = measure(lambda: func(argument), repeat, memory)
+        print('  {:<34}{:>10.3f}s{}'.format(name, results[name]['seconds'], format_peak(results[name])))
+    outputs.clear()
+
+    client = setup_app(work_dir, chatfile)
+    for name, func in [('show_analysis_cold', render_cold), ('show_analysis_warm', render_warm)]:
+        results[name], _ = measure(lambda: func(client), repeat, memory)
+        print('  {:<34}{:>10.3f}s{}'.format(name, results[name]['seconds'], format_peak(results[name])))
+    return results
+
+
+def format_peak(result):
+    if result['peak_bytes'] is None:
+        return ''
+    return '{:>10.1f} MiB peak'.format(result['peak_bytes'] / 1024 ** 2)
+
+
+def get_environment():
+    return {
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(runs, previous_path):
+    """
+    Prints the time and peak memory ratios of every stage against a previous results file
+    """
+    with open(previous_path, 'r', encoding='utf-8') as in_file:
+        previous = {(run['messages'], run['style']): run['stages'] for run in json.load(in_file)['runs']}
+
+    print('\ncompared to {}'.format(previous_path))
+    for run in runs:
+        old_stages = previous.get((run['messages'], run['style']))
+        if old_stages is None:
+            continue
+        print('{:,} messages {}'.format(run['messages'], run['style']))
+        for name, result in run['stages'].items():
+            old = old_stages.get(name)
+            if old is None:
+                continue
+            line = '  {:<34}{:>8.2f}x time'.format(name, result['seconds'] / old['seconds'])
+            if result['peak_bytes'] and old['peak_bytes']:
+                line += '{:>8.2f}x memory'.format(result['peak_bytes'] / old['peak_bytes'])
+            print(line)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', default='10000,100000',
+                            help="comma separated message counts, e.g. 10000,100000,1000000,10000000")
+    arg_parser.add_argument('--styles', default=','.join(STYLES),
+                            help="comma separated <clock>-<date order> styles among " + ', '.join(STYLES))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc runs")
+    arg_parser.add_argument('--data-dir', help="folder where generated chats are kept and reused")
+    arg_parser.add_argument('--out', default='bench_results.json')
+    arg_parser.add_argument('--compare', help="results file of a previous run to compare with")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    styles = args.styles.split(',')
+    for style in styles:
+        if style not in STYLES:
+            arg_parser.error('unknown style {}'.format(style))
+
+    work_dir = tempfile.mkdtemp(prefix='chatalyzer-bench-')
+    data_dir = args.data_dir or work_dir
+    os.makedirs(data_dir, exist_ok=True)
+    runs = []
+    try:
+        for n_messages in sizes:
+            for style in styles:
+                clock, date_order = style.split('-')
+                chatfile = os.path.join(data_dir, 'chat-{}-{}-{}.txt'.format(n_messages, style, args.seed))
+                if not os.path.isfile(chatfile):
+                    write_chat(chatfile, n_messages, clock=clock, date_order=date_order, seed=args.seed)
+                print('{:,} messages {} ({:,} bytes)'.format(n_messages, style, os.path.getsize(chatfile)))
+                stages = bench_chat(chatfile, args.repeat, not args.no_memory,
+                                    os.path.join(work_dir, 'app-{}-{}'.format(n_messages, style)))
+                runs.append({'messages': n_messages, 'style': style, 'bytes': os.path.getsize(chatfile),
+                             'stages': stages})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as out_file:
+        json.dump({'environment': get_environment(), 'repeat': args.repeat, 'runs': runs}, out_file, indent=2)
+    print('results saved to {}'.format(args.out))
+
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the approximate counts of the most used words (topk.FrequentItems) with the exact Counter path
+
+Builds messages whose words follow a Zipf distribution over a large vocabulary, then for the exact counts and
+for every capacity prints the peak memory allocated while counting, the time taken, the error bound reported,
+the share of the true top words found and the largest relative error of their counts.
+
+Usage:
+    python benchmarks/bench_topk.py [--messages N] [--vocabulary N] [--top N] [--capacities N,N,...]
+        [--zipf S] [--seed N]
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from chatalyzer import analysis
+
+
+def get_messages(n_messages, vocabulary, zipf, seed):
+    """
+    Returns a DataFrame of messages of 1 to 15 words drawn from a Zipf distribution over vocabulary words
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 16, n_messages)
+    ranks = np.minimum(rng.zipf(zipf, lengths.sum()), vocabulary)
+    words = np.char.add('word', ranks.astype(str))
+    messages = [' '.join(message) for message in np.split(words, np.cumsum(lengths)[:-1])]
+    return pd.DataFrame({analysis.KEY_AUTHOR: 'Bruce', analysis.KEY_MESSAGE: messages})
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=300000)
+    arg_parser.add_argument('--vocabulary', type=int, default=1000000)
+    arg_parser.add_argument('--top', type=int, default=40)
+    arg_parser.add_argument('--capacities', default='100,400,1600,6400,25600')
+    arg_parser.add_argument('--zipf', type=float, default=1.2)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    df = get_messages(args.messages, args.vocabulary, args.zipf, args.seed)
+    exact, seconds, peak = measure(lambda: analysis.count_words(df))
+    true_top = exact.most_common(args.top)
+    print('{:,} messages, {:,} words, {:,} distinct'.format(df.shape[0], sum(exact.values()), len(exact)))
+    print('{:<10}{:>12}{:>10}{:>12}{:>10}{:>14}'.format(
+        'capacity', 'peak MiB', 'seconds', 'error bound', 'recall', 'max rel error'))
+    print('{:<10}{:>12.1f}{:>10.2f}{:>12}{:>10.0%}{:>14.2%}'.format('exact', peak / 1024 ** 2, seconds, 0, 1, 0))
+
+    for capacity in map(int, args.capacities.split(',')):
+        approximate, seconds, peak = measure(lambda: analysis.count_words(df, capacity=capacity))
+        found = dict(approximate.most_common(args.top))
+        recall = sum(1 for word, _ in true_top if word in found) / len(true_top)
+        held = dict(approximate.items())
+        max_error = max((count - held.get(word, 0)) / count for word, count in true_top)
+        print('{:<10}{:>12.1f}{:>10.2f}{:>12,}{:>10.0%}{:>14.2%}'.format(
+            capacity, peak / 1024 ** 2, seconds, approximate.error, recall, max_error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Writes a deterministic synthetic WhatsApp chat export, the same seed always giving the same file
+
+Usage:
+    python benchmarks/synthetic_chat.py <out.txt> [--messages N] [--authors N] [--multiline-ratio R]
+        [--media-ratio R] [--emoji-ratio R] [--membership-ratio R] [--clock 24h|12h] [--date-order dmy|mdy]
+        [--platform ios|android] [--seed N]
+"""
+import argparse
+import datetime
+import random
+
+FIRST_NAMES = ['Bruce', 'Tony', 'Natasha', 'Steve', 'Thor', 'Wanda', 'Peter', 'Carol', 'Scott', 'Hope',
+               'Sam', 'Bucky', 'Clint', 'Stephen', 'Shuri', 'Okoye']
+
+WORDS = ('the a to and of in is it you that for on was with he as have be at one this had by word but not '
+         'what all were we when your can said there use an each which she do how their if will up other '
+         'about out many then them these so some her would make like him into time has look two more write '
+         'go see number no way could people my than first water been call who oil its now find long down '
+         'day did get come made may part lol ok haha meeting tomorrow tonight dinner plan call later sure '
+         'thanks done coming home office traffic weekend movie match').split()
+
+EMOJIS = ['😀', '😂', '🤣', '😍', '😭', '🙏', '👍', '👍🏽', '❤️', '🔥', '🎉', '🇮🇳', '👨‍👩‍👧', '#️⃣', '🙈', '😅']
+
+# Chats cover at most this many days so that two digit years never wrap around
+MAX_SPAN_DAYS = 4 * 365
+MEAN_GAP_SECONDS = 300
+
+GROUP_NAME = 'Avengers'
+LRM = '\u200e'
+
+ANDROID_NOTICE = 'Messages and calls are end-to-end encrypted. No one outside of this chat can read or listen to them.'
+
+
+def get_authors(n_authors):
+    """
+    Returns n_authors distinct author names, a few of them phone numbers like unsaved contacts
+
+    Arguments:
+        n_authors (int) - Number of authors
+
+    Returns:
+        list
+    """
+    authors = []
+    for i in range(n_authors):
+        if i % 7 == 6:
+            authors.append('+91 98{:03d} {:05d}'.format(i, i * 7919 % 100000))
+        else:
+            name = FIRST_NAMES[i % len(FIRST_NAMES)]
+            authors.append(name if i < len(FIRST_NAMES) else '{} {}'.format(name, i // len(FIRST_NAMES)))
+    return authors
+
+
+def format_header(date_time, clock, date_order, platform='ios'):
+    """
+    Returns the header of a message as exported by WhatsApp, '[date, time]' on iOS and 'date, time -' on
+    Android, which leaves the seconds out and doesn't pad month first dates
+
+    Arguments:
+        date_time (datetime.datetime) - Time of the message
+        clock (str) - '24h' or '12h'
+        date_order (str) - 'dmy' or 'mdy'
+        platform (str, default 'ios') - 'ios' or 'android'
+
+    Returns:
+        str
+    """
+    if date_order == 'dmy':
+        date = date_time.strftime('%d/%m/%y')
+    elif platform == 'android':
+        date = '{}/{}/{}'.format(date_time.month, date_time.day, date_time.strftime('%y'))
+    else:
+        date = date_time.strftime('%m/%d/%y')
+    seconds = ':%S' if platform == 'ios' else ''
+    if clock == '24h':
+        time = date_time.strftime('%H:%M' + seconds)
+    else:
+        time = '{}:{}'.format(date_time.hour % 12 or 12, date_time.strftime('%M' + seconds + ' %p'))
+    if platform == 'android':
+        return '{}, {} -'.format(date, time)
+    return '[{}, {}]'.format(date, time)
+
+
+def format_event(header, platform, actor, event, participant=None):
+    """
+    Returns the line of a system event, without an author on Android and sent by the group with a leading
+    left-to-right mark on iOS, e.g. 'Tony added Bruce'
+    """
+    text = '{} {}'.format(actor, event) if participant is None else '{} {} {}'.format(actor, event, participant)
+    if platform == 'android':
+        return '{} {}\n'.format(header, text)
+    return '{}{} {}: {}{}\n'.format(LRM, header, GROUP_NAME, LRM, text)
+
+
+def generate_lines(n_messages, n_authors=8, multiline_ratio=0.05, media_ratio=0.05, emoji_ratio=0.2,
+                   membership_ratio=0.0, clock='24h', date_order='dmy', platform='ios', seed=0):
+    """
+    Yields the lines of a synthetic chat export in chronological order
+
+    Arguments:
+        n_messages (int) - Number of messages
+        n_authors (int, default 8) - Number of authors, some far more talkative than others
+        multiline_ratio (float, default 0.05) - Fraction of the messages spanning several lines
+        media_ratio (float, default 0.05) - Fraction of the messages replaced by '<Media omitted>'
+        emoji_ratio (float, default 0.2) - Chance of a line getting an emoji, and of every emoji getting another
+        membership_ratio (float, default 0.0) - Chance of a message being preceded by a participant joining,
+            leaving, being added or removed
+        clock (str, default '24h') - '24h' or '12h'
+        date_order (str, default 'dmy') - 'dmy' or 'mdy'
+        platform (str, default 'ios') - 'ios' or 'android', whose exports start with a notice without author
+        seed (int, default 0) - Seed of the random generator
+
+    Returns:
+        generator of str
+    """
+    rng = random.Random(seed)
+    authors = get_authors(n_authors)
+    author_weights = [1.0 / (i + 1) for i in range(n_authors)]
+    mean_gap = min(MEAN_GAP_SECONDS, MAX_SPAN_DAYS * 86400 / max(n_messages, 1))
+    date_time = datetime.datetime(2018, 1, 1, 8, 0, 0)
+    members = set(authors)
+    if platform == 'android':
+        yield '{} {}\n'.format(format_header(date_time, clock, date_order, platform), ANDROID_NOTICE)
+
+    for _ in range(n_messages):
+        date_time += datetime.timedelta(seconds=int(rng.expovariate(1 / mean_gap)))
+        author = rng.choices(authors, author_weights)[0]
+        header = format_header(date_time, clock, date_order, platform)
+
+        if membership_ratio and rng.random() < membership_ratio:
+            participant = rng.choice(authors)
+            if participant not in members:
+                members.add(participant)
+                if rng.random() < 0.5:
+                    yield format_event(header, platform, participant, 'joined using this group\'s invite link')
+                else:
+                    yield format_event(header, platform, author, 'added', participant)
+            elif participant != author and rng.random() < 0.5:
+                members.discard(participant)
+                yield format_event(header, platform, author, 'removed', participant)
+            else:
+                members.discard(participant)
+                yield format_event(header, platform, participant, 'left')
+
+        if rng.random() < media_ratio:
+            yield '{} {}: <Media omitted>\n'.format(header, author)
+            continue
+
+        n_lines = rng.randint(2, 4) if rng.random() < multiline_ratio else 1
+        lines = []
+        for _ in range(n_lines):
+            words = rng.choices(WORDS, k=rng.randint(1, 14))
+            while rng.random() < emoji_ratio:
+                words.insert(rng.randint(0, len(words)), rng.choice(EMOJIS))
+            lines.append(' '.join(words))
+        lines[0] = '{} {}: {}'.format(header, author, lines[0])
+        yield '\n'.join(lines) + '\n'
+
+
+def write_chat(path, n_messages, **kwargs):
+    """
+    Writes a synthetic chat export, see generate_lines for the keyword arguments
+
+    Arguments:
+        path (str) - Path of the chat file written
+        n_messages (int) - Number of messages
+
+    Returns:
+        int - Size of the file in bytes
+    """
+    with open(path, 'w', encoding='utf-8', newline='\n') as out_file:
+        buffer = []
+        for line in generate_lines(n_messages, **kwargs):
+            buffer.append(line)
+            if len(buffer) >= 10000:
+                out_file.write(''.join(buffer))
+                buffer = []
+        out_file.write(''.join(buffer))
+        return out_file.tell()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('out')
+    arg_parser.add_argument('--messages', type=int, default=100000)
+    arg_parser.add_argument('--authors', type=int, default=8)
+    arg_parser.add_argument('--multiline-ratio', type=float, default=0.05)
+    arg_parser.add_argument('--media-ratio', type=float, default=0.05)
+    arg_parser.add_argument('--emoji-ratio', type=float, default=0.2)
+    arg_parser.add_argument('--membership-ratio', type=float, default=0.0)
+    arg_parser.add_argument('--clock', choices=['24h', '12h'], default='24h')
+    arg_parser.add_argument('--date-order', choices=['dmy', 'mdy'], default='dmy')
+    arg_parser.add_argument('--platform', choices=['ios', 'android'], default='ios')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    size = write_chat(args.out, args.messages, n_authors=args.authors, multiline_ratio=args.multiline_ratio,
+                      media_ratio=args.media_ratio, emoji_ratio=args.emoji_ratio,
+                      membership_ratio=args.membership_ratio, clock=args.clock,
+                      date_order=args.date_order, platform=args.platform, seed=args.seed)
+    print('{}\t{:,} messages\t{:,} bytes'.format(args.out, args.messages, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+
+HOURS = 24
+
+# Arrays of a cube, with their dtype, as written by ActivityCube.to_bytes
+CUBE_ARRAYS = {'counts': 'int32', 'letters': 'int64', 'words': 'int64', 'media': 'int32', 'unauthored': 'int32'}
+
+
+def to_day(date):
+    """
+    Returns a date as a numpy.datetime64 day
+    """
+    return np.datetime64(date, 'D')
+
+
+class ActivityCube:
+    """
+    Message counts of a chat indexed by (author, day, hour), along with the letter, word and media message
+    counts of every (author, day)
+    Every busy-x metric is a reduction over its dense arrays, and so is any date range of the chat, see select().
+    Authors are kept in order of first appearance and days are consecutive from first_day. Messages without an
+    author but with a date (e.g. system messages) only count in unauthored, and messages without a date (the
+    lines before the first message header) only in undated.
+    """
+
+    def __init__(self, authors, first_day, counts, letters, words, media, unauthored, undated=0):
+        self.authors = list(authors)
+        self.first_day = first_day  # numpy.datetime64 day, None if the cube has no day
+        self.counts = counts  # int32 (author, day, hour)
+        self.letters = letters  # int64 (author, day)
+        self.words = words  # int64 (author, day)
+        self.media = media  # int32 (author, day)
+        self.unauthored = unauthored  # int32 (day,)
+        self.undated = undated
+
+    @classmethod
+    def empty(cls):
+        return cls([], None, np.zeros((0, 0, HOURS), 'int32'), np.zeros((0, 0), 'int64'),
+                   np.zeros((0, 0), 'int64'), np.zeros((0, 0), 'int32'), np.zeros(0, 'int32'))
+
+    @classmethod
+    def from_columns(cls, authors, date_time, letter_counts, word_counts, is_media):
+        """
+        Returns the cube of a chat from its columns
+
+        Arguments:
+            authors (Pandas.Series) - Author of every message, None if it has none
+            date_time (numpy.ndarray of datetime64[ns]) - Date and time of every message, NaT if it has none
+            letter_counts (numpy.ndarray) - Number of characters of every message
+            word_counts (numpy.ndarray) - Number of words of every message
+            is_media (numpy.ndarray of bool) - True for the media messages
+
+        Returns:
+            ActivityCube
+        """
+        codes, uniques = pd.factorize(authors)  # in order of first appearance, -1 for None
+        date_time = np.asarray(date_time, dtype='datetime64[ns]')
+        dated = ~np.isnat(date_time)
+        undated = int(np.count_nonzero(~dated))
+        if not dated.any():
+            cube = cls.empty()
+            cube.undated = undated
+            return cube
+
+        codes = codes[dated]
+        date_time = date_time[dated]
+        days = date_time.astype('datetime64[D]')
+        first_day = days.min()
+        day_index = (days - first_day).astype('int64')
+        hours = ((date_time - days) // np.timedelta64(1, 'h')).astype('int64')
+        n_authors, n_days = len(uniques), int(day_index.max()) + 1
+
+        authored = codes >= 0
+        cells = codes[authored] * n_days + day_index[authored]
+        counts = np.bincount(cells * HOURS + hours[authored], minlength=n_authors * n_days * HOURS)
+
+        def sum_by_cell(values):
+            values = np.asarray(values)[dated][authored]
+            return np.rint(np.bincount(cells, weights=values, minlength=n_authors * n_days)).astype('int64')
+
+        return cls(list(uniques), first_day,
+                   counts.astype('int32').reshape(n_authors, n_days, HOURS),
+                   sum_by_cell(letter_counts).reshape(n_authors, n_days),
+                   sum_by_cell(word_counts).reshape(n_authors, n_days),
+                   sum_by_cell(is_media).astype('int32').reshape(n_authors, n_days),
+                   np.bincount(day_index[~authored], minlength=n_days).astype('int32'),
+                   undated)
+
+    @property
+    def n_days(self):
+        return self.counts.shape[1]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in CUBE_ARRAYS)
+
+    @property
+    def num_msgs(self):
+        return int(self.counts.sum(dtype='int64')) + int(self.unauthored.sum(dtype='int64')) + self.undated
+
+    def get_days(self):
+        """
+        Returns the day of every index of the day axis
+
+        Returns:
+            numpy.ndarray of datetime64[D]
+        """
+        if self.first_day is None:
+            return np.array([], dtype='datetime64[D]')
+        return self.first_day + np.arange(self.n_days)
+
+    def select(self, start=None, end=None):
+        """
+        Returns the cube of the messages sent from start to end, both included
+        The arrays of the returned cube are views on those of self. Messages without a date are left out of
+        any range.
+
+        Arguments:
+            start (datetime.date, default None) - First day, the first day of the chat if None
+            end (datetime.date, default None) - Last day, the last day of the chat if None
+
+        Returns:
+            ActivityCube
+        """
+        if start is None and end is None:
+            return self
+        first, last = get_day_range(self.first_day, self.n_days, start, end)
+        if last <= first:
+            return ActivityCube.empty()
+        return ActivityCube(self.authors, self.first_day + first, self.counts[:, first:last],
+                            self.letters[:, first:last], self.words[:, first:last], self.media[:, first:last],
+                            self.unauthored[first:last])
+
+    def merge(self, other):
+        """
+        Adds the cube of the part of the chat following the one in self, aligning the authors and days of both
+
+        Arguments:
+            other (ActivityCube) - Cube of the next part of the chat
+        """
+        self.undated += other.undated
+        if other.first_day is None:
+            return
+        known = set(self.authors)
+        authors = self.authors + [author for author in other.authors if author not in known]
+        if self.first_day is None:
+            first_day, n_days = other.first_day, other.n_days
+        else:
+            first_day = min(self.first_day, other.first_day)
+            last_day = max(self.first_day + self.n_days, other.first_day + other.n_days)
+            n_days = int((last_day - first_day).astype('int64'))
+
+        rows = {author: row for row, author in enumerate(authors)}
+        parts = [(cube, int((cube.first_day - first_day).astype('int64')), [rows[author] for author in cube.authors])
+                 for cube in (self, other) if cube.first_day is not None]
+
+        def align(name):
+            array = getattr(other, name)
+            aligned = np.zeros((len(authors), n_days) + array.shape[2:], dtype=array.dtype)
+            for cube, offset, cube_rows in parts:
+                aligned[cube_rows, offset:offset + cube.n_days] += getattr(cube, name)
+            return aligned
+
+        unauthored = np.zeros(n_days, dtype=other.unauthored.dtype)
+        for cube, offset, _ in parts:
+            unauthored[offset:offset + cube.n_days] += cube.unauthored
+        arrays = {name: align(name) for name in ('counts', 'letters', 'words', 'media')}
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.unauthored = unauthored
+        self.authors, self.first_day = authors, first_day
+
+    def get_author_totals(self, name='counts'):
+        """
+        Returns the totals of every author, in order of first appearance
+
+        Arguments:
+            name (str, default 'counts') - 'counts' (messages), 'letters', 'words' or 'media'
+
+        Returns:
+            numpy.ndarray of int64
+        """
+        array = getattr(self, name)
+        return array.sum(axis=tuple(range(1, array.ndim)), dtype='int64')
+
+    def get_day_counts(self):
+        """
+        Returns the number of messages of every (author, day)
+
+        Returns:
+            numpy.ndarray of int64
+        """
+        return self.counts.sum(axis=2, dtype='int64')
+
+    def get_hour_counts(self):
+        """
+        Returns the number of messages of every (author, hour)
+
+        Returns:
+            numpy.ndarray of int64
+        """
+        return self.counts.sum(axis=1, dtype='int64')
+
+    def to_dict(self):
+        """
+        Returns the cube as JSON serializable data, every array being kept as its non zero cells, see from_dict
+
+        Returns:
+            dict
+        """
+        def cells(array):
+            index = np.nonzero(array)
+            return np.column_stack(index + (array[index],)).tolist()
+
+        return {
+            'authors': self.authors,
+            'first_day': None if self.first_day is None else str(self.first_day),
+            'days': self.n_days,
+            'counts': cells(self.counts),
+            'letters': cells(self.letters),
+            'words': cells(self.words),
+            'media': cells(self.media),
+            'unauthored': cells(self.unauthored),
+            'undated': self.undated,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the cube saved with to_dict
+
+        Arguments:
+            data (dict) - Data returned by to_dict
+
+        Returns:
+            ActivityCube
+        """
+        shape = (len(data['authors']), data['days'])
+
+        def dense(cells, shape, dtype):
+            array = np.zeros(shape, dtype=dtype)
+            if cells:
+                cells = np.array(cells, dtype='int64')
+                array[tuple(cells[:, :-1].T)] = cells[:, -1]
+            return array
+
+        first_day = None if data['first_day'] is None else np.datetime64(data['first_day'], 'D')
+        return cls(data['authors'], first_day, dense(data['counts'], shape + (HOURS,), 'int32'),
+                   dense(data['letters'], shape, 'int64'), dense(data['words'], shape, 'int64'),
+                   dense(data['media'], shape, 'int32'), dense(data['unauthored'], shape[1:], 'int32'),
+                   data['undated'])
+
+    def to_bytes(self):
+        """
+        Returns the cube in a compact binary form, see from_bytes: the flat indexes and values of the non zero
+        cells of every array, in a compressed .npz archive. It is far smaller than to_dict for a long chat.
+
+        Returns:
+            bytes
+        """
+        meta = {'authors': self.authors, 'first_day': None if self.first_day is None else str(self.first_day),
+                'days': self.n_days, 'undated': self.undated}
+        arrays = {'meta': np.frombuffer(json.dumps(meta).encode('utf-8'), dtype='uint8')}
+        for name in CUBE_ARRAYS:
+            flat = getattr(self, name).ravel()
+            index = np.flatnonzero(flat)
+            arrays[name + '_index'] = index.astype('uint32' if flat.size <= np.iinfo('uint32').max else 'int64')
+            arrays[name + '_value'] = flat[index]
+        out_file = io.BytesIO()
+        np.savez_compressed(out_file, **arrays)
+        return out_file.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, start=None, end=None):
+        """
+        Returns the cube saved with to_bytes, or only its days from start to end, both included, as select() does,
+        without making the arrays of the other days dense
+
+        Arguments:
+            data (bytes) - Data returned by to_bytes
+            start (datetime.date, default None) - First day, the first day of the chat if None
+            end (datetime.date, default None) - Last day, the last day of the chat if None
+
+        Returns:
+            ActivityCube
+        """
+        with np.load(io.BytesIO(data)) as arrays:
+            meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+            first_day = None if meta['first_day'] is None else np.datetime64(meta['first_day'], 'D')
+            n_authors, n_days = len(meta['authors']), meta['days']
+            first, last = 0, n_days
+            if start is not None or end is not None:
+                first, last = get_day_range(first_day, n_days, start, end)
+                if last <= first:
+                    return cls.empty()
+
+            def dense(name):
+                shape = get_array_shape(name, n_authors, n_days)
+                day_axis = 0 if name == 'unauthored' else 1
+                index = np.unravel_index(arrays[name + '_index'].astype('int64'), shape)
+                kept = (index[day_axis] >= first) & (index[day_axis] < last)
+                index = tuple(axis[kept] - (first if i == day_axis else 0) for i, axis in enumerate(index))
+                array = np.zeros(shape[:day_axis] + (last - first,) + shape[day_axis + 1:], dtype=CUBE_ARRAYS[name])
+                array[index] = arrays[name + '_value'][kept]
+                return array
+
+            return cls(meta['authors'], None if first_day is None else first_day + first,
+                       *[dense(name) for name in CUBE_ARRAYS],
+                       meta['undated'] if start is None and end is None else 0)
+
+
+def get_array_shape(name, n_authors, n_days):
+    """
+    Returns the shape of an array of CUBE_ARRAYS in a cube of n_authors and n_days
+    """
+    if name == 'unauthored':
+        return (n_days,)
+    return (n_authors, n_days, HOURS) if name == 'counts' else (n_authors, n_days)
+
+
+def get_day_range(first_day, n_days, start=None, end=None):
+    """
+    Returns the indexes of the days of a cube from start to end, both included, as a [first, last) range
+
+    Arguments:
+        first_day (numpy.datetime64) - First day of the cube, None if it has none
+        n_days (int) - Number of days of the cube
+        start (datetime.date, default None) - First day, the first day of the cube if None
+        end (datetime.date, default None) - Last day, the last day of the cube if None
+
+    Returns:
+        (int, int) - Empty when last <= first
+    """
+    if first_day is None:
+        return 0, 0
+    first = 0 if start is None else int(max((to_day(start) - first_day).astype('int64'), 0))
+    last = n_days if end is None else int(min((to_day(end) - first_day).astype('int64') + 1, n_days))
+    return first, last
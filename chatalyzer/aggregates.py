@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from chatalyzer import activity, analysis, events, metrics, parsing, serialization, topk
+
+# Columns of the system events kept by ChatAggregates, see analysis.get_events
+EVENT_COLUMNS = [analysis.KEY_DATE_TIME, events.KEY_EVENT, events.KEY_ACTOR, events.KEY_PARTICIPANT]
+
+
+class ChatAggregates:
+    """
+    Running aggregates of a chat from which the whole analysis payload can be produced
+    The chat is fed batch by batch through update() and the batches are dropped afterwards, so the memory
+    used grows with the number of authors, days and distinct words/emojis rather than with the number of
+    messages. Aggregates of consecutive parts of a chat can be combined with merge().
+    With a capacity, the words and emojis are counted approximately, holding at most capacity of each, so that
+    the memory used doesn't grow with the vocabulary of the chat either, see topk.FrequentItems.
+    System events are left out of the cube and of the counts, and kept as rows for the group timeline.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.cube = activity.ActivityCube.empty()
+        self.word_counter = topk.new_counter(capacity)
+        self.emoji_counter = topk.new_counter(capacity)
+        self.events = []  # [date time, event, actor, participant] rows, see analysis.get_events
+        self.start = None  # numpy.datetime64 of the first message, None if no message has a date
+
+    @property
+    def num_msgs(self):
+        return self.cube.num_msgs
+
+    @metrics.instrumented
+    def update(self, df):
+        """
+        Adds a batch of messages to the aggregates
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time', 'Letter Count' and
+                'Word Count' columns
+        """
+        event_mask = analysis.get_event_mask(df)
+        self.cube.merge(analysis.get_activity_cube(df, event_mask))
+        self.word_counter.update(analysis.count_words(df, capacity=self.capacity, event_mask=event_mask))
+        self.emoji_counter.update(analysis.count_emojis(df, capacity=self.capacity, event_mask=event_mask))
+        if event_mask.any():
+            chat_events = analysis.get_events(df[event_mask])
+            self.events += [list(row) for row in zip(
+                serialization.get_iso_date_times(chat_events[analysis.KEY_DATE_TIME].to_numpy()),
+                *(chat_events[column].tolist() for column in EVENT_COLUMNS[1:]))]
+        self.add_start(df[analysis.KEY_DATE_TIME].min())
+
+    def add_start(self, start):
+        """
+        Moves the start of the chat to start if it is earlier, NaT and None being ignored
+        """
+        if start is not None and not pd.isna(start):
+            start = np.datetime64(start, 'ns')
+            self.start = start if self.start is None else min(self.start, start)
+
+    def merge(self, other):
+        """
+        Adds the aggregates of the part of the chat following the one aggregated in self
+
+        Arguments:
+            other (ChatAggregates) - Aggregates of the next part of the chat, with the same capacity
+        """
+        self.cube.merge(other.cube)
+        self.word_counter.update(other.word_counter)
+        self.emoji_counter.update(other.emoji_counter)
+        self.events += other.events
+        self.add_start(other.start)
+
+    def to_dict(self):
+        """
+        Returns the aggregates as JSON serializable data, see from_dict
+        Every counter is kept as a list of pairs so that the order of first appearance survives.
+
+        Returns:
+            dict
+        """
+        return {
+            'capacity': self.capacity,
+            'activity': self.cube.to_dict(),
+            'word_counter': topk.counter_to_dict(self.word_counter),
+            'emoji_counter': topk.counter_to_dict(self.emoji_counter),
+            'events': self.events,
+            'start': None if self.start is None else str(self.start),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the aggregates saved with to_dict
+
+        Arguments:
+            data (dict) - Data returned by to_dict
+
+        Returns:
+            ChatAggregates
+        """
+        chat_aggregates = cls(data['capacity'])
+        chat_aggregates.cube = activity.ActivityCube.from_dict(data['activity'])
+        chat_aggregates.word_counter = topk.counter_from_dict(data['word_counter'])
+        chat_aggregates.emoji_counter = topk.counter_from_dict(data['emoji_counter'])
+        chat_aggregates.events = data['events']
+        chat_aggregates.add_start(data['start'])
+        return chat_aggregates
+
+    def get_group_timeline(self):
+        """
+        Returns the same data as analysis.get_group_timeline does for the whole chat
+
+        Returns:
+            (Pandas.DataFrame, Pandas.DataFrame) - See analysis.get_membership_timeline
+        """
+        chat_events = pd.DataFrame(self.events, columns=EVENT_COLUMNS, dtype=object)
+        chat_events[analysis.KEY_DATE_TIME] = pd.to_datetime(chat_events[analysis.KEY_DATE_TIME])
+        start = np.datetime64('NaT', 'ns') if self.start is None else self.start
+        return analysis.get_membership_timeline(chat_events, self.cube.authors, start)
+
+    @metrics.instrumented
+    def get_analysis(self):
+        """
+        Returns the same payload as analysis.get_analysis does for the whole chat
+
+        Returns:
+            dict - Key: template variable, Value: json string (or int for 'num_msgs')
+        """
+        most_used = {
+            'most_used_words': analysis.get_top_from_counter(self.word_counter, 40),
+            'most_used_emojis': analysis.get_top_from_counter(self.emoji_counter, 10),
+        }
+        message_metrics = {metric: analysis.to_json([list(x) for x in counts]) for metric, counts in most_used.items()}
+        message_metrics['group_timeline'] = analysis.group_timeline_to_json(*self.get_group_timeline())
+        return {metric: message_metrics[metric] if metric in message_metrics
+                else analysis.get_metric(None, metric, self.cube)
+                for metric in analysis.METRICS}
+
+
+@metrics.instrumented
+def prepare_batch(df, date_time_format=None):
+    """
+    Returns a batch of parsed messages with the 'Date Time', 'Letter Count' and 'Word Count' columns added,
+    along with the date time format used
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame of chats ('Date', 'Time', 'Author', 'Message')
+        date_time_format (str, default None) - Format found for the previous batches or detected on the whole
+            chat, see analysis.parse_date_time. If it doesn't parse this batch, the format is detected again
+
+    Returns:
+        (Pandas.DataFrame, str)
+    """
+    try:
+        date_time, date_time_format = analysis.parse_date_time(df, date_time_format)
+    except ValueError:
+        date_time, date_time_format = analysis.parse_date_time(df)
+
+    df = df.assign(**{analysis.KEY_DATE_TIME: date_time})
+    df = analysis.add_letter_count(df)
+    df = analysis.add_word_count(df)
+    return df, date_time_format
+
+
+@metrics.instrumented
+def detect_date_format(chatfile, dialect=None):
+    """
+    Returns the date format of a chat file, detected on the distinct dates of the whole file so that a chat
+    whose first days are ambiguous (no day above 12) is still read in the right order from its first batch
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        dialect (dialects.Dialect, default None) - Dialect of the chat, see parsing.detect_file_dialect if None
+
+    Returns:
+        str or None if no format parses every date
+    """
+    try:
+        return analysis.detect_date_format(parsing.get_distinct_dates(chatfile, dialect=dialect))[0]
+    except ValueError:
+        return None
+
+
+@metrics.instrumented
+def aggregate_chat_file(chatfile, batch_size=100000, progress=None, start=0, date_time_format=None, capacity=None):
+    """
+    Returns the aggregates of a chat file, parsed and aggregated batch by batch in bounded memory
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        batch_size (int, default 100000) - Number of messages held in memory at a time
+        progress (callable, default None) - Called with the fraction of the file read, see
+            parsing.iter_chat_batches
+        start (int, default 0) - Offset of the first byte aggregated, which must be the beginning of a message
+        date_time_format (str, default None) - Format of the chat, see analysis.parse_date_time. If None, it is
+            detected on the whole file
+        capacity (int, default None) - Number of words and emojis held by approximate counts, None to count them
+            exactly, see ChatAggregates
+
+    Returns:
+        ChatAggregates
+    """
+    aggregates = ChatAggregates(capacity)
+    dialect = parsing.detect_file_dialect(chatfile)
+    if date_time_format is None:
+        date_time_format = detect_date_format(chatfile, dialect)
+    for batch in parsing.iter_chat_batches(chatfile, batch_size=batch_size, progress=progress, start=start,
+                                           dialect=dialect):
+        batch, date_time_format = prepare_batch(batch, date_time_format)
+        aggregates.update(batch)
+    return aggregates
@@ -1,10 +1,10 @@
+import numpy as np
 import pandas as pd
 import datetime
+import importlib.util
 import json
-import emoji
-import string
-import os
 from collections import Counter
+from chatalyzer import activity, emoji_scanner, events, metrics, serialization, tokenizer, topk
 
 KEY_DATE = 'Date'
 KEY_TIME = 'Time'
@@ -24,9 +24,18 @@ KEY_BUSY_X = 'Busy X'
 KEY_WORD = 'Word'
 KEY_EMOJI = 'Emoji'
 KEY_EMOJI_COUNT = 'Emoji Count'
+KEY_JOINED = 'Joined'
+KEY_LEFT = 'Left'
+KEY_MEMBER_COUNT = 'Member Count'
 
 TAG_MEDIA_OMITTED = '<Media omitted>'
 
+# Most messages counted at a time by the approximate counts of words and emojis, see get_top_k_batches
+TOP_K_BATCH_MESSAGES = 50000
+
+# Bump whenever the output of get_analysis changes so that cached results are recomputed
+ANALYSIS_VERSION = 7
+
 
 class DateTimeEncoder(json.JSONEncoder):
     """
@@ -38,6 +47,34 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
 
 
+@metrics.instrumented
+def to_json(data, cls=None):
+    """
+    Returns the json string of data, every metric of the analysis payload being serialized through it
+
+    Arguments:
+        data - JSON serializable data
+        cls (json.JSONEncoder, default None) - Encoder class, e.g. DateTimeEncoder for dates
+
+    Returns:
+        str
+    """
+    return json.dumps(data, cls=cls)
+
+
+def frame_to_json(df):
+    """
+    Returns the json string of the rows of a DataFrame, see serialization.get_frame_rows
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame of a metric, e.g. ('Busy X', 'Message Count')
+
+    Returns:
+        str
+    """
+    return to_json(serialization.get_frame_rows(df), cls=DateTimeEncoder)
+
+
 def am_pm_to_24hr(df):
     """
     Returns a Pandas DataFrame with time format changed from am/pm to 24hr in the 'Time' column
@@ -103,153 +140,398 @@ def get_media_messages(df):
     return media_messages
 
 
+# Formats of the 'Date' column, tried in this order on the distinct dates of a chat: the first one parsing every
+# date wins, so ambiguous chats (no day above 12) are read month first
+POTENTIAL_DATE_FORMATS = [
+        '%Y/%m/%d',
+        '%m/%d/%y',
+        '%d/%m/%y',
+        '%m/%d/%Y',
+        '%d/%m/%Y',
+        '%d.%m.%y',
+        '%d.%m.%Y',
+        '%Y-%m-%d'
+        ]
+
+TIME_FORMAT_24HR = '%H:%M:%S'
+TIME_FORMAT_12HR = '%I:%M:%S %p'
+# Android exports leave the seconds out
+TIME_FORMAT_24HR_NO_SECONDS = '%H:%M'
+TIME_FORMAT_12HR_NO_SECONDS = '%I:%M %p'
+TIME_PATTERN = r'^(\d{1,2}):(\d\d)(?::(\d\d))?(?:\s*([AaPp])\.?[Mm]\.?)?$'
+
+
+def parse_dates(dates, date_format):
+    """
+    Returns the dates parsed with date_format
+
+    Arguments:
+        dates (Pandas.Index or list of str) - Date strings
+        date_format (str) - strptime format of the dates, e.g. '%d/%m/%y'
+
+    Returns:
+        numpy.ndarray of datetime64[ns]
+
+    Raises:
+        ValueError if a date doesn't match date_format
+    """
+    return pd.to_datetime(pd.Series(dates, dtype=object), format=date_format).values
+
+
+def detect_date_format(dates):
+    """
+    Returns the first format of POTENTIAL_DATE_FORMATS parsing every date, along with the parsed dates
+
+    Arguments:
+        dates (Pandas.Index or list of str) - Date strings, e.g. the distinct dates of a chat
+
+    Returns:
+        (str, numpy.ndarray of datetime64[ns])
+
+    Raises:
+        ValueError if no format parses every date
+    """
+    for date_format in POTENTIAL_DATE_FORMATS:
+        try:
+            return date_format, parse_dates(dates, date_format)
+        except ValueError:
+            continue
+    raise ValueError('Unknown date format')
+
+
+def parse_times(times):
+    """
+    Returns the number of seconds since midnight of 24hr ('21:05:03') or 12hr ('9:05:03 PM') times, with or
+    without seconds, along with the format of the times
+
+    Arguments:
+        times (Pandas.Index or list of str) - Time strings, e.g. the distinct times of a chat
+
+    Returns:
+        (numpy.ndarray of int64, str) - The format is a 12hr one if any time has AM/PM, and one without seconds
+            if no time has seconds
+
+    Raises:
+        ValueError if a time is invalid
+    """
+    parts = pd.Series(times, dtype=object).str.extract(TIME_PATTERN)
+    if parts[0].isna().any():
+        raise ValueError('Unknown time format')
+
+    hours = parts[0].astype('int64').values
+    minutes = parts[1].astype('int64').values
+    has_seconds = parts[2].notna().values
+    seconds = parts[2].fillna('0').astype('int64').values
+    meridiem = parts[3].str.upper().values
+    am_pm = ~pd.isna(meridiem)
+    if ((hours > 23) | (am_pm & ((hours < 1) | (hours > 12))) | (minutes > 59) | (seconds > 59)).any():
+        raise ValueError('Invalid time')
+
+    hours = np.where(am_pm, hours % 12 + np.where(meridiem == 'P', 12, 0), hours)
+    if has_seconds.any():
+        time_format = TIME_FORMAT_12HR if am_pm.any() else TIME_FORMAT_24HR
+    else:
+        time_format = TIME_FORMAT_12HR_NO_SECONDS if am_pm.any() else TIME_FORMAT_24HR_NO_SECONDS
+    return hours * 3600 + minutes * 60 + seconds, time_format
+
+
+@metrics.instrumented
+def parse_date_time(df, date_time_format=None):
+    """
+        Returns a Pandas Series of the date and time of every message along with the format used to parse them
+        Every distinct date and time is parsed once and the results are spread over the messages, straight to
+        datetime64 without going back to strings.
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing 'Date' and 'Time' columns
+            date_time_format (str, default None) - Format returned for another part of the same chat. If None,
+                the date format is detected on the distinct dates, see detect_date_format
+
+        Returns:
+            (Pandas.Series, str) - The format is '<date format> <time format>', e.g. '%d/%m/%y %H:%M:%S'
+
+        Raises:
+            ValueError if the dates or the times can't be parsed (with date_time_format, if given)
+    """
+    date_codes, dates = pd.factorize(df[KEY_DATE])
+    time_codes, times = pd.factorize(df[KEY_TIME])
+
+    if date_time_format is not None:
+        date_format = date_time_format.split(' ', 1)[0]
+        parsed_dates = parse_dates(dates, date_format)
+    else:
+        date_format, parsed_dates = detect_date_format(dates)
+    seconds, time_format = parse_times(times)
+
+    # missing dates and times (messages without a header) have the code -1, which picks the NaT appended last
+    parsed_dates = np.append(parsed_dates, np.datetime64('NaT', 'ns'))
+    seconds = np.append(seconds, 0)
+    date_time = parsed_dates[date_codes] + (seconds[time_codes] * 10 ** 9).astype('timedelta64[ns]')
+    return pd.Series(date_time, index=df.index), '{} {}'.format(date_format, time_format)
+
+
 def get_date_time(df):
     """
-        Returns a Pandas DatetimeIndex object for easy manipulation of dates and times
+        Returns a Pandas Series of datetime64 for easy manipulation of dates and times
 
         Arguments:
             df (Pandas.DataFrame) - DataFrame of chats containing 'Date' and 'Time' columns
 
         Returns:
-            Pandas.DatatimeIndex
+            Pandas.Series
     """
-    df2 = am_pm_to_24hr(df)
+    return parse_date_time(df)[0]
 
-    potential_formats = [
-            '%d/%m/%y:%H:%M:%S',
-            '%m/%d/%y:%H:%M:%S',
-            '%Y/%m/%d:%H:%M:%S'
-            ]
-    for potential_format in potential_formats:
-        try:
-            date_time = pd.to_datetime(df2[KEY_DATE] + ':' + df2[KEY_TIME], format=potential_format)
-        except ValueError:
-            continue
 
-    return date_time
+@metrics.instrumented
+def get_event_mask(df):
+    """
+    Returns the mask of the system events of a chat (participants joining, leaving..., see get_events), which
+    the message metrics leave out. On iOS, they are sent under the name of the group or of a participant.
 
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats
 
-def get_top_x_count(df, x, n_authors=10):
+        Returns:
+            numpy.ndarray of bool
+    """
+    return events.get_event_mask(df[KEY_AUTHOR], df[KEY_MESSAGE])
+
+
+@metrics.instrumented
+def get_activity_cube(df, event_mask=None):
+    """
+    Returns the activity cube of a chat, the single source of the busy-x and top senders metrics
+    It is built in one vectorized pass over the columns of the chat, see activity.ActivityCube. System events
+    count as messages without an author, so that they are left out of every metric but 'num_msgs'.
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time', 'Letter Count' and
+                'Word Count' columns
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask. Computed
+                if None
+
+        Returns:
+            activity.ActivityCube
+    """
+    if event_mask is None:
+        event_mask = get_event_mask(df)
+    authors = df[KEY_AUTHOR].where(~event_mask) if event_mask.any() else df[KEY_AUTHOR]
+    is_media = (df[KEY_MESSAGE] == TAG_MEDIA_OMITTED).to_numpy(dtype=bool, na_value=False)
+    return activity.ActivityCube.from_columns(authors, df[KEY_DATE_TIME].values, df[KEY_LETTER_COUNT].values,
+                                              df[KEY_WORD_COUNT].values, is_media)
+
+
+def get_top_authors(cube, name, key, n_authors, present=None):
+    """
+    Returns a Pandas DataFrame of the authors and their totals in a cube, sorted in descending order of the totals
+    Authors are sorted by name first, the way a groupby on the 'Author' column orders them, so that ties keep
+    the same order as before the cube existed.
+
+        Arguments:
+            cube (activity.ActivityCube) - Activity cube of the chat
+            name (str) - Array of the cube summed, see activity.ActivityCube.get_author_totals
+            key (str) - Name of the totals column
+            n_authors (int) - Number of top authors required (-1 to get all rows)
+            present (numpy.ndarray of bool, default None) - Authors listed, those with a message if None
+
+        Returns:
+            Pandas.DataFrame ('Author', key)
+    """
+    totals = cube.get_author_totals(name)
+    if present is None:
+        present = cube.get_author_totals() > 0
+    rows = sorted((author, int(total)) for author, total, is_present in zip(cube.authors, totals, present)
+                  if is_present)
+    top_df = pd.DataFrame(rows, columns=[KEY_AUTHOR, key]) \
+        .sort_values(by=[key], ascending=False) \
+        .reset_index(drop=True)
+    if n_authors == -1:
+        return top_df
+    else:
+        return top_df.head(n_authors)
+
+
+@metrics.instrumented
+def get_top_x_count(df, x, n_authors=10, cube=None):
     """
     Returns a Pandas DataFrame containing the names and word/letter count of top senders
     sorted in descending order of the word/letter count
 
         Arguments:
-            df (Pandas.DataFrame) - DataFrame of chats
+            df (Pandas.DataFrame) - DataFrame of chats, unused if cube is given
             x (str) - KEY_LETTER_COUNT, KEY_WORD_COUNT
             n_authors (int, default 10) - Number of top authors required (-1 to get all rows)
+            cube (activity.ActivityCube, default None) - Activity cube of df, see get_activity_cube
 
         Returns:
             Pandas.DataFrame ('Author', x)
     """
-    df2 = df.groupby(KEY_AUTHOR, as_index=False).sum() \
-        .sort_values(by=[x], ascending=False) \
-        .reset_index(drop=True)
-
-    top_x_df = df2[[KEY_AUTHOR, x]]
-    if n_authors == -1:
-        return top_x_df
-    else:
-        return top_x_df.head(n_authors)
+    if cube is None:
+        cube = get_activity_cube(df)
+    return get_top_authors(cube, 'letters' if x == KEY_LETTER_COUNT else 'words', x, n_authors)
 
 
-def get_top_message_senders(df, n_authors=10):
+@metrics.instrumented
+def get_top_message_senders(df, n_authors=10, cube=None):
     """
     Returns a Pandas DataFrame containing the names and message count of top message senders
     sorted in descending order of the message count
 
         Arguments:
-            df (Pandas.DataFrame) - DataFrame of chats
+            df (Pandas.DataFrame) - DataFrame of chats, unused if cube is given
             n_authors (int, default 10) - Number of top authors required (-1 to get all rows)
+            cube (activity.ActivityCube, default None) - Activity cube of df, see get_activity_cube
 
         Returns:
             Pandas.DataFrame ('Author', 'Message Count')
     """
-    df2 = df.groupby(KEY_AUTHOR, as_index=False).count() \
-        .sort_values(by=[KEY_MESSAGE], ascending=False) \
-        .reset_index(drop=True) \
-        .rename(columns={KEY_MESSAGE: KEY_MESSAGE_COUNT})
+    if cube is None:
+        cube = get_activity_cube(df)
+    return get_top_authors(cube, 'counts', KEY_MESSAGE_COUNT, n_authors)
 
-    top_message_df = df2[[KEY_AUTHOR, KEY_MESSAGE_COUNT]]
-    if n_authors == -1:
-        return top_message_df
-    else:
-        return top_message_df.head(n_authors)
 
-
-def get_top_media_senders(df, n_authors=10):
+@metrics.instrumented
+def get_top_media_senders(df, n_authors=10, cube=None):
     """
     Returns a Pandas DataFrame containing the names and message count of top media senders
     sorted in descending order of the message count
 
         Arguments:
-            df (Pandas.DataFrame) - DataFrame of chats
+            df (Pandas.DataFrame) - DataFrame of chats, unused if cube is given
             n_authors (int, default 10) - Number of top authors required (-1 to get all rows)
+            cube (activity.ActivityCube, default None) - Activity cube of df, see get_activity_cube
 
         Returns:
             Pandas.DataFrame ('Author', 'Message Count')
     """
-    media_messages = get_media_messages(df)
-    df2 = media_messages.groupby(KEY_AUTHOR, as_index=False).count() \
-        .sort_values(by=[KEY_MESSAGE], ascending=False) \
-        .reset_index(drop=True) \
-        .rename(columns={KEY_MESSAGE: KEY_MESSAGE_COUNT})
+    if cube is None:
+        cube = get_activity_cube(df)
+    media_totals = cube.get_author_totals('media')
+    return get_top_authors(cube, 'media', KEY_MESSAGE_COUNT, n_authors, present=media_totals > 0)
 
-    top_media_df = df2[[KEY_AUTHOR, KEY_MESSAGE_COUNT]]
-    if n_authors == -1:
-        return top_media_df
+
+X_ACCESSORS = {
+    KEY_DATE: 'date',
+    KEY_TIME: 'time',
+    KEY_YEAR: 'year',
+    KEY_MONTH: 'month',
+    KEY_DAY: 'day',
+    KEY_HOUR: 'hour',
+    KEY_MINUTE: 'minute',
+    KEY_SECOND: 'second'
+}
+
+
+# Values of x that activity cubes hold, see get_cube_x_counts
+CUBE_X = (KEY_DATE, KEY_YEAR, KEY_MONTH, KEY_DAY, KEY_HOUR)
+
+
+def get_cube_x_counts(cube, x):
+    """
+    Returns the message counts of every author of a cube by x, along with the values of x
+
+        Arguments:
+            cube (activity.ActivityCube) - Activity cube of the chat
+            x (str) - One of CUBE_X
+
+        Returns:
+            (numpy.ndarray of int64, Pandas.Index) - Counts indexed by (author, x) and the sorted values of x
+    """
+    if x == KEY_HOUR:
+        return cube.get_hour_counts(), pd.Index(np.arange(activity.HOURS))
+    counts = cube.get_day_counts()
+    days = cube.get_days()
+    if x == KEY_DATE:
+        return counts, pd.Index(days.astype(object), dtype=object)
+
+    codes, values = pd.factorize(getattr(pd.DatetimeIndex(days), X_ACCESSORS[x]), sort=True)
+    day_to_x = np.zeros((len(days), len(values)), dtype='int64')
+    day_to_x[np.arange(len(days)), codes] = 1
+    return counts @ day_to_x, pd.Index(values)
+
+
+def to_x_series(counts, x_values):
+    """
+    Returns the non zero message counts of a row of get_cube_x_counts as a Pandas Series indexed by x
+    """
+    nonzero = counts > 0
+    return pd.Series(counts[nonzero], index=x_values[nonzero])
+
+
+def get_x_values(df, x):
+    """
+    Returns a Pandas Series with the x part of the 'Date Time' column, only computing that part
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time' column
+            x (str) - 'Date', 'Time', 'Year', 'Month', 'Day', 'Hour', 'Minute', 'Second'
+
+        Returns:
+            Pandas.Series
+    """
+    return getattr(df[KEY_DATE_TIME].dt, X_ACCESSORS[x]).rename(KEY_BUSY_X)
+
+
+def get_busy_x_df(counts, n_x, sort):
+    """
+    Returns a Pandas DataFrame ('Busy X', 'Message Count') from the message counts indexed by x
+
+        Arguments:
+            counts (Pandas.Series) - Message counts indexed by x, sorted by x
+            n_x (int) - Number of instances required (-1 to get all rows)
+            sort (bool) - If True, sorts by message count. Else, keeps the order of x.
+
+        Returns:
+            Pandas.DataFrame ('Busy X', 'Message Count')
+    """
+    busy_x_df = pd.DataFrame({KEY_BUSY_X: counts.index, KEY_MESSAGE_COUNT: counts.values})
+    if sort==True:
+        busy_x_df = busy_x_df.sort_values(by=[KEY_MESSAGE_COUNT], ascending=False)
+    busy_x_df = busy_x_df.reset_index(drop=True)
+
+    if n_x == -1:
+        return busy_x_df
     else:
-        return top_media_df.head(n_authors)
+        return busy_x_df.head(n_x)
 
 
-def get_busy_x(df, x, n_x=10, sort=False, drop_none=True):
+@metrics.instrumented
+def get_busy_x(df, x, n_x=10, sort=False, drop_none=True, cube=None):
     """
     Returns a Pandas DataFrame containing the values of x and the number of messages corresponding to the x
     Here, x is 'Date', 'Time', 'Year', 'Month'...
+    The values of CUBE_X are reduced from the activity cube of the chat, the other ones grouped from its rows.
         Arguments:
             df (Pandas.DataFrame) - DataFrame of chats
             x (str) - 'Date', 'Time', 'Year', 'Month', 'Day', 'Hour', 'Minute', 'Second'
             n_x (int, default 10) - Number of instances required required (-1 to get all rows)
             sort (bool) - If True, sorts by x. Else, sort by date.
             drop_none (bool) - If True, drops the 'None' author if not already removed.
+            cube (activity.ActivityCube, default None) - Activity cube of df, see get_activity_cube. df is
+                unused when it is given and x is one of CUBE_X
 
         Returns:
             Pandas.DataFrame ('Busy X', 'Message Count')
     """
+    if drop_none and x in CUBE_X:
+        if cube is None:
+            cube = get_activity_cube(df)
+        counts, x_values = get_cube_x_counts(cube, x)
+        return get_busy_x_df(to_x_series(counts.sum(axis=0), x_values), n_x, sort)
 
-    df2 = df.copy()
-    if drop_none:
-        df2 = drop_none_author(df2)
-
-    date_time = df2[KEY_DATE_TIME].dt
-    x_data_dict = {
-        KEY_DATE: date_time.date,
-        KEY_TIME: date_time.time,
-        KEY_YEAR: date_time.year,
-        KEY_MONTH: date_time.month,
-        KEY_DAY: date_time.day,
-        KEY_HOUR: date_time.hour,
-        KEY_MINUTE: date_time.minute,
-        KEY_SECOND: date_time.second
-    }
-
-    df2[KEY_BUSY_X] = x_data_dict[x]
-    df3 = df2.groupby(KEY_BUSY_X, as_index=False).count() 
-    if sort==True:
-        df3 = df3.sort_values(by=[KEY_MESSAGE], ascending=False)
-    df3 = df3.reset_index(drop=True)\
-        .rename(columns={KEY_MESSAGE: KEY_MESSAGE_COUNT})
+    df2 = drop_none_author(df) if drop_none else df
+    counts = df2[KEY_MESSAGE].groupby(get_x_values(df2, x)).count()
+    return get_busy_x_df(counts, n_x, sort)
 
-    busy_x_df = df3[[KEY_BUSY_X, KEY_MESSAGE_COUNT]]
-    if n_x == -1:
-        return busy_x_df
-    else:
-        return busy_x_df.head(n_x)
 
-def get_busy_x_authorwise(df,x,n_x, return_json, add_cumulative=False, sort=False, drop_none=True ):
+@metrics.instrumented
+def get_busy_x_authorwise(df,x,n_x, return_json, add_cumulative=False, sort=False, drop_none=True, cube=None):
     """
     Authorwise, returns data containing the values of x and the number of messages corresponding to the x
     Here, x is 'Date', 'Time', 'Year', 'Month'...
+    The values of CUBE_X are reduced from the activity cube of the chat. For the other ones, every author's
+    counts come from a single groupby on (author, x) over the whole DataFrame.
         Arguments:
             df (Pandas.DataFrame) - DataFrame of chats
             x (str) - 'Date', 'Time', 'Year', 'Month', 'Day', 'Hour', 'Minute', 'Second'
@@ -258,6 +540,8 @@ def get_busy_x_authorwise(df,x,n_x, return_json, add_cumulative=False, sort=Fals
             return_json - If True, returns in json instead of a dict of DataFrame
             sort (bool) - If True, sorts by x. Else, sort by date.
             drop_none (bool) - If True, drops the 'None' author if not already removed.
+            cube (activity.ActivityCube, default None) - Activity cube of df, see get_activity_cube. df is
+                unused when it is given and x is one of CUBE_X
 
         Returns:
         if return_json is False,
@@ -265,73 +549,197 @@ def get_busy_x_authorwise(df,x,n_x, return_json, add_cumulative=False, sort=Fals
         otherwise,
            str - the json string of the data
     """
-    df2 = df.copy()
-    if drop_none:
-        df2 = drop_none_author(df2)
-    participant_list = get_participant_list(df2)
-
     data_list = []
-    for participant in participant_list:
-        participant_df = df2[df2[KEY_AUTHOR]==participant]
-        data_list.append([participant, get_busy_x(participant_df,x,n_x=n_x, sort=sort)])
+    if drop_none and x in CUBE_X:
+        if cube is None:
+            cube = get_activity_cube(df)
+        counts, x_values = get_cube_x_counts(cube, x)
+        for author, author_counts in zip(cube.authors, counts):
+            if author_counts.any():
+                data_list.append([author, get_busy_x_df(to_x_series(author_counts, x_values), n_x, sort)])
+        if add_cumulative==True:
+            data_list.append(["Cumulative", get_busy_x_df(to_x_series(counts.sum(axis=0), x_values), n_x, sort)])
+    else:
+        df2 = drop_none_author(df) if drop_none else df
+        x_values = get_x_values(df2, x)
+        counts = df2[KEY_MESSAGE].groupby([df2[KEY_AUTHOR], x_values], observed=True).count()
+        authorwise_counts = {author: author_counts.droplevel(0)
+                             for author, author_counts in counts.groupby(level=0, sort=False, observed=True)}
+
+        for participant in get_participant_list(df2):
+            data_list.append([participant, get_busy_x_df(authorwise_counts[participant], n_x, sort)])
 
-    if add_cumulative==True:
-        data_list.append(["Cumulative", get_busy_x(df2,x=x, n_x=n_x, sort=sort)])
+        if add_cumulative==True:
+            cumulative_counts = df2[KEY_MESSAGE].groupby(x_values).count()
+            data_list.append(["Cumulative", get_busy_x_df(cumulative_counts, n_x, sort)])
 
     if return_json==True:
         for i in range(len(data_list)):
-            data_list[i][1] = data_list[i][1].values.tolist()
+            data_list[i][1] = serialization.get_frame_rows(data_list[i][1])
 
-        data_json = json.dumps(data_list, cls=DateTimeEncoder)
+        data_json = to_json(data_list, cls=DateTimeEncoder)
         return data_json
     else:
         return data_list
 
 
-def get_most_used_words(df, n_words=10, other=False):
+@metrics.instrumented
+def count_words(df, language=tokenizer.DEFAULT_LANGUAGE, capacity=None, event_mask=None):
     """
-    Returns a Pandas DataFrame containing the common words and their count sorted in descending order
+    Returns a Counter of the words used in the non media messages, trivial words and system events excluded
 
         Arguments:
             df (Pandas.DataFrame) - DataFrame of chats
-            n_words (int, default 10) - Number of common words required (-1 to get all rows)
-            other (bool, default False) - Set True if count of other words is to be added to the DataFrame
+            language (str, default 'en') - Language of the trivial words, see tokenizer.register_stopwords
+            capacity (int, default None) - If given, the words are counted approximately, a batch of at most
+                capacity words at a time, holding at most capacity words, see get_top_k_batches
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask. Computed
+                if None
 
         Returns:
-            Pandas.DataFrame ('Word', 'Word Count')
+            collections.Counter or topk.FrequentItems if capacity is given
     """
+    if event_mask is None:
+        event_mask = get_event_mask(df)
+    if event_mask.any():
+        df = df[~event_mask]
     df = drop_media_messages(df)
+    word_tokenizer = tokenizer.get_tokenizer(language)
+    if capacity is None:
+        return word_tokenizer.count_words(df[KEY_MESSAGE])
+    # punctuation is removed before splitting, so a message has at most as many words as whitespace separated ones
+    word_counts = df[KEY_WORD_COUNT].to_numpy() if KEY_WORD_COUNT in df else get_word_counts(df[KEY_MESSAGE])
+    counter = topk.FrequentItems(capacity)
+    for start, end in get_top_k_batches(word_counts, capacity):
+        counter.update(word_tokenizer.count_words(df[KEY_MESSAGE].iloc[start:end]))
+    return counter
+
+
+def get_top_k_batches(sizes, capacity):
+    """
+    Returns the positions of consecutive batches of messages holding at most capacity items (words or emojis)
+    each, so that the exact counts of a batch, added to a topk.FrequentItems of that capacity, hold at most
+    capacity items as well. A message with more items makes a batch on its own, and no batch has more than
+    TOP_K_BATCH_MESSAGES messages.
 
-    trivial_words_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static","misc","trivial_words.txt") #File containing the words comma-separated
-    with open(trivial_words_path,'r') as f:
-        unwanted_words = [x.strip() for x in f.readlines()]
-    unwanted_words.extend([x.capitalize() for x in unwanted_words])
-    # unwanted_words.extend(list(string.ascii_letters))
-    unwanted_words.extend(list(string.digits))
+        Arguments:
+            sizes (numpy.ndarray of int) - Number of items of every message, or a bound of it
+            capacity (int) - Capacity of the topk.FrequentItems the batches are counted into
 
-    word_list = []
-    for message in df[KEY_MESSAGE]:
-        message = message.translate(message.maketrans('', '', string.punctuation))  # Removing punctuation
-        word_list.extend(word for word in message.split()
-                         if word not in emoji.UNICODE_EMOJI and word not in unwanted_words)
+        Returns:
+            list - List of (start, end) tuples
+    """
+    ends = np.cumsum(sizes, dtype='int64')
+    batches = []
+    start = 0
+    while start < len(ends):
+        previous = int(ends[start - 1]) if start else 0
+        end = int(np.searchsorted(ends, previous + capacity, side='right'))
+        end = min(max(end, start + 1), start + TOP_K_BATCH_MESSAGES)
+        batches.append((start, end))
+        start = end
+    return batches
+
+
+def get_top_from_counter(counter, n, other=False):
+    """
+    Returns the n most common items of a Counter and their count
 
-    counter = Counter(word_list)
+        Arguments:
+            counter (collections.Counter or topk.FrequentItems) - Counter of items
+            n (int) - Number of common items required (-1 to get all items)
+            other (bool, default False) - Set True if count of the other items is to be appended as ('other', count)
 
-    if n_words == -1:
-        most_used_words_and_count = list(counter.items())
+        Returns:
+            list - List of (item, count) tuples
+    """
+    if n == -1:
+        most_used_and_count = list(counter.items())
     else:
-        most_used_words_and_count = counter.most_common(n_words)
+        most_used_and_count = counter.most_common(n)
 
     if other:
-        total_words = len(word_list)
-        total_used_words = sum(map(lambda x: x[1], most_used_words_and_count))
-        most_used_words_and_count.append(('other', total_words - total_used_words))
+        total = topk.get_total(counter)
+        total_used = sum(map(lambda x: x[1], most_used_and_count))
+        most_used_and_count.append(('other', total - total_used))
+
+    return most_used_and_count
+
+
+@metrics.instrumented
+def get_most_used_words(df, n_words=10, other=False, language=tokenizer.DEFAULT_LANGUAGE, capacity=None,
+                        event_mask=None):
+    """
+    Returns a Pandas DataFrame containing the common words and their count sorted in descending order
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats
+            n_words (int, default 10) - Number of common words required (-1 to get all rows)
+            other (bool, default False) - Set True if count of other words is to be added to the DataFrame
+            language (str, default 'en') - Language of the trivial words, see tokenizer.register_stopwords
+            capacity (int, default None) - If given, words are counted approximately in bounded memory, see
+                count_words
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask
 
+        Returns:
+            Pandas.DataFrame ('Word', 'Word Count')
+    """
+    most_used_words_and_count = get_top_from_counter(count_words(df, language, capacity, event_mask), n_words,
+                                                     other)
     common_words_df = pd.DataFrame(most_used_words_and_count, columns=[KEY_WORD, KEY_WORD_COUNT])
     return common_words_df
 
 
-def get_most_used_emojis(df, n_emojis=10, other=False):
+@metrics.instrumented
+def count_emojis(df, by_author=False, capacity=None, event_mask=None):
+    """
+    Returns a Counter of the emojis used in the messages, system events excluded
+    Multi-codepoint emojis (ZWJ sequences, skin tones, flags...) are counted as a single emoji.
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats
+            by_author (bool, default False) - Set True to also get the counts of every author, from the same scan
+            capacity (int, default None) - If given, the emojis are counted approximately, a batch of at most
+                capacity characters at a time, holding at most capacity emojis, see get_top_k_batches. Not with
+                by_author
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask. Computed
+                if None
+
+        Returns:
+        if by_author is False,
+            collections.Counter or topk.FrequentItems if capacity is given
+        otherwise,
+            (collections.Counter, dict) - dict Key: Author, Value: collections.Counter of the author's emojis
+    """
+    if event_mask is None:
+        event_mask = get_event_mask(df)
+    if event_mask.any():
+        df = df[~event_mask]
+    scanner = emoji_scanner.get_scanner()
+    if capacity is not None and not by_author:
+        # every emoji is at least one character long
+        letter_counts = (df[KEY_LETTER_COUNT].to_numpy() if KEY_LETTER_COUNT in df
+                         else get_letter_counts(df[KEY_MESSAGE]))
+        counter = topk.FrequentItems(capacity)
+        for start, end in get_top_k_batches(letter_counts, capacity):
+            counter.update(Counter(scanner.scan(df[KEY_MESSAGE].iloc[start:end])[0]))
+        return counter
+
+    found, message_indices = scanner.scan(df[KEY_MESSAGE])
+    counter = Counter(found)
+    if not by_author:
+        return counter
+
+    emojis_df = pd.DataFrame({KEY_AUTHOR: df[KEY_AUTHOR].values[message_indices], KEY_EMOJI: found})
+    authorwise_counts = emojis_df.groupby([KEY_AUTHOR, KEY_EMOJI], sort=False, observed=True).size()
+    authorwise_counters = {}
+    for (author, emoji_), count in authorwise_counts.items():
+        authorwise_counters.setdefault(author, Counter())[emoji_] = int(count)
+    return counter, authorwise_counters
+
+
+@metrics.instrumented
+def get_most_used_emojis(df, n_emojis=10, other=False, capacity=None, event_mask=None):
     """
     Returns a Pandas DataFrame containing the common emojis and their count sorted in descending order
 
@@ -339,34 +747,25 @@ def get_most_used_emojis(df, n_emojis=10, other=False):
             df (Pandas.DataFrame) - DataFrame of chats
             n_emojis (int, default 10) - Number of common emojis required (-1 to get all rows)
             other (bool, default False) - Set True if count of other emojis is to be added to the DataFrame
+            capacity (int, default None) - If given, emojis are counted approximately in bounded memory, see
+                count_emojis
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask
 
         Returns:
             Pandas.DataFrame ('Emoji', 'Emoji Count')
     """
-    emoji_list = []
-    for message in df[KEY_MESSAGE]:
-        emoji_list.extend([c for c in message if c in emoji.UNICODE_EMOJI])
-
-    counter = Counter(emoji_list)
-
-    if n_emojis == -1:
-        most_used_emojis_and_count= list(counter.items())
-    else:
-        most_used_emojis_and_count = counter.most_common(n_emojis)
-
-    if other:
-        total_emojis = len(emoji_list)
-        total_used_emojis = sum(map(lambda x: x[1], most_used_emojis_and_count))
-        most_used_emojis_and_count.append(('other', total_emojis - total_used_emojis))
-
+    most_used_emojis_and_count = get_top_from_counter(count_emojis(df, capacity=capacity, event_mask=event_mask),
+                                                      n_emojis, other)
     most_used_emojis_df = pd.DataFrame(most_used_emojis_and_count, columns=[KEY_EMOJI, KEY_EMOJI_COUNT])
     return most_used_emojis_df
 
 
+@metrics.instrumented
 def add_date_time(df):
     """
     Returns a Pandas DataFrame in which 'Date Time' column as a pandas DatetimeIndex object is appended to the parameter
     df
+    The columns of df are shared with the returned DataFrame rather than copied.
 
         Arguments:
             df (Pandas.DataFrame) - DataFrame of chats containing 'Date' and 'Time' columns
@@ -374,13 +773,50 @@ def add_date_time(df):
         Returns:
             Pandas.DataFrame
     """
-    df2 = df.copy()
-    date_time = get_date_time(df)
-    df2[KEY_DATE_TIME] = date_time
-    pd.DataFrame().dropna()
+    df2 = df.copy(deep=False)
+    df2[KEY_DATE_TIME] = get_date_time(df)
     return df2
 
 
+def is_arrow_string(messages):
+    """
+    Returns True if the messages are stored as pyarrow backed strings, see compact_chats
+    """
+    return isinstance(messages.dtype, pd.StringDtype) and messages.dtype.storage == 'pyarrow'
+
+
+def get_letter_counts(messages):
+    """
+    Returns the number of characters of every message
+
+        Arguments:
+            messages (Pandas.Series) - 'Message' column
+
+        Returns:
+            numpy.ndarray of int64
+    """
+    if is_arrow_string(messages):
+        return messages.str.len().to_numpy(dtype='int64')
+    # str.len is slower than len itself on Python strings
+    return np.fromiter(map(len, messages), dtype=np.int64, count=len(messages))
+
+
+def get_word_counts(messages):
+    """
+    Returns the number of whitespace separated words of every message
+
+        Arguments:
+            messages (Pandas.Series) - 'Message' column
+
+        Returns:
+            numpy.ndarray of int64
+    """
+    if is_arrow_string(messages):
+        return messages.str.count(r'\S+').to_numpy(dtype='int64')
+    return np.fromiter((len(message.split()) for message in messages), dtype=np.int64, count=len(messages))
+
+
+@metrics.instrumented
 def add_letter_count(df):
     """
     Returns a Pandas DataFrame in which 'Letter Count' column object is appended to the parameter df
@@ -392,11 +828,12 @@ def add_letter_count(df):
         Returns:
             Pandas.DataFrame
     """
-    df2 = df.copy()
-    df2[KEY_LETTER_COUNT] = df2[KEY_MESSAGE].apply(len)
+    df2 = df.copy(deep=False)
+    df2[KEY_LETTER_COUNT] = get_letter_counts(df[KEY_MESSAGE])
     return df2
 
 
+@metrics.instrumented
 def add_word_count(df):
     """
     Returns a Pandas DataFrame in which 'Word Count' column object is appended to the parameter df
@@ -408,11 +845,63 @@ def add_word_count(df):
         Returns:
             Pandas.DataFrame
     """
-    df2 = df.copy()
-    df2[KEY_WORD_COUNT] = df2[KEY_MESSAGE].apply(lambda x: len(x.split()))
+    df2 = df.copy(deep=False)
+    df2[KEY_WORD_COUNT] = get_word_counts(df[KEY_MESSAGE])
     return df2
 
 
+def get_message_dtype():
+    """
+    Returns the dtype of the 'Message' column of compact chats: pyarrow backed strings when pyarrow is installed,
+    Python strings otherwise
+    """
+    if importlib.util.find_spec('pyarrow') is not None:
+        return pd.StringDtype('pyarrow')
+    return object
+
+
+def get_memory_usage(df):
+    """
+    Returns the number of bytes held by a DataFrame, Python strings included
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+@metrics.instrumented
+def compact_chats(df):
+    """
+    Returns the chats in the compact schema every analysis function works on as well:
+    categorical 'Author', 'Message' stored as pyarrow strings if available, a single datetime64 'Date Time'
+    instead of the 'Date' and 'Time' strings, int32 'Letter Count' and uint16 'Word Count' (int32 if a message
+    has more words than that)
+    The memory saved is added to the 'compact_saved_bytes' metric when metrics are on.
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats, with or without the 'Date Time', 'Letter Count' and
+                'Word Count' columns
+
+        Returns:
+            Pandas.DataFrame ('Author', 'Message', 'Date Time', 'Letter Count', 'Word Count')
+    """
+    messages = df[KEY_MESSAGE].astype(get_message_dtype())
+    date_time = df[KEY_DATE_TIME] if KEY_DATE_TIME in df else get_date_time(df)
+    letter_counts = df[KEY_LETTER_COUNT].values if KEY_LETTER_COUNT in df else get_letter_counts(messages)
+    word_counts = df[KEY_WORD_COUNT].values if KEY_WORD_COUNT in df else get_word_counts(messages)
+    word_count_dtype = 'uint16' if len(word_counts) == 0 or word_counts.max() <= np.iinfo('uint16').max else 'int32'
+
+    compact_df = pd.DataFrame({
+        KEY_AUTHOR: df[KEY_AUTHOR].astype('category'),
+        KEY_MESSAGE: messages,
+        KEY_DATE_TIME: date_time,
+        KEY_LETTER_COUNT: letter_counts.astype('int32'),
+        KEY_WORD_COUNT: word_counts.astype(word_count_dtype),
+    }, index=df.index)
+
+    if metrics.is_enabled():
+        metrics.increment('compact_saved_bytes', get_memory_usage(df) - get_memory_usage(compact_df))
+    return compact_df
+
+
 def get_participant_list(df):
     """
     Returns a list of the group participants
@@ -427,8 +916,376 @@ def get_participant_list(df):
     return participant_list
 
 
-def get_group_timeline(df):
+@metrics.instrumented
+def get_events(df):
+    """
+    Returns the system events of a chat (participants joining, leaving, being added or removed, group changes),
+    see events.EVENT_PATTERNS
+    Only the messages without an author or starting with the mark of iOS system messages are classified, every
+    pattern being applied to all of them at once.
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time' column
+
+    Returns:
+        Pandas.DataFrame ('Date Time', 'Event', 'Actor', 'Participant') in chronological order, indexed by the
+        message of every event in df, with a row per participant for the events done to several of them
+    """
+    candidates = df[events.get_event_candidates(df[KEY_AUTHOR], df[KEY_MESSAGE])]
+    chat_events = events.classify_events(candidates[KEY_MESSAGE].astype(object))
+    chat_events.insert(0, KEY_DATE_TIME, candidates[KEY_DATE_TIME].reindex(chat_events.index))
+    return chat_events
+
+
+@metrics.instrumented
+def get_group_timeline(df, chat_events=None):
     """
     Returns data containing when participants joined and left the group
+    Authors of messages other than events who never join nor leave are members for the whole chat, and so are
+    those whose first membership event is leaving until they leave, see get_membership_timeline.
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time' column
+            chat_events (Pandas.DataFrame, default None) - System events of df, see get_events
+
+        Returns:
+            (Pandas.DataFrame, Pandas.DataFrame) - See get_membership_timeline
+    """
+    if chat_events is None:
+        chat_events = get_events(df)
+    authors = df[KEY_AUTHOR].drop(index=chat_events.index.unique()).dropna().unique()
+    return get_membership_timeline(chat_events, authors, df[KEY_DATE_TIME].min())
+
+
+def get_membership_timeline(chat_events, authors, start):
+    """
+    Returns the membership intervals of the participants of a chat and its number of members over time, from its
+    system events alone, so that aggregated chats get them as well (see aggregates.ChatAggregates)
+    Both the intervals and the membership curve are computed with array operations over the membership events,
+    see events.get_membership_intervals.
+
+        Arguments:
+            chat_events (Pandas.DataFrame) - System events of the chat, see get_events
+            authors (list-like) - Authors of the messages other than events
+            start (datetime-like) - Date and time of the first message, NaT if the chat has none
+
+        Returns:
+            (Pandas.DataFrame, Pandas.DataFrame)
+            - ('Participant', 'Joined', 'Left') every membership interval, 'Joined' being NaT for participants
+              there before the chat starts and 'Left' NaT for those still there when it ends
+            - ('Date Time', 'Member Count') number of members from the first message and after every change
+    """
+    changes = chat_events[chat_events[events.KEY_EVENT].isin(events.MEMBERSHIP)]
+    participants, joined, left, kept = events.get_membership_intervals(
+        changes[events.KEY_PARTICIPANT].to_numpy(dtype=object), changes[KEY_DATE_TIME].to_numpy(dtype='datetime64[ns]'),
+        changes[events.KEY_EVENT].map(events.MEMBERSHIP).to_numpy(dtype=bool))
+
+    always_members = pd.Index(authors, dtype=object).difference(pd.Index(participants, dtype=object), sort=False)
+    intervals = pd.DataFrame({
+        events.KEY_PARTICIPANT: np.concatenate([always_members.to_numpy(dtype=object), participants]),
+        KEY_JOINED: np.concatenate([np.full(len(always_members), np.datetime64('NaT'), 'datetime64[ns]'), joined]),
+        KEY_LEFT: np.concatenate([np.full(len(always_members), np.datetime64('NaT'), 'datetime64[ns]'), left]),
+    }).sort_values([KEY_JOINED, events.KEY_PARTICIPANT], na_position='first', kind='stable') \
+        .reset_index(drop=True)
+
+    changes = changes[kept].sort_values(KEY_DATE_TIME, kind='stable')
+    initial = len(always_members) + int(np.count_nonzero(pd.isna(joined)))
+    deltas = np.where(changes[events.KEY_EVENT].map(events.MEMBERSHIP).to_numpy(dtype=bool), 1, -1)
+    membership = pd.DataFrame({
+        KEY_DATE_TIME: np.concatenate([[pd.Timestamp(start).to_datetime64()],
+                                       changes[KEY_DATE_TIME].to_numpy(dtype='datetime64[ns]')]),
+        KEY_MEMBER_COUNT: initial + np.concatenate([[0], np.cumsum(deltas)]),
+    })
+    return intervals, membership
+
+
+def group_timeline_to_dict(intervals, membership):
+    """
+    Returns the 'group_timeline' metric as JSON serializable data
+    {"members": [[participant, joined, left], ...], "member_count": [[date time, count], ...]}, date times being
+    ISO strings to the second and None when unknown
+
+        Arguments:
+            intervals (Pandas.DataFrame) - Membership intervals, see get_membership_timeline
+            membership (Pandas.DataFrame) - Number of members over time, see get_membership_timeline
+
+        Returns:
+            dict
+    """
+    joined, left, date_times = [serialization.get_iso_date_times(column.to_numpy()) for column in
+                                (intervals[KEY_JOINED], intervals[KEY_LEFT], membership[KEY_DATE_TIME])]
+    return {
+        'members': [list(row) for row in zip(intervals[events.KEY_PARTICIPANT].tolist(), joined, left)],
+        'member_count': [list(row) for row in zip(date_times, membership[KEY_MEMBER_COUNT].tolist())],
+    }
+
+
+def group_timeline_to_json(intervals, membership):
+    """
+    Returns the json string of the 'group_timeline' metric, see group_timeline_to_dict
+    """
+    return to_json(group_timeline_to_dict(intervals, membership))
+
+
+def get_daywise_message_count(df, cube=None):
+    """
+    Returns the DataFrame of the number of messages sent every day, in chronological order
+    """
+    return get_busy_x(df, KEY_DATE, -1, cube=cube).sort_values(KEY_BUSY_X)
+
+
+# DataFrames of the metrics reduced from the activity cube of the chat alone, which answer for any date range of
+# it as well: an (x, count) DataFrame, [author, DataFrame] lists for the authorwise metrics, or a single count
+ACTIVITY_FRAMES = {
+    'num_msgs': lambda cube: cube.num_msgs,
+    'top_message_senders': lambda cube: get_top_message_senders(None, -1, cube),
+    'top_media_senders': lambda cube: get_top_media_senders(None, -1, cube),
+    'word_count': lambda cube: get_top_x_count(None, KEY_WORD_COUNT, -1, cube),
+    'letter_count': lambda cube: get_top_x_count(None, KEY_LETTER_COUNT, -1, cube),
+    'daywise_message_count': lambda cube: get_daywise_message_count(None, cube),
+    'authorwise_daywise_message_count': lambda cube: get_busy_x_authorwise(None, KEY_DATE, -1, False, cube=cube),
+    'authorwise_busiest_time': lambda cube: get_busy_x_authorwise(None, KEY_HOUR, -1, False, add_cumulative=False,
+                                                                  cube=cube),
+}
+
+# DataFrames of the metrics computed from the messages themselves, given the mask of their system events (see
+# get_event_mask), or the data of the nested ones
+MESSAGE_FRAMES = {
+    'most_used_words': lambda df, event_mask: get_most_used_words(df, 40, event_mask=event_mask),
+    'most_used_emojis': lambda df, event_mask: get_most_used_emojis(df, event_mask=event_mask),
+    'group_timeline': lambda df, event_mask: group_timeline_to_dict(*get_group_timeline(
+        df, get_events(df[event_mask]))),
+}
+
+
+def frames_to_json(frames):
+    """
+    Returns the json string of the DataFrames of a metric, see ACTIVITY_FRAMES and MESSAGE_FRAMES
+
+        Arguments:
+            frames - DataFrame, [author, DataFrame] lists, dict of a nested metric or a single count
+
+        Returns:
+            str - json string (or int for a single count)
+    """
+    if isinstance(frames, int):
+        return frames
+    if isinstance(frames, pd.DataFrame):
+        return frame_to_json(frames)
+    if isinstance(frames, list):
+        return to_json([[author, serialization.get_frame_rows(frame)] for author, frame in frames],
+                       cls=DateTimeEncoder)
+    return to_json(frames)
+
+
+# Metrics reduced from the activity cube, as json strings (or int for 'num_msgs'), see ACTIVITY_FRAMES
+ACTIVITY_METRICS = {metric: (lambda cube, get_frames=get_frames: frames_to_json(get_frames(cube)))
+                    for metric, get_frames in ACTIVITY_FRAMES.items()}
+
+# Metrics computed from the messages, as json strings, see MESSAGE_FRAMES
+MESSAGE_METRICS = {metric: (lambda df, event_mask, get_frames=get_frames: frames_to_json(get_frames(df, event_mask)))
+                   for metric, get_frames in MESSAGE_FRAMES.items()}
+
+# Every metric shown on the analysis page, in the order of the payload
+METRICS = ('num_msgs', 'top_message_senders', 'top_media_senders', 'word_count', 'letter_count',
+           'daywise_message_count', 'most_used_words', 'most_used_emojis', 'authorwise_daywise_message_count',
+           'authorwise_busiest_time', 'group_timeline')
+
+# Metrics which are neither rows nor a single count, sent as they are in the columnar format and with no Arrow form
+NESTED_METRICS = ('group_timeline',)
+
+# Metrics made of [date, count] rows ('daywise_message_count') or of [author, [[date, count], ...]] rows
+TIMELINE_METRICS = {'daywise_message_count': False, 'authorwise_daywise_message_count': True}
+
+# Rows of every metric made of rows, as (by author, type of x), see serialization.to_columnar
+METRIC_LAYOUTS = {
+    'top_message_senders': (False, serialization.X_LABEL),
+    'top_media_senders': (False, serialization.X_LABEL),
+    'word_count': (False, serialization.X_LABEL),
+    'letter_count': (False, serialization.X_LABEL),
+    'daywise_message_count': (False, serialization.X_DAY),
+    'most_used_words': (False, serialization.X_LABEL),
+    'most_used_emojis': (False, serialization.X_LABEL),
+    'authorwise_daywise_message_count': (True, serialization.X_DAY),
+    'authorwise_busiest_time': (True, serialization.X_HOUR),
+}
+
+# Buckets timelines can be downsampled to, as pandas periods
+TIMELINE_BUCKETS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+
+def get_metric_frames(df, metric, cube=None, event_mask=None):
+    """
+    Returns the DataFrames of a single metric of the analysis page, see ACTIVITY_FRAMES and MESSAGE_FRAMES
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time', 'Letter Count' and
+                'Word Count' columns, unused for the metrics of ACTIVITY_FRAMES when cube is given
+            metric (str) - One of METRICS
+            cube (activity.ActivityCube, default None) - Activity cube of df, built if needed and None
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask. Computed
+                if needed and None
+
+        Returns:
+            Pandas.DataFrame, list of [author, Pandas.DataFrame], dict or int
+    """
+    if metric in ACTIVITY_FRAMES:
+        if cube is None:
+            cube = get_activity_cube(df, event_mask)
+        return ACTIVITY_FRAMES[metric](cube)
+    if event_mask is None:
+        event_mask = get_event_mask(df)
+    return MESSAGE_FRAMES[metric](df, event_mask)
+
+
+def get_metric_columnar(df, metric, cube=None, event_mask=None):
+    """
+    Returns a single metric of the analysis page as the parallel arrays of serialization.to_columnar, built
+    from its DataFrames rather than from its json rows, see get_metric_frames for the arguments
+
+        Returns:
+            dict (or int for 'num_msgs')
+    """
+    frames = get_metric_frames(df, metric, cube, event_mask)
+    if metric in METRIC_LAYOUTS:
+        return serialization.frames_to_columnar(frames, *METRIC_LAYOUTS[metric])
+    return frames
+
+
+def get_metric(df, metric, cube=None, event_mask=None):
+    """
+    Returns a single metric of the analysis page
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time', 'Letter Count' and
+                'Word Count' columns
+            metric (str) - One of METRICS
+            cube (activity.ActivityCube, default None) - Activity cube of df, built if needed and None
+            event_mask (numpy.ndarray of bool, default None) - System events of df, see get_event_mask. Computed
+                if needed and None
+
+        Returns:
+            str - json string (or int for 'num_msgs')
+    """
+    return frames_to_json(get_metric_frames(df, metric, cube, event_mask))
+
+
+def get_timeline_bucket(timeline, by_author, max_points):
+    """
+    Returns the finest bucket of TIMELINE_BUCKETS splitting the span of a timeline in at most max_points buckets
+
+        Arguments:
+            timeline (list) - Rows of a timeline metric, see TIMELINE_METRICS
+            by_author (bool) - True if the rows are [author, [[date, count], ...]]
+            max_points (int) - Maximum number of points per series
+
+        Returns:
+            str
+    """
+    dates = [row[0] for author_rows in timeline for row in author_rows[1]] if by_author else \
+        [row[0] for row in timeline]
+    dates = [date for date in dates if date is not None]
+    if not dates:
+        return 'day'
+    days = (datetime.date.fromisoformat(max(dates)[:10]) - datetime.date.fromisoformat(min(dates)[:10])).days + 1
+    return get_span_bucket(days, max_points)
+
+
+def get_columnar_timeline_bucket(columnar, max_points):
+    """
+    Returns the bucket of get_timeline_bucket for a timeline in the columnar format of serialization.to_columnar
+    """
+    days = [day for day in columnar['x'] if day is not None]
+    return get_span_bucket(max(days) - min(days) + 1, max_points) if days else 'day'
+
+
+def get_span_bucket(days, max_points):
+    """
+    Returns the finest bucket of TIMELINE_BUCKETS splitting a span of days in at most max_points buckets
+    """
+    if days <= max_points:
+        return 'day'
+    if days / 7 <= max_points:
+        return 'week'
+    return 'month'
+
+
+@metrics.instrumented
+def downsample_timeline(timeline, bucket, by_author=False):
+    """
+    Returns a timeline with the counts summed by week or month, each bucket being dated by its first day
+
+        Arguments:
+            timeline (list) - Rows of a timeline metric, see TIMELINE_METRICS
+            bucket (str) - Key of TIMELINE_BUCKETS
+            by_author (bool, default False) - True if the rows are [author, [[date, count], ...]]
+
+        Returns:
+            list
+    """
+    if bucket == 'day':
+        return timeline
+    if by_author:
+        return [[author, downsample_timeline(rows, bucket)] for author, rows in timeline]
+
+    rows = [row for row in timeline if row[0] is not None]
+    if not rows:
+        return []
+    dates, counts = zip(*rows)
+    starts = pd.to_datetime(pd.Series(dates)).dt.to_period(TIMELINE_BUCKETS[bucket]).dt.start_time
+    sums = pd.Series(counts).groupby(starts.dt.strftime('%Y-%m-%d').values, sort=True).sum()
+    return [[start, int(count)] for start, count in sums.items()]
+
+
+@metrics.instrumented
+def downsample_columnar_timeline(columnar, bucket):
+    """
+    Returns a timeline in the columnar format of serialization.to_columnar with the counts summed by week or
+    month, like downsample_timeline, working on the days since 1970-01-01 rather than on rows
+
+        Arguments:
+            columnar (dict) - Columnar timeline, see TIMELINE_METRICS
+            bucket (str) - Key of TIMELINE_BUCKETS
+
+        Returns:
+            dict
+    """
+    if bucket == 'day':
+        return columnar
+    days = np.array(columnar['x'], dtype='float64')  # None is read as nan
+    kept = ~np.isnan(days)
+    days = days[kept].astype('int64')
+    if bucket == 'week':
+        starts = days - (days + 3) % 7  # weeks start on Mondays, and 1970-01-01 is a Thursday
+    else:
+        starts = days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+    counts = pd.Series(np.array(columnar['count'], dtype='int64')[kept])
+    downsampled = dict(columnar)
+    if 'authors' in columnar:
+        sums = counts.groupby([np.array(columnar['author'], dtype='int64')[kept], starts], sort=True).sum()
+        downsampled['author'] = sums.index.get_level_values(0).tolist()
+        downsampled['x'] = sums.index.get_level_values(1).tolist()
+    else:
+        sums = counts.groupby(starts, sort=True).sum()
+        downsampled['x'] = sums.index.tolist()
+    downsampled['count'] = sums.tolist()
+    return downsampled
+
+
+@metrics.instrumented
+def get_analysis(df, cube=None):
+    """
+    Returns every metric shown on the analysis page, each one already serialized to json
+
+        Arguments:
+            df (Pandas.DataFrame) - DataFrame of chats containing the 'Date Time', 'Letter Count' and
+                'Word Count' columns
+            cube (activity.ActivityCube, default None) - Activity cube of df, built once for every metric if None
+
+        Returns:
+            dict - Key: template variable, Value: json string (or int for 'num_msgs')
     """
-    pass
+    event_mask = get_event_mask(df)  # found once for every metric
+    if cube is None:
+        cube = get_activity_cube(df, event_mask)
+    return {metric: get_metric(df, metric, cube, event_mask) for metric in METRICS}
@@ -0,0 +1,186 @@
+import os
+import sys
+import importlib.util
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chatalyzer import aggregates, analysis, compression, parsing
+
+CHAT_EXTENSIONS = (compression.CHAT_SUFFIX, compression.COMPRESSED_SUFFIX)
+SUMMARY_FORMATS = ('csv', 'parquet')
+SUMMARY_COLUMNS = ['chat', 'output', 'status', 'error', 'bytes', 'num_msgs', 'participants', 'first_day',
+                   'last_day', 'seconds']
+
+
+def can_write_parquet():
+    """
+    Returns True if pandas has a parquet engine to write the summary with
+    """
+    return any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+def find_chat_files(paths):
+    """
+    Returns the chat files to analyze along with the path of their result relative to the output folder
+    Directories are searched recursively for chat exports and keep their layout in the output folder.
+
+    Arguments:
+        paths (list of str) - Chat files and directories
+
+    Returns:
+        list - Sorted (chat file, relative result path) tuples
+    """
+    chat_files = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    if name.lower().endswith(CHAT_EXTENSIONS):
+                        chat_file = os.path.join(root, name)
+                        chat_files[chat_file] = os.path.relpath(chat_file, path) + '.json'
+        else:
+            chat_files[path] = os.path.basename(path) + '.json'
+    return sorted(chat_files.items())
+
+
+def analyze_chat_file(chatfile, streaming_min_bytes=64 * 1024 ** 2, batch_size=100000):
+    """
+    Returns the analysis payload of a chat file, the one show_analysis renders
+    Chats of at least streaming_min_bytes are aggregated batch by batch instead of being loaded whole.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        streaming_min_bytes (int, default 64 MiB) - Size from which chats are aggregated batch by batch
+        batch_size (int, default 100000) - Number of messages held in memory at a time when streaming
+
+    Returns:
+        dict - Key: template variable, Value: json string (or int for 'num_msgs')
+    """
+    if compression.get_chat_size(chatfile) >= streaming_min_bytes:
+        return aggregates.aggregate_chat_file(chatfile, batch_size).get_analysis()
+
+    df = parsing.get_chats(chatfile)
+    df = analysis.add_date_time(df)
+    df = analysis.add_letter_count(df)
+    df = analysis.add_word_count(df)
+    return analysis.get_analysis(df)
+
+
+def decode_payload(payload):
+    """
+    Returns the analysis payload with every metric decoded from its json string
+    """
+    return {key: json.loads(value) if isinstance(value, str) else value for key, value in payload.items()}
+
+
+def analyze_to_file(chatfile, out_path, streaming_min_bytes, batch_size):
+    """
+    Analyzes a chat file and writes its decoded payload as JSON to out_path, in a worker process
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        out_path (str) - Path of the JSON result
+        streaming_min_bytes (int) - See analyze_chat_file
+        batch_size (int) - See analyze_chat_file
+
+    Returns:
+        dict - Summary row of the chat, see SUMMARY_COLUMNS
+    """
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row.update(chat=chatfile, output=out_path)
+    start = time.perf_counter()
+    try:
+        row['bytes'] = compression.get_chat_size(chatfile)  # of the text, a compressed chat being smaller on disk
+        result = decode_payload(analyze_chat_file(chatfile, streaming_min_bytes, batch_size))
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as out_file:
+            json.dump(result, out_file, ensure_ascii=False)
+        os.replace(tmp_path, out_path)
+    except Exception:
+        row.update(status='error', error=traceback.format_exc(limit=1).strip().splitlines()[-1])
+    else:
+        days = result['daywise_message_count']
+        row.update(status='ok', num_msgs=result['num_msgs'], participants=len(result['top_message_senders']),
+                   first_day=days[0][0] if days else None, last_day=days[-1][0] if days else None)
+    row['seconds'] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def write_summary(rows, out_folder, summary_format='csv'):
+    """
+    Writes the summary rows of a batch to '<out_folder>/summary.<csv|parquet>'
+
+    Arguments:
+        rows (list of dict) - Summary rows, see analyze_to_file
+        out_folder (str) - Output folder
+        summary_format (str, default 'csv') - 'csv' or 'parquet' (needs pyarrow or fastparquet)
+
+    Returns:
+        str - Path of the summary
+    """
+    import pandas as pd  # imported when used, so that the CLI parses its arguments without loading pandas
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS).sort_values('chat')
+    summary_path = os.path.join(out_folder, 'summary.' + summary_format)
+    if summary_format == 'parquet':
+        summary.to_parquet(summary_path, index=False)
+    else:
+        summary.to_csv(summary_path, index=False)
+    return summary_path
+
+
+def analyze(paths, out_folder, jobs=None, summary_format='csv', skip_existing=False,
+            streaming_min_bytes=64 * 1024 ** 2, batch_size=100000):
+    """
+    Analyzes many chat exports concurrently in a process pool, writing one JSON result per chat and a summary
+
+    Arguments:
+        paths (list of str) - Chat files and directories containing chat files
+        out_folder (str) - Folder of the results
+        jobs (int, default None) - Number of worker processes, the number of CPUs if None
+        summary_format (str, default 'csv') - 'csv' or 'parquet'
+        skip_existing (bool, default False) - If True, chats whose result is newer than the chat are not analyzed
+            again and are listed as 'skipped' in the summary
+        streaming_min_bytes (int, default 64 MiB) - See analyze_chat_file
+        batch_size (int, default 100000) - See analyze_chat_file
+
+    Returns:
+        list - Summary rows of the chats analyzed
+    """
+    from tqdm import tqdm
+
+    chat_files, skipped = [], []
+    for chatfile, relative_path in find_chat_files(paths):
+        out_path = os.path.join(out_folder, relative_path)
+        if skip_existing and os.path.isfile(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(chatfile):
+            row = dict.fromkeys(SUMMARY_COLUMNS)
+            row.update(chat=chatfile, output=out_path, status='skipped', bytes=compression.get_chat_size(chatfile))
+            skipped.append(row)
+        else:
+            chat_files.append((chatfile, out_path))
+
+    os.makedirs(out_folder, exist_ok=True)
+    rows = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(analyze_to_file, chatfile, out_path, streaming_min_bytes, batch_size)
+                   for chatfile, out_path in chat_files]
+        for future in tqdm(as_completed(futures), total=len(futures), unit='chat'):
+            rows.append(future.result())
+    elapsed = time.perf_counter() - start
+
+    summary_path = write_summary(rows + skipped, out_folder, summary_format)
+    ok = [row for row in rows if row['status'] == 'ok']
+    n_bytes = sum(row['bytes'] for row in rows)
+    n_msgs = sum(row['num_msgs'] for row in ok)
+    elapsed = max(elapsed, 1e-9)
+    print('{} chats analyzed ({} failed, {} skipped) in {:.1f}s: {:.1f} chats/s, {:,.0f} messages/s, '
+          '{:.1f} MiB/s'.format(len(rows), len(rows) - len(ok), len(skipped), elapsed, len(rows) / elapsed,
+                                n_msgs / elapsed, n_bytes / 1024 ** 2 / elapsed))
+    print('summary written to {}'.format(summary_path))
+    for row in rows:
+        if row['status'] != 'ok':
+            print('{}: {}'.format(row['chat'], row['error']), file=sys.stderr)
+    return rows + skipped
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from collections import OrderedDict
+
+DATABASE_FILE = 'results.sqlite3'
+
+
+def get_payload_size(payload):
+    """
+    Returns the approximate size in bytes of an analysis payload
+
+    Arguments:
+        payload (dict or bytes) - Analysis payload as returned by analysis.get_analysis, or binary data
+
+    Returns:
+        int
+    """
+    if isinstance(payload, bytes):
+        return len(payload)
+    return sum(len(key) + len(str(value)) for key, value in payload.items())
+
+
+class ResultCache:
+    """
+    Two level cache of analysis payloads
+    The first level is an in-memory LRU bounded by max_memory_bytes, private to the process. The second one is
+    a SQLite database in folder, bounded by max_disk_bytes and shared by every process of the server (e.g. the
+    gunicorn workers), so that a payload computed by one process is served by all of them. Keys are made of the
+    content hash of the chat and the analysis version, so identical chats share the same entry. Values are JSON
+    serializable data, or bytes (e.g. activity.ActivityCube.to_bytes) stored as they are.
+    Connections are opened for every access rather than kept, since SQLite connections must not cross a fork.
+    """
+
+    def __init__(self, folder, max_memory_bytes, max_disk_bytes):
+        self.folder = folder
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._database_ready = None  # path of the database once created by this process
+
+    @staticmethod
+    def get_key(content_hash, version):
+        return '{}-v{}'.format(content_hash, version)
+
+    def _connect(self):
+        path = os.path.join(self.folder, DATABASE_FILE)
+        # created again if the folder was removed since, e.g. by hand or by a benchmark
+        if self._database_ready != path or not os.path.exists(path):
+            os.makedirs(self.folder, exist_ok=True)
+            with closing(sqlite3.connect(path, timeout=30, isolation_level=None)) as connection:
+                connection.execute('PRAGMA journal_mode=WAL')  # readers don't wait for the writer
+                connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                   'size INTEGER NOT NULL, last_access REAL NOT NULL)')
+                connection.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+            self._database_ready = path
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return closing(connection)
+
+    def _remember(self, key, payload, size=None):
+        if size is None:
+            size = get_payload_size(payload)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (payload, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def get(self, key):
+        """
+        Returns the payload cached under key, or None if it isn't cached
+
+        Arguments:
+            key (str) - Cache key as returned by get_key
+
+        Returns:
+            dict, bytes or None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+        try:
+            with self._connect() as connection:
+                row = connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                # records the access for the eviction
+                connection.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+            payload = row[0] if isinstance(row[0], bytes) else json.loads(row[0])
+        except (sqlite3.Error, OSError, ValueError):
+            return None
+
+        self._remember(key, payload)
+        return payload
+
+    def set(self, key, payload):
+        """
+        Caches payload under key in memory and on disk, evicting the least recently used entries from the disk
+        until it fits in max_disk_bytes. Like get, it is best-effort: if the database can't be written, the
+        payload is only cached in memory.
+
+        Arguments:
+            key (str) - Cache key as returned by get_key
+            payload (dict or bytes) - JSON serializable analysis payload, or binary data
+        """
+        self._remember(key, payload)
+
+        value = payload if isinstance(payload, bytes) else json.dumps(payload)
+        try:
+            with self._connect() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                       (key, value, len(value), time.time()))
+                    total_bytes = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+                    if total_bytes > self.max_disk_bytes:
+                        evicted = []
+                        for evicted_key, size in connection.execute(
+                                'SELECT key, size FROM results WHERE key != ? ORDER BY last_access', (key,)):
+                            if total_bytes <= self.max_disk_bytes:
+                                break
+                            evicted.append((evicted_key,))
+                            total_bytes -= size
+                        connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+        except (sqlite3.Error, OSError):
+            pass
+
+    def remember(self, key, value, size):
+        """
+        Keeps value under key in the in-memory level only, within max_memory_bytes, e.g. an object decoded from a
+        cached value which is too costly to decode on every access. The value is shared by the threads of the
+        process, which must not modify it.
+
+        Arguments:
+            key (str) - Key of the value, distinct from those of the payloads
+            value - Any object
+            size (int) - Approximate size of value in bytes
+        """
+        self._remember(key, value, size)
+
+    def recall(self, key):
+        """
+        Returns the value kept under key by remember, or None if it was evicted or never kept
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        return None
+
+    def clear(self):
+        """
+        Empties the in-memory level of the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
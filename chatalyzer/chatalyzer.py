@@ -1,31 +1,89 @@
-import imp
-import pandas as pd
 import os
 import json
 import re
 import argparse
+import gc
 import sys
-import uuid
-from chatalyzer import analysis
+import gzip
 from datetime import datetime
-from tqdm import tqdm
-from flask import Flask, render_template, request, redirect, url_for, flash
-import uuid
+from flask import Blueprint, Flask, Request, current_app, has_app_context, render_template, request, redirect, \
+    url_for, flash, jsonify
+from chatalyzer import cache, compression, dialects, jobs, locks, metrics
+from chatalyzer.lazy import lazy_import, load
+
+# The pandas based analysis stack is loaded on first use, so that importing the web app, or running the CLI,
+# stays fast. See preload_analysis to load it before forking workers.
+activity = lazy_import('chatalyzer.activity')
+aggregates = lazy_import('chatalyzer.aggregates')
+analysis = lazy_import('chatalyzer.analysis')
+batch = lazy_import('chatalyzer.batch')
+emoji_scanner = lazy_import('chatalyzer.emoji_scanner')
+incremental = lazy_import('chatalyzer.incremental')
+parallel = lazy_import('chatalyzer.parallel')
+parsing = lazy_import('chatalyzer.parsing')
+serialization = lazy_import('chatalyzer.serialization')
+store = lazy_import('chatalyzer.store')
+tokenizer = lazy_import('chatalyzer.tokenizer')
+topk = lazy_import('chatalyzer.topk')
+upload_stream = lazy_import('chatalyzer.upload_stream')
+ANALYSIS_MODULES = (activity, aggregates, analysis, batch, emoji_scanner, incremental, parallel, parsing,
+                    serialization, store, tokenizer, topk, upload_stream)
 
 UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), "uploads")
-if not os.path.isdir(UPLOAD_FOLDER):
-    os.mkdir(UPLOAD_FOLDER)
 
-ALLOWED_EXTENSIONS = {'txt'}
-
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+RESULT_CACHE_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results")
+
+ALLOWED_EXTENSIONS = {'txt', 'zip'}
+
+# Settings of the apps returned by create_app
+DEFAULT_CONFIG = {
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'UPLOAD_FOLDER_MAX_BYTES': 2 * 1024 ** 3,
+    'UPLOAD_MAX_BYTES': 1024 ** 3,  # largest upload, and largest chat once unzipped
+    'COMPRESS_UPLOADS': True,  # stores uploaded chats compressed, see compression.CompressedChatWriter
+    'UPLOAD_COMPRESSION_LEVEL': compression.DEFAULT_LEVEL,
+    'RESULT_CACHE_FOLDER': RESULT_CACHE_FOLDER,
+    'RESULT_CACHE_MEMORY_BYTES': 64 * 1024 ** 2,
+    'RESULT_CACHE_DISK_BYTES': 512 * 1024 ** 2,
+    'CUBE_CACHE_MAX_BYTES': 8 * 1024 ** 2,  # larger activity cubes aren't cached, see cache_activity_cube
+    'STREAMING_MIN_BYTES': 64 * 1024 ** 2,  # chats this large are analyzed batch by batch
+    'STREAMING_BATCH_SIZE': 100000,
+    'ANALYSIS_WORKERS': 1,  # processes parsing and aggregating shards of a single chat
+    'PARALLEL_MIN_BYTES': 16 * 1024 ** 2,  # chats this large are sharded when ANALYSIS_WORKERS > 1
+    'ANALYSIS_JOBS': True,  # analyze uploads in background processes instead of inside the request
+    'ANALYSIS_JOB_WORKERS': 2,
+    'ANALYSIS_JOB_TIMEOUT': 30 * 60,  # seconds without progress after which a job is considered lost
+    'METRICS': False,  # per stage timings on /metrics and in the Server-Timing header of analysis pages
+    'METRICS_ALLOCATIONS': False,  # also traces the memory allocated by every stage (slow)
+    'INCREMENTAL_ANALYSIS': True,  # only aggregates the new messages of a longer export of a known chat
+    'INCREMENTAL_MIN_BYTES': 4 * 1024 ** 2,  # smaller chats are analyzed whole and their aggregates aren't saved
+    'TOP_K_MEMORY_BYTES': None,  # memory cap of each approximate word/emoji count when aggregating, None for exact
+    'COMPACT_CHATS': False,  # keeps parsed chats in the compact schema of analysis.compact_chats
+    'PROFILE_FOLDER': None,  # folder where a cProfile dump of every analysis computed is written
+    'API_GZIP_MIN_BYTES': 1024,  # smaller API responses aren't worth compressing
+    'TIMELINE_MAX_POINTS': 400,  # points per series of timelines requested with bucket=auto
+}
+
+views = Blueprint('views', __name__)
+
+_app = None  # app of chatalyzer.chatalyzer:app, see __getattr__
+_job_apps = {}  # apps of the background workers by config, see compute_analysis_job
 
 
 # chat parsing functions taken from https://towardsdatascience.com/build-your-own-whatsapp-chat-analyzer-9590acca9014
-def starts_with_date_time(s):
-    pattern = '^\[(\d\d\/\d\d\/\d\d), (\d\d:\d\d:\d\d|\d{1,2}:\d\d:\d\d PM|AM|am|pm)\] (.+): (.+)'
-    result = re.match(pattern, s)
+# The patterns are compiled once, a line costs a single match against the header pattern of its dialect
+AUTHOR_PATTERN = re.compile('^' + '|'.join([
+    r'([\w]+):',  # First Name
+    r'([\w]+[\s]+[\w]+):',  # First Name + Last Name
+    r'([\w]+[\s]+[\w]+[\s]+[\w]+):',  # First Name + Middle Name + Last Name
+    r'([+]\d{2} \d{5} \d{5}):',  # Mobile Number (India)
+    r'([+]\d{2} \d{3} \d{3} \d{4}):',  # Mobile Number (US)
+    r'([+]\d{2} \d{4} \d{7})'  # Mobile Number (Europe)
+]))
+
+
+def starts_with_date_time(s, dialect=dialects.DEFAULT_DIALECT):
+    result = dialect.header_pattern.match(s)
 
     if result:
         return True
@@ -33,23 +91,14 @@ def starts_with_date_time(s):
 
 
 def starts_with_author(s):
-    patterns = [
-        '([\w]+):',  # First Name
-        '([\w]+[\s]+[\w]+):',  # First Name + Last Name
-        '([\w]+[\s]+[\w]+[\s]+[\w]+):',  # First Name + Middle Name + Last Name
-        '([+]\d{2} \d{5} \d{5}):',  # Mobile Number (India)
-        '([+]\d{2} \d{3} \d{3} \d{4}):',  # Mobile Number (US)
-        '([+]\d{2} \d{4} \d{7})'  # Mobile Number (Europe)
-    ]
-    pattern = '^' + '|'.join(patterns)
-    result = re.match(pattern, s)
+    result = AUTHOR_PATTERN.match(s)
 
     if result:
         return True
     return False
 
 
-def get_data_point(line):
+def get_data_point(line, dialect=dialects.DEFAULT_DIALECT):
     # # line = 18/06/17, 22:47 - Loki: Why do you have 2 numbers, Banner?
     # split_line = line.split(' - ')  # split_line = ['18/06/17, 22:47', 'Loki: Why do you have 2 numbers, Banner?']
     # date_time = split_line[0]  # date_time = '18/06/17, 22:47'
@@ -64,8 +113,7 @@ def get_data_point(line):
     #     author = None
 
     #line [29/03/22, 15:11:29] Bruce Banner: It's automatic
-    pattern = '^\[(\d\d\/\d\d\/\d\d), (\d\d:\d\d:\d\d|\d{1,2}:\d\d:\d\d PM|AM|am|pm)\] (.+): (.+)'
-    matches = re.match(pattern,line)
+    matches = dialect.header_pattern.match(line)
     if matches:
         date,time,author,message = matches.groups()
         return date, time, author, message
@@ -75,8 +123,23 @@ def get_data_point(line):
 
 
 def get_chats(chatfile):
+    """
+    Returns a Pandas DataFrame ('Date', 'Time', 'Author', 'Message') of the messages in a chat file
+    See parsing.parse_chat_text for the single pass parser doing the work.
+    """
+    return parsing.get_chats(chatfile)
+
+
+def get_chats_per_line(chatfile):
+    """
+    Line by line reference implementation of get_chats, kept for comparisons and benchmarks
+    """
+    import pandas as pd
+    from tqdm import tqdm
+
     with open(chatfile, "r", encoding="utf-8") as in_file:  # storing the chat data in the variable lines
         lines = in_file.readlines()
+    dialect = dialects.detect_dialect(''.join(lines)[:dialects.SNIFF_CHARS]) or dialects.DEFAULT_DIALECT
 
     parsed_data = []  # list to keep track of data so it can be used by a Pandas dataframe
     pbar = tqdm(lines, desc="Reading chats")  # displaying a progress bar to show the amount of the chat data loaded
@@ -85,15 +148,13 @@ def get_chats(chatfile):
 
     for i, line in enumerate(pbar):
         line = line.strip()  # guarding against erroneous leading and trailing whitespaces
-        if starts_with_date_time(
-                line):  # if a line starts with a Date Time pattern, then this indicates the beginning of a new message
+        data_points = get_data_point(line, dialect)  # identify and extract tokens from the line
+        if data_points != False:  # if a line starts with a Date Time pattern, then this indicates the beginning of a new message
             if len(message_buffer) > 0:  # check if the message buffer contains characters from previous iterations
                 parsed_data.append([date, time, author, ' '.join(
                     message_buffer)])  # save the tokens from the previous message in parsed_data
             message_buffer.clear()  # clear the message buffer so that it can be used for the next message
-            data_points = get_data_point(line)  # identify and extract tokens from the line
-            if data_points != False:
-                date, time, author, message = data_points
+            date, time, author, message = data_points
             message_buffer.append(message)
         else:
             message_buffer.append(
@@ -106,55 +167,657 @@ def get_chats(chatfile):
     return df
 
 
+def parse_chats(chatfile):
+    """
+    Returns the DataFrame of chats with the 'Date Time', 'Letter Count' and 'Word Count' columns added,
+    in the compact schema of analysis.compact_chats if COMPACT_CHATS is set (in the current app, or in
+    DEFAULT_CONFIG outside of an app context)
+
+    Arguments:
+        chatfile (str) - Path of the raw chat file
+
+    Returns:
+        Pandas.DataFrame
+    """
+    return prepare_chats(get_chats(chatfile))
+
+
+def prepare_chats(df):
+    """
+    Adds the 'Date Time', 'Letter Count' and 'Word Count' columns to the messages returned by get_chats,
+    see parse_chats
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame ('Date', 'Time', 'Author', 'Message') of the messages
+
+    Returns:
+        Pandas.DataFrame
+    """
+    df = analysis.add_date_time(df)
+    df = analysis.add_letter_count(df)
+    df = analysis.add_word_count(df)
+    config = current_app.config if has_app_context() else DEFAULT_CONFIG
+    if config['COMPACT_CHATS']:
+        df = analysis.compact_chats(df)
+    return df
+
+
+def get_chat_path(analysis_id):
+    """
+    Returns the path of the uploaded chat of an analysis, compressed or not, see compression.find_chat
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str or None if the chat file doesn't exist
+    """
+    return compression.find_chat(current_app.config['UPLOAD_FOLDER'], analysis_id)
+
+
+def load_chats(analysis_id):
+    """
+    Returns the parsed chats of an analysis, reading them from the chat store when it is up to date
+    and parsing the raw chat file (and refreshing the store) otherwise
+    Parsing holds the 'parse' lock of the analysis, so that concurrent requests from several workers parse
+    the chat once and the others read the store it wrote.
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        Pandas.DataFrame or None if the chat file doesn't exist
+    """
+    file_path = get_chat_path(analysis_id)
+    if file_path is None:
+        return None
+
+    store_path = store.get_store_path(current_app.config['UPLOAD_FOLDER'], analysis_id)
+    df = store.load_chats(store_path, file_path)
+    if df is None:
+        with locks.file_lock(locks.get_lock_path(current_app.config['UPLOAD_FOLDER'], analysis_id, 'parse')):
+            df = store.load_chats(store_path, file_path)  # parsed by another worker while this one waited
+            if df is None:
+                df = parse_chats(file_path)
+                store.save_chats(df, store_path, file_path)
+    return df
+
+
+def get_content_hash(analysis_id):
+    """
+    Returns the content hash of the chat file of an analysis, read from the chat store when possible
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str or None if the chat file doesn't exist
+    """
+    file_path = get_chat_path(analysis_id)
+    if file_path is None:
+        return None
+
+    meta = store.read_meta(store.get_store_path(current_app.config['UPLOAD_FOLDER'], analysis_id), file_path)
+    if meta is not None:
+        return meta['content_hash']
+    return store.get_content_hash(file_path)
+
+
+def get_result_cache():
+    """
+    Returns the result cache of the current app, see create_app
+
+    Returns:
+        cache.ResultCache
+    """
+    return current_app.extensions['result_cache']
+
+
+def get_cached_analysis(analysis_id):
+    """
+    Returns the cached analysis payload of an analysis without computing anything
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        dict or None if the chat file doesn't exist or its analysis isn't cached yet
+    """
+    result_cache = get_result_cache()
+    content_hash = get_content_hash(analysis_id)
+    if content_hash is None:
+        return None
+    return result_cache.get(cache.ResultCache.get_key(content_hash, analysis.ANALYSIS_VERSION))
+
+
+def get_cube_key(content_hash):
+    """
+    Returns the result cache key of the activity cube of a chat, see analysis.get_activity_cube
+    """
+    return cache.ResultCache.get_key(content_hash, analysis.ANALYSIS_VERSION) + '-cube'
+
+
+def cache_activity_cube(content_hash, cube):
+    """
+    Caches the activity cube of a chat in its compact binary form, see activity.ActivityCube.to_bytes
+    A cube larger than CUBE_CACHE_MAX_BYTES isn't cached, only its size is, so that get_activity_cube builds it
+    from the parsed chats instead of filling the cache with it.
+
+    Arguments:
+        content_hash (str) - Content hash of the chat file, see get_content_hash
+        cube (activity.ActivityCube) - Activity cube of the chat
+    """
+    data = cube.to_bytes()
+    if len(data) > current_app.config['CUBE_CACHE_MAX_BYTES']:
+        data = {'size': len(data)}
+    get_result_cache().set(get_cube_key(content_hash), data)
+
+
+def get_top_k_capacity():
+    """
+    Returns the number of words and emojis held by the approximate counts of aggregated chats, None for exact
+    counts, see TOP_K_MEMORY_BYTES and aggregates.ChatAggregates
+    """
+    memory_bytes = current_app.config['TOP_K_MEMORY_BYTES']
+    return None if memory_bytes is None else topk.get_capacity(memory_bytes)
+
+
+@metrics.instrumented
+def compute_analysis(analysis_id, report=None):
+    """
+    Computes and caches the analysis payload rendered by show_analysis
+    Chats of at least PARALLEL_MIN_BYTES are aggregated by shards on ANALYSIS_WORKERS processes when there is
+    more than one worker. Otherwise, chats of at least STREAMING_MIN_BYTES are aggregated batch by batch
+    instead of being loaded whole. With INCREMENTAL_ANALYSIS, the aggregates of chats of at least
+    INCREMENTAL_MIN_BYTES which have a fingerprint (see incremental.get_fingerprint) are saved, and a longer export
+    of an already analyzed chat only has its new messages aggregated and merged into the saved aggregates. Aggregated
+    chats have their words and emojis counted within TOP_K_MEMORY_BYTES when it is set.
+    The computation holds the 'analysis' lock of the analysis, and a payload cached by another worker in the
+    meantime is returned as is, so that concurrent requests compute the analysis once. The activity cube of the
+    chat is cached along with the payload, for the API to answer date ranges of the chat from it.
+    A cProfile of the computation is dumped to PROFILE_FOLDER when it is set.
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+        report (callable, default None) - Called with (state, progress) as the analysis goes on, see jobs.run_job
+
+    Returns:
+        dict or None if the chat file doesn't exist
+    """
+    config = current_app.config
+    result_cache = get_result_cache()
+    if report is None:
+        report = lambda state, progress: None
+
+    content_hash = get_content_hash(analysis_id)
+    if content_hash is None:
+        return None
+
+    key = cache.ResultCache.get_key(content_hash, analysis.ANALYSIS_VERSION)
+    with locks.file_lock(locks.get_lock_path(config['UPLOAD_FOLDER'], analysis_id, 'analysis')):
+        payload = result_cache.get(key)
+        if payload is not None and result_cache.get(get_cube_key(content_hash)) is not None:
+            return payload  # computed by another worker while this one waited
+
+        with metrics.profile(config['PROFILE_FOLDER'], analysis_id):
+            file_path = get_chat_path(analysis_id)
+            file_size = compression.get_chat_size(file_path)
+            workers = config['ANALYSIS_WORKERS']
+            incremental_analysis = config['INCREMENTAL_ANALYSIS'] and file_size >= config['INCREMENTAL_MIN_BYTES']
+            capacity = get_top_k_capacity()
+            progress = lambda p: report(jobs.STATE_PARSING, 0.9 * p)
+            report(jobs.STATE_PARSING, 0.0)
+
+            fingerprint, previous, date_time_format = None, None, None
+            if incremental_analysis:
+                fingerprint = incremental.get_fingerprint(file_path)
+                previous = incremental.find_previous_analysis(config['UPLOAD_FOLDER'], file_path, fingerprint)
+                incremental_analysis = fingerprint is not None  # too few messages to be recognized in a later export
+
+            if previous is not None:
+                chat_aggregates = incremental.aggregate_new_messages(
+                    file_path, previous, config['STREAMING_BATCH_SIZE'], progress=progress)
+                date_time_format = previous[2]
+                report(jobs.STATE_AGGREGATING, 0.9)
+            elif workers > 1 and file_size >= config['PARALLEL_MIN_BYTES']:
+                chat_aggregates = parallel.aggregate_chat_file(file_path, workers, config['STREAMING_BATCH_SIZE'],
+                                                               progress=progress, capacity=capacity)
+                report(jobs.STATE_AGGREGATING, 0.9)
+            elif file_size >= config['STREAMING_MIN_BYTES']:
+                chat_aggregates = aggregates.aggregate_chat_file(file_path, config['STREAMING_BATCH_SIZE'],
+                                                                 progress=progress, capacity=capacity)
+                report(jobs.STATE_AGGREGATING, 0.9)
+            elif incremental_analysis:  # aggregated rather than analyzed directly so that the aggregates can be saved
+                df = load_chats(analysis_id)
+                report(jobs.STATE_AGGREGATING, 0.5)
+                chat_aggregates = aggregates.ChatAggregates(capacity)
+                chat_aggregates.update(df)
+            else:
+                df = load_chats(analysis_id)
+                report(jobs.STATE_AGGREGATING, 0.5)
+                chat_aggregates = None
+                cube = analysis.get_activity_cube(df)
+                payload = analysis.get_analysis(df, cube)
+
+            if chat_aggregates is not None:
+                cube = chat_aggregates.cube
+                payload = chat_aggregates.get_analysis()
+            if incremental_analysis:
+                if date_time_format is None:
+                    date_time_format = aggregates.detect_date_format(file_path)
+                incremental.save_aggregates(config['UPLOAD_FOLDER'], analysis_id, chat_aggregates, fingerprint,
+                                            content_hash, file_size, date_time_format)
+
+        cache_activity_cube(content_hash, cube)
+        result_cache.set(key, payload)
+    return payload
+
+
+def get_analysis(analysis_id):
+    """
+    Returns the analysis payload rendered by show_analysis, computing it in the current process on a cache miss
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        dict or None if the chat file doesn't exist
+    """
+    payload = get_cached_analysis(analysis_id)
+    if payload is None:
+        payload = compute_analysis(analysis_id)
+    return payload
+
+
+def get_metric_key(content_hash, metric, bucket, start=None, end=None, data_format='rows'):
+    """
+    Returns the result cache key, also used as ETag, of a metric served by the API
+    """
+    key = '{}-{}-{}'.format(cache.ResultCache.get_key(content_hash, analysis.ANALYSIS_VERSION), metric, bucket)
+    if start is not None or end is not None:
+        key += '-{}-{}'.format(start, end)
+    if data_format != serialization.FORMAT_ROWS:
+        key += '-' + data_format
+    return key
+
+
+def get_activity_cube(analysis_id, content_hash, start=None, end=None):
+    """
+    Returns the activity cube of an analysis, or of a date range of it, cached by compute_analysis
+    The cached cube is decoded once per process, see decode_activity_cube, and ranges are views on it. On a cache
+    miss, the cube of chats smaller than STREAMING_MIN_BYTES is built from the loaded chats, larger ones get their
+    whole analysis computed, or queued when ANALYSIS_JOBS is set. Cubes too large to be cached are built from the
+    loaded chats every time.
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+        content_hash (str) - Content hash of the chat file, see get_content_hash
+        start (datetime.date, default None) - First day of the range, the first day of the chat if None
+        end (datetime.date, default None) - Last day of the range, the last day of the chat if None
+
+    Returns:
+        activity.ActivityCube or None if the analysis got queued
+    """
+    result_cache = get_result_cache()
+    key = get_cube_key(content_hash)
+    data = result_cache.get(key)
+    if data is None:
+        if compression.get_chat_size(get_chat_path(analysis_id)) < current_app.config['STREAMING_MIN_BYTES']:
+            cube = analysis.get_activity_cube(load_chats(analysis_id))
+            cache_activity_cube(content_hash, cube)
+            return cube.select(start, end)
+        elif current_app.config['ANALYSIS_JOBS']:
+            status = get_job_status(analysis_id)
+            if status is None or status['state'] == jobs.STATE_DONE or status['lost']:
+                submit_analysis(analysis_id)
+            return None
+        else:
+            compute_analysis(analysis_id)
+            data = result_cache.get(key)
+    if isinstance(data, bytes):
+        return decode_activity_cube(content_hash, data).select(start, end)
+    return analysis.get_activity_cube(load_chats(analysis_id)).select(start, end)  # too large to be cached
+
+
+def decode_activity_cube(content_hash, data):
+    """
+    Returns the activity cube cached by cache_activity_cube, decoded once per process and kept in the memory
+    level of the result cache while it fits there, since every metric of the analysis page is reduced from it
+
+    Arguments:
+        content_hash (str) - Content hash of the chat file, see get_content_hash
+        data (bytes) - Cached cube, see activity.ActivityCube.to_bytes
+
+    Returns:
+        activity.ActivityCube - Shared with the other requests, not to be modified
+    """
+    result_cache = get_result_cache()
+    key = get_cube_key(content_hash) + '-decoded'
+    cube = result_cache.recall(key)
+    if cube is None:
+        cube = activity.ActivityCube.from_bytes(data)
+        result_cache.remember(key, cube, cube.nbytes)
+    return cube
+
+
+def get_metric_body(analysis_id, content_hash, metric, bucket, start=None, end=None, data_format='rows'):
+    """
+    Returns the body served by the API for a metric of an analysis, cached separately from the payload
+    The metric is sliced from the cached payload when there is one. Otherwise, chats smaller than
+    STREAMING_MIN_BYTES are loaded and only the metric requested is computed, larger ones get their whole
+    analysis computed, or queued when ANALYSIS_JOBS is set.
+    Metrics of a date range of the chat are reduced from the range of its activity cube, see get_activity_cube.
+    The columnar and binary formats are built from the DataFrames of the metric, see get_metric_columnar.
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+        content_hash (str) - Content hash of the chat file, see get_content_hash
+        metric (str) - One of analysis.METRICS, one of analysis.ACTIVITY_METRICS if start or end is given
+        bucket (str) - Key of analysis.TIMELINE_BUCKETS or 'auto' for timelines, 'day' for other metrics
+        start (datetime.date, default None) - First day of the range, the first day of the chat if None
+        end (datetime.date, default None) - Last day of the range, the last day of the chat if None
+        data_format (str, default 'rows') - One of serialization.FORMATS, see serialization.can_encode for the
+            binary ones
+
+    Returns:
+        str (JSON formats), bytes (binary formats) or None if the analysis got queued
+    """
+    result_cache = get_result_cache()
+    key = get_metric_key(content_hash, metric, bucket, start, end, data_format)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached if isinstance(cached, bytes) else cached['body']
+    body = build_metric_body(analysis_id, content_hash, metric, bucket, start, end, data_format)
+    if body is not None:
+        result_cache.set(key, body if isinstance(body, bytes) else {'body': body})
+    return body
+
+
+def build_metric_body(analysis_id, content_hash, metric, bucket, start=None, end=None, data_format='rows'):
+    """
+    Returns the body of get_metric_body, without looking it up in the result cache nor caching it
+    """
+    if data_format != serialization.FORMAT_ROWS:
+        data = get_metric_columnar(analysis_id, content_hash, metric, start, end)
+        if data is None:
+            return None
+        if metric in analysis.TIMELINE_METRICS:
+            if bucket == 'auto':
+                bucket = analysis.get_columnar_timeline_bucket(data, current_app.config['TIMELINE_MAX_POINTS'])
+            data = analysis.downsample_columnar_timeline(data, bucket)
+        else:
+            bucket = None
+        if data_format == serialization.FORMAT_COLUMNAR:
+            return '{{"metric": {}, "bucket": {}, "format": {}, "data": {}}}'.format(
+                json.dumps(metric), json.dumps(bucket), json.dumps(data_format), serialization.to_compact_json(data))
+        return serialization.encode({'metric': metric, 'bucket': bucket, 'data': data}, data_format)
+
+    payload = get_cached_analysis(analysis_id)
+    if start is not None or end is not None:
+        cube = get_activity_cube(analysis_id, content_hash, start, end)
+        if cube is None:
+            return None
+        value = analysis.ACTIVITY_METRICS[metric](cube)
+    elif payload is not None:
+        value = payload[metric]
+    else:
+        if compression.get_chat_size(get_chat_path(analysis_id)) < current_app.config['STREAMING_MIN_BYTES']:
+            value = analysis.get_metric(load_chats(analysis_id), metric)
+        elif current_app.config['ANALYSIS_JOBS']:
+            status = get_job_status(analysis_id)
+            if status is None or status['state'] == jobs.STATE_DONE or status['lost']:
+                submit_analysis(analysis_id)
+            return None
+        else:
+            value = compute_analysis(analysis_id)[metric]
+
+    data = value if isinstance(value, str) else analysis.to_json(value)
+    if metric in analysis.TIMELINE_METRICS:
+        by_author = analysis.TIMELINE_METRICS[metric]
+        timeline = json.loads(data)
+        if bucket == 'auto':
+            bucket = analysis.get_timeline_bucket(timeline, by_author, current_app.config['TIMELINE_MAX_POINTS'])
+        if bucket != 'day':
+            data = analysis.to_json(analysis.downsample_timeline(timeline, bucket, by_author))
+    else:
+        bucket = None
+    return '{{"metric": {}, "bucket": {}, "data": {}}}'.format(json.dumps(metric), json.dumps(bucket), data)
+
+
+def get_metric_columnar(analysis_id, content_hash, metric, start=None, end=None):
+    """
+    Returns a metric of an analysis, or of a date range of it, as the parallel arrays of
+    serialization.to_columnar, built from its DataFrames rather than from its json rows
+    Metrics of the activity cube are reduced from the cached cube when there is one (see decode_activity_cube),
+    the word and emoji metrics are small enough to be read from the cached payload. Only the metrics of a whole
+    chat whose cube was too large to be cached are converted from the rows of its payload, rather than having
+    the cube built again from the chats.
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+        content_hash (str) - Content hash of the chat file, see get_content_hash
+        metric (str) - One of analysis.METRICS, one of analysis.ACTIVITY_METRICS if start or end is given
+        start (datetime.date, default None) - First day of the range, the first day of the chat if None
+        end (datetime.date, default None) - Last day of the range, the last day of the chat if None
+
+    Returns:
+        dict (int for 'num_msgs') or None if the analysis got queued
+    """
+    payload = get_cached_analysis(analysis_id)
+    if metric in analysis.ACTIVITY_METRICS:
+        data = get_result_cache().get(get_cube_key(content_hash))
+        if isinstance(data, bytes):
+            cube = decode_activity_cube(content_hash, data).select(start, end)
+            return analysis.get_metric_columnar(None, metric, cube)
+        if start is not None or end is not None or payload is None:
+            cube = get_activity_cube(analysis_id, content_hash, start, end)
+            return None if cube is None else analysis.get_metric_columnar(None, metric, cube)
+    elif payload is None:
+        if compression.get_chat_size(get_chat_path(analysis_id)) < current_app.config['STREAMING_MIN_BYTES']:
+            return analysis.get_metric_columnar(load_chats(analysis_id), metric)
+        if current_app.config['ANALYSIS_JOBS']:
+            status = get_job_status(analysis_id)
+            if status is None or status['state'] == jobs.STATE_DONE or status['lost']:
+                submit_analysis(analysis_id)
+            return None
+        payload = compute_analysis(analysis_id)
+
+    value = payload[metric]
+    if metric in analysis.METRIC_LAYOUTS:
+        return serialization.to_columnar(json.loads(value), *analysis.METRIC_LAYOUTS[metric])
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def make_api_response(body, etag, mimetype='application/json'):
+    """
+    Returns the response of an API body, tagged with etag and gzipped when the client accepts it
+    """
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # revalidated with the ETag on every use
+    response.vary.add('Accept-Encoding')
+    if len(response.data) >= current_app.config['API_GZIP_MIN_BYTES'] and request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(response.data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def get_job_status(analysis_id):
+    """
+    Returns the status of the background analysis job of an analysis
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        dict ('state', 'progress', 'error', 'lost') or None if no job was submitted
+    """
+    status_path = jobs.get_status_path(current_app.config['UPLOAD_FOLDER'], analysis_id)
+    return jobs.read_status(status_path, current_app.config['ANALYSIS_JOB_TIMEOUT'])
+
+
+def submit_analysis(analysis_id):
+    """
+    Queues the analysis of an uploaded chat on the background workers
+
+    Arguments:
+        analysis_id (str) - Id of the analysis
+    """
+    status_path = jobs.get_status_path(current_app.config['UPLOAD_FOLDER'], analysis_id)
+    config = {key: current_app.config[key] for key in DEFAULT_CONFIG}
+    jobs.submit(status_path, compute_analysis_job, (config, analysis_id), current_app.config['ANALYSIS_JOB_WORKERS'])
+
+
+def compute_analysis_job(config, analysis_id, report=None):
+    """
+    Runs compute_analysis in a background worker, within an app configured like the one which submitted the job
+    The app of every config is created once per worker process.
+
+    Arguments:
+        config (dict) - Settings of the submitting app, see DEFAULT_CONFIG
+        analysis_id (str) - Id of the analysis
+        report (callable, default None) - See compute_analysis
+
+    Returns:
+        dict or None if the chat file doesn't exist
+    """
+    key = json.dumps(config, sort_keys=True, default=str)
+    if key not in _job_apps:
+        _job_apps[key] = create_app(config)
+    with _job_apps[key].app_context():
+        return compute_analysis(analysis_id, report)
+
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@app.route('/analysis/<analysis_id>')
+class UploadRequest(Request):
+    """
+    Request streaming the chats uploaded to upload_file into an upload_stream.ChatUpload as the body arrives,
+    instead of spooling them to a temporary file first
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == 'views.upload_file' and filename and allowed_file(filename):
+            config = current_app.config
+            return upload_stream.ChatUpload(config['UPLOAD_FOLDER'], filename, config['UPLOAD_MAX_BYTES'],
+                                            config['STREAMING_MIN_BYTES'], config['COMPRESS_UPLOADS'],
+                                            config['UPLOAD_COMPRESSION_LEVEL'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+@views.before_app_request
+def start_metrics():
+    config = {'enabled': current_app.config['METRICS'], 'allocations': current_app.config['METRICS_ALLOCATIONS']}
+    if config != metrics.get_config():
+        metrics.configure(**config)
+    metrics.start_request()
+
+
+@views.after_app_request
+def add_server_timing(response):
+    timings = metrics.get_request_timings()
+    if timings and request.endpoint in ('views.show_analysis', 'views.show_metric'):
+        response.headers['Server-Timing'] = metrics.get_server_timing(timings)
+    return response
+
+
+@views.route('/metrics')
+def show_metrics():
+    if not current_app.config['METRICS']:
+        return 'Metrics are disabled', 404
+    return metrics.get_prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@views.route('/analysis/<analysis_id>')
 def show_analysis(analysis_id):
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], analysis_id) + '.txt'
-    if os.path.isfile(file_path):
-        df = get_chats(file_path)
-        df = analysis.add_date_time(df)
-        df = analysis.add_letter_count(df)
-        df = analysis.add_word_count(df)
-
-        top_message_senders = json.dumps(analysis.get_top_message_senders(df, -1).values.tolist())
-        top_media_senders = json.dumps(analysis.get_top_media_senders(df, -1).values.tolist())
-        word_count = json.dumps(analysis.get_top_x_count(df, analysis.KEY_WORD_COUNT, -1).values.tolist())
-        letter_count = json.dumps(analysis.get_top_x_count(df, analysis.KEY_LETTER_COUNT, -1).values.tolist())
-        busiest_days = analysis.get_busy_x(df, analysis.KEY_DATE, -1)
-        daywise_message_count = busiest_days.sort_values("Busy X")
-        daywise_message_count = json.dumps(daywise_message_count.values.tolist(), cls=analysis.DateTimeEncoder)
-        most_used_words = json.dumps(analysis.get_most_used_words(df, 40).values.tolist())
-        most_used_emojis = json.dumps(analysis.get_most_used_emojis(df).values.tolist())
-
-        authorwise_daywise_message_count = analysis.get_busy_x_authorwise(df, analysis.KEY_DATE, -1,return_json=True)
-        authorwise_busiest_time = analysis.get_busy_x_authorwise(df, analysis.KEY_HOUR, -1, return_json=True, add_cumulative=False)
-        return render_template('chat_analysis.html',
-                                authorwise_busiest_time=authorwise_busiest_time,
-                               authorwise_daywise_message_count=authorwise_daywise_message_count,
-                               num_msgs=df.shape[0],
-                               daywise_message_count=daywise_message_count,
-                               letter_count=letter_count,
-                               word_count=word_count,
-                               top_message_senders=top_message_senders,
-                               top_media_senders=top_media_senders,
-                               most_used_words=most_used_words,
-                               most_used_emojis=most_used_emojis)
-    else:
+    if not current_app.config['ANALYSIS_JOBS']:
+        payload = get_analysis(analysis_id)
+        if payload is not None:
+            return render_template('chat_analysis.html', analysis_id=analysis_id, num_msgs=payload['num_msgs'],
+                                   range_metrics=list(analysis.ACTIVITY_METRICS))
         return render_template('chat_unavailable.html')
 
+    payload = get_cached_analysis(analysis_id)
+    if payload is not None:
+        return render_template('chat_analysis.html', analysis_id=analysis_id, num_msgs=payload['num_msgs'],
+                               range_metrics=list(analysis.ACTIVITY_METRICS))
+
+    if get_chat_path(analysis_id) is None:
+        return render_template('chat_unavailable.html')
 
-@app.route('/uploader', methods=['GET', 'POST'])
+    status = get_job_status(analysis_id)
+    # never analyzed, cached result evicted since or worker lost
+    if status is None or status['state'] == jobs.STATE_DONE or status['lost']:
+        submit_analysis(analysis_id)
+        status = get_job_status(analysis_id)
+    return render_template('chat_processing.html', analysis_id=analysis_id, status=status)
+
+
+@views.route('/status/<analysis_id>')
+def show_status(analysis_id):
+    status = get_job_status(analysis_id)
+    if status is None:
+        return jsonify({'state': None, 'progress': 0.0, 'error': 'Unknown analysis', 'lost': False}), 404
+    return jsonify(status)
+
+
+@views.route('/api/analysis/<analysis_id>/<metric>')
+def show_metric(analysis_id, metric):
+    if metric not in analysis.METRICS:
+        return jsonify({'error': 'Unknown metric'}), 404
+    bucket = request.args.get('bucket', 'day')
+    if bucket != 'auto' and bucket not in analysis.TIMELINE_BUCKETS:
+        return jsonify({'error': 'Unknown bucket'}), 400
+    if metric not in analysis.TIMELINE_METRICS:
+        bucket = 'day'
+    try:
+        start, end = [datetime.strptime(request.args[arg], '%Y-%m-%d').date() if request.args.get(arg) else None
+                      for arg in ('start', 'end')]
+    except ValueError:
+        return jsonify({'error': 'Dates must be given as YYYY-MM-DD'}), 400
+    if (start is not None or end is not None) and metric not in analysis.ACTIVITY_METRICS:
+        return jsonify({'error': 'This metric has no date range'}), 400
+    data_format = request.args.get('format', serialization.FORMAT_ROWS)
+    if data_format not in serialization.FORMATS:
+        return jsonify({'error': 'Unknown format'}), 400
+    if not serialization.can_encode(data_format):
+        return jsonify({'error': 'The {} format needs the {} package installed'.format(
+            data_format, serialization.FORMAT_MODULES[data_format])}), 406
+    if data_format == serialization.FORMAT_ARROW and metric in analysis.NESTED_METRICS:
+        return jsonify({'error': 'This metric has no {} format'.format(data_format)}), 406
+
+    content_hash = get_content_hash(analysis_id)
+    if content_hash is None:
+        return jsonify({'error': 'Unknown analysis'}), 404
+    etag = get_metric_key(content_hash, metric, bucket, start, end, data_format)
+    if etag in request.if_none_match:  # checked before computing anything
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    body = get_metric_body(analysis_id, content_hash, metric, bucket, start, end, data_format)
+    if body is None:
+        return jsonify(get_job_status(analysis_id)), 202, {'Retry-After': '1'}
+    return make_api_response(body, etag, serialization.FORMATS[data_format])
+
+
+@views.route('/uploader', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
+        config = current_app.config
+        try:
+            files = request.files  # the upload is parsed as it is received
+        except upload_stream.UploadError as error:
+            return render_template('index.html', error=str(error)), error.status
+
         # check if the post request has the file part
-        if 'file' not in request.files:
+        if 'file' not in files:
             flash('No file part')
             return redirect(request.url)
-        file = request.files['file']
+        file = files['file']
 
         # if user does not select file, browser also
         # submit an empty part without filename
@@ -163,23 +826,137 @@ def upload_file():
             return redirect(request.url)
 
         if file and allowed_file(file.filename):
-            # filename = secure_filename(file.filename)
-            analysis_id = uuid.uuid4().hex
-            filename = analysis_id + '.txt'
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            return redirect(url_for('show_analysis', analysis_id=analysis_id))
-
-
-@app.route('/')
+            upload = file.stream
+            try:
+                df = upload.finish()
+            except upload_stream.UploadError as error:
+                return render_template('index.html', error=str(error)), error.status
+
+            analysis_id = upload.analysis_id
+            if df is not None:  # saves the messages parsed during the upload so that the chat isn't read again
+                store.save_chats(prepare_chats(df), store.get_store_path(config['UPLOAD_FOLDER'], analysis_id),
+                                 upload.path, content_hash=upload.content_hash)
+            if config['ANALYSIS_JOBS']:
+                submit_analysis(analysis_id)
+            else:
+                get_analysis(analysis_id)  # builds the cached result so that views are cheap
+            store.evict_uploads(config['UPLOAD_FOLDER'], config['UPLOAD_FOLDER_MAX_BYTES'],
+                                keep=[analysis_id])
+            return redirect(url_for('views.show_analysis', analysis_id=analysis_id))
+
+
+@views.route('/')
 def index():
     return render_template("index.html")
 
 
+def preload_analysis():
+    """
+    Loads the analysis stack and builds the emoji scanner and tokenizer it shares within a process, which are
+    otherwise loaded by the first analysis of every process
+    Called before forking (gunicorn --preload), the forked workers share them copy-on-write. The objects loaded
+    are moved out of the reach of the garbage collector (gc.freeze), whose collections would otherwise write to
+    them and copy their memory pages in every worker.
+    """
+    for module in ANALYSIS_MODULES:
+        load(module)
+    emoji_scanner.get_scanner()
+    tokenizer.get_tokenizer()
+    gc.freeze()
+
+
+def create_app(config=None, preload=False):
+    """
+    Returns a web app, creating its upload folder and result cache
+    Nothing is created when importing this module: the app served as chatalyzer.chatalyzer:app is created on
+    first access, see __getattr__.
+
+    Arguments:
+        config (dict, default None) - Settings overriding DEFAULT_CONFIG
+        preload (bool, default False) - If True, the analysis stack is loaded before returning, see
+            preload_analysis, e.g. gunicorn --preload "chatalyzer.chatalyzer:create_app(preload=True)"
+
+    Returns:
+        flask.Flask
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    app.request_class = UploadRequest
+    app.register_blueprint(views)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.extensions['result_cache'] = cache.ResultCache(app.config['RESULT_CACHE_FOLDER'],
+                                                       app.config['RESULT_CACHE_MEMORY_BYTES'],
+                                                       app.config['RESULT_CACHE_DISK_BYTES'])
+    if preload:
+        preload_analysis()
+    return app
+
+
+def __getattr__(name):
+    # chatalyzer.chatalyzer:app, the app with the default settings, created on first access
+    global _app
+    if name != 'app':
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    if _app is None:
+        _app = create_app()
+    return _app
+
+
 def main():
-    app.config.update(
-        TESTING=True,
-        # SECRET_KEY=b'_5#y2L"F4Q8z\n\xec]/'
-    )
+    parser = argparse.ArgumentParser(description="WhatsApp Chat Analyzer")
+    parser.add_argument('--workers', type=int, default=DEFAULT_CONFIG['ANALYSIS_WORKERS'],
+                        help="number of processes parsing and aggregating a single chat")
+    parser.add_argument('--metrics', action='store_true',
+                        help="record per stage timings, served on /metrics and as Server-Timing headers")
+    parser.add_argument('--profile-folder', default=DEFAULT_CONFIG['PROFILE_FOLDER'],
+                        help="folder where a cProfile dump of every analysis computed is written")
+    subparsers = parser.add_subparsers(dest='command', metavar='command',
+                                       help="'analyze' to analyze chat files offline, "
+                                            "the web app is started if omitted")
+    analyze_parser = subparsers.add_parser('analyze', help="analyze chat exports without the web app",
+                                           description="Analyze many chat exports concurrently, writing the "
+                                                       "results show_analysis renders as JSON files")
+    analyze_parser.add_argument('paths', nargs='+',
+                                help="chat files, or directories searched for *.txt and *.txtz chats")
+    analyze_parser.add_argument('--out', required=True, help="folder of the JSON results and of the summary")
+    analyze_parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="number of worker processes")
+    analyze_parser.add_argument('--summary-format', choices=batch.SUMMARY_FORMATS, default='csv')
+    analyze_parser.add_argument('--skip-existing', action='store_true',
+                                help="skip the chats whose result is newer than the chat")
+    migrate_parser = subparsers.add_parser('migrate-uploads', help="compress the plain chats of the upload folder",
+                                           description="Compress the plain chat files of the upload folder "
+                                                       "into the seekable format uploads are now stored in")
+    migrate_parser.add_argument('--upload-folder', default=DEFAULT_CONFIG['UPLOAD_FOLDER'])
+    migrate_parser.add_argument('--level', type=int, default=DEFAULT_CONFIG['UPLOAD_COMPRESSION_LEVEL'],
+                                choices=range(1, 10), metavar='{1..9}', help="zlib compression level")
+    args = parser.parse_args()
+
+    if args.command == 'migrate-uploads':
+        migrated = store.migrate_uploads(args.upload_folder, args.level) if os.path.isdir(args.upload_folder) else []
+        plain_bytes = sum(plain_size for _, plain_size, _ in migrated)
+        compressed_bytes = sum(compressed_size for _, _, compressed_size in migrated)
+        print('{} chats compressed: {:,.1f} MiB -> {:,.1f} MiB'.format(
+            len(migrated), plain_bytes / 1024 ** 2, compressed_bytes / 1024 ** 2))
+        return
+
+    if args.command == 'analyze':
+        if args.summary_format == 'parquet' and not batch.can_write_parquet():
+            analyze_parser.error("a parquet summary needs pyarrow or fastparquet installed")
+        for path in args.paths:
+            if not os.path.exists(path):
+                analyze_parser.error("no such file or directory: {}".format(path))
+        rows = batch.analyze(args.paths, args.out, args.jobs, args.summary_format, args.skip_existing,
+                             DEFAULT_CONFIG['STREAMING_MIN_BYTES'], DEFAULT_CONFIG['STREAMING_BATCH_SIZE'])
+        sys.exit(0 if all(row['status'] != 'error' for row in rows) else 1)
+
+    app = create_app({
+        'TESTING': True,
+        'ANALYSIS_WORKERS': args.workers,
+        'METRICS': args.metrics or DEFAULT_CONFIG['METRICS'],
+        'PROFILE_FOLDER': args.profile_folder,
+        # 'SECRET_KEY': b'_5#y2L"F4Q8z\n\xec]/'
+    }, preload=True)
 
     app.run(debug=True)
 
@@ -0,0 +1,292 @@
+import io
+import os
+import re
+import zlib
+import uuid
+import bisect
+import struct
+
+CHAT_SUFFIX = '.txt'
+COMPRESSED_SUFFIX = '.txtz'
+
+# Layout of a compressed chat: MAGIC, the zlib frames one after the other, the index of the frames (one
+# INDEX_ENTRY each) and the FOOTER. Every frame is compressed on its own so that any offset of the chat
+# can be read by decompressing the single frame containing it.
+MAGIC = b'CHATZ\x00\x01\n'
+INDEX_ENTRY = struct.Struct('<QQII')  # offset in the chat, offset in the file, compressed size, size
+FOOTER = struct.Struct('<QQI8s')  # offset of the index, size of the chat, number of frames, MAGIC
+
+FRAME_BYTES = 1024 * 1024
+DEFAULT_LEVEL = 1  # compresses faster than chats are parsed, see benchmarks/bench_compression.py
+
+# Frames start at lines looking like a message header, '[29/03/22, ...' or '29/03/22, ...', so that they
+# split no message in most chats. Reading doesn't rely on it.
+FRAME_START_PATTERN = re.compile(rb'^[^\S\n]*\[?\d', re.M)
+
+
+def is_compressed(path):
+    """
+    Returns True if path is a compressed chat, judging by its suffix
+    """
+    return path.endswith(COMPRESSED_SUFFIX)
+
+
+def find_chat(upload_folder, analysis_id):
+    """
+    Returns the path of the uploaded chat of an analysis, compressed or not
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str or None if the chat doesn't exist
+    """
+    for suffix in (COMPRESSED_SUFFIX, CHAT_SUFFIX):
+        path = os.path.join(upload_folder, analysis_id) + suffix
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_index(in_file):
+    """
+    Returns the size of a compressed chat and the index of its frames
+
+    Arguments:
+        in_file (file) - Compressed chat opened in binary mode
+
+    Returns:
+        (int, list) - Size of the chat and (offset in the chat, offset in the file, compressed size, size) of
+        every frame
+    """
+    in_file.seek(0, io.SEEK_END)
+    file_size = in_file.tell()
+    if file_size < len(MAGIC) + FOOTER.size:
+        raise ValueError('Truncated compressed chat')
+    in_file.seek(file_size - FOOTER.size)
+    index_offset, size, n_frames, magic = FOOTER.unpack(in_file.read(FOOTER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a compressed chat')
+    in_file.seek(index_offset)
+    index = list(INDEX_ENTRY.iter_unpack(in_file.read(n_frames * INDEX_ENTRY.size)))
+    return size, index
+
+
+def get_chat_size(path):
+    """
+    Returns the size in bytes of the text of a chat file, compressed or not
+
+    Arguments:
+        path (str) - Path of the chat file
+
+    Returns:
+        int
+    """
+    if not is_compressed(path):
+        return os.path.getsize(path)
+    with open(path, 'rb') as in_file:
+        return read_index(in_file)[0]
+
+
+class CompressedChatReader(io.RawIOBase):
+    """
+    Seekable binary stream of the text of a compressed chat
+    Offsets are those of the text, and only the frames read are decompressed. The last frame decompressed is
+    kept, so sequential reads decompress every frame once.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._file = open(path, 'rb')
+        self.size, self._index = read_index(self._file)
+        self._starts = [entry[0] for entry in self._index]
+        self._position = 0
+        self._frame = -1
+        self._frame_data = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position {}'.format(offset))
+        self._position = offset
+        return offset
+
+    def _load_frame(self, frame):
+        if frame != self._frame:
+            _, file_offset, compressed_size, _ = self._index[frame]
+            self._file.seek(file_offset)
+            self._frame_data = zlib.decompress(self._file.read(compressed_size))
+            self._frame = frame
+        return self._frame_data
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        frame = bisect.bisect_right(self._starts, self._position) - 1
+        data = self._load_frame(frame)
+        start = self._position - self._starts[frame]
+        n = min(len(buffer), len(data) - start)
+        buffer[:n] = data[start:start + n]
+        self._position += n
+        return n
+
+    def readall(self):
+        parts = []
+        while self._position < self.size:
+            frame = bisect.bisect_right(self._starts, self._position) - 1
+            data = self._load_frame(frame)
+            parts.append(data[self._position - self._starts[frame]:])
+            self._position = self._starts[frame] + len(data)
+        return b''.join(parts)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def open_chat(path):
+    """
+    Opens the text of a chat file, compressed or not, as a seekable binary file
+
+    Arguments:
+        path (str) - Path of the chat file
+
+    Returns:
+        file
+    """
+    if is_compressed(path):
+        return io.BufferedReader(CompressedChatReader(path), buffer_size=64 * 1024)
+    return open(path, 'rb')
+
+
+class ChatWriter:
+    """
+    Writes a chat file atomically: the chat only appears at path once close() is called
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        self._out = open(self._tmp_path, 'wb')
+
+    def write(self, data):
+        self._out.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """
+        Completes the chat file and moves it to path
+        """
+        self._out.close()
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self):
+        """
+        Drops the chat file being written, if not closed yet
+        """
+        if not self._out.closed:
+            self._out.close()
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+
+
+class CompressedChatWriter(ChatWriter):
+    """
+    Writes a compressed chat, see CompressedChatReader
+    The text is cut into frames of about frame_bytes, each one starting at a line matching FRAME_START_PATTERN
+    when there is one within 4 frames, and at a line otherwise.
+    """
+
+    def __init__(self, path, frame_bytes=FRAME_BYTES, level=DEFAULT_LEVEL):
+        super().__init__(path)
+        self.frame_bytes = frame_bytes
+        self.level = level
+        self._pending = bytearray()
+        self._index = []
+        self._out.write(MAGIC)
+
+    def write(self, data):
+        self._pending += data
+        self.size += len(data)
+        while len(self._pending) >= self.frame_bytes:
+            match = FRAME_START_PATTERN.search(self._pending, self.frame_bytes)
+            if match is not None:
+                cut = match.start()
+            elif len(self._pending) >= 4 * self.frame_bytes:
+                cut = self._pending.rfind(b'\n') + 1 or len(self._pending)
+            else:
+                break
+            self._write_frame(self._pending[:cut])
+            del self._pending[:cut]
+
+    def _write_frame(self, data):
+        compressed = zlib.compress(data, self.level)
+        offset = self._index[-1][0] + self._index[-1][3] if self._index else 0
+        self._index.append((offset, self._out.tell(), len(compressed), len(data)))
+        self._out.write(compressed)
+
+    def close(self):
+        if self._pending:
+            self._write_frame(self._pending)
+            self._pending = bytearray()
+        index_offset = self._out.tell()
+        for entry in self._index:
+            self._out.write(INDEX_ENTRY.pack(*entry))
+        self._out.write(FOOTER.pack(index_offset, self.size, len(self._index), MAGIC))
+        super().close()
+
+
+def open_chat_writer(upload_folder, analysis_id, compress, level=DEFAULT_LEVEL):
+    """
+    Returns a writer of the uploaded chat of an analysis
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+        compress (bool) - If True, the chat is stored compressed
+        level (int, default DEFAULT_LEVEL) - zlib compression level
+
+    Returns:
+        ChatWriter
+    """
+    path = os.path.join(upload_folder, analysis_id)
+    if compress:
+        return CompressedChatWriter(path + COMPRESSED_SUFFIX, level=level)
+    return ChatWriter(path + CHAT_SUFFIX)
+
+
+def compress_chat(source_path, target_path, level=DEFAULT_LEVEL, chunk_size=4 * 1024 * 1024):
+    """
+    Writes the compressed copy of a plain chat file
+
+    Arguments:
+        source_path (str) - Path of the plain chat file
+        target_path (str) - Path of the compressed chat
+        level (int, default DEFAULT_LEVEL) - zlib compression level
+        chunk_size (int, default 4 MiB) - Number of bytes read at a time
+    """
+    writer = CompressedChatWriter(target_path, level=level)
+    try:
+        with open(source_path, 'rb') as in_file:
+            for data in iter(lambda: in_file.read(chunk_size), b''):
+                writer.write(data)
+        writer.close()
+    finally:
+        writer.discard()
@@ -0,0 +1,99 @@
+import re
+
+# Dates of every dialect, whatever the locale orders or separates the day, month and year: 29/03/22, 3/29/22,
+# 29.03.2022 or 2022-03-29. The order is told later from the distinct dates, see analysis.detect_date_format.
+DATE = r'\d{1,4}[./-]\d{1,2}[./-]\d{1,4}'
+DATE_BYTES = DATE.encode('ascii')
+
+# AM/PM marker of 12hr times, after a space or the narrow no-break space of recent exports, e.g. 'PM' or 'p.m.'
+MERIDIEM = r'[^\S\n]?[AaPp]\.?[Mm]\.?'
+
+# Left-to-right mark iOS puts before the header of system messages and attachments, e.g. '\u200e[29/03/22, ...'
+LRM = '\u200e'
+LRM_BYTES = LRM.encode('utf-8')
+
+# Text at the beginning of a chat in which the dialect is detected, see detect_dialect
+SNIFF_CHARS = 64 * 1024
+
+
+class Dialect:
+    """
+    Layout of the message headers of a chat export
+    header_pattern matches a whole message header line with the groups (date, time, author, message), author
+    being None for the system messages without one, e.g. '29/03/22, 15:11 - Tony added Bruce'. Applied with
+    re.M to the whole chat, it also consumes the whitespace around the line. date_pattern matches the date of a
+    header line in the raw bytes of the chat.
+    """
+
+    def __init__(self, name, header, date, example):
+        self.name = name
+        self.header_pattern = re.compile(header, re.M)
+        self.date_pattern = re.compile(date, re.M)
+        self.example = example
+
+    def __repr__(self):
+        return 'Dialect({!r})'.format(self.name)
+
+
+DIALECTS = {dialect.name: dialect for dialect in [
+    Dialect('ios-24h',
+            r'^[^\S\n]*' + LRM + r'?\[(' + DATE + r'), (\d{1,2}:\d\d:\d\d)\] (?:(.+): )?(.*\S)[^\S\n]*$',
+            rb'^[^\S\n]*(?:' + LRM_BYTES + rb')?\[(' + DATE_BYTES + rb'), \d{1,2}:\d\d:\d\d\]',
+            "[29/03/22, 15:11:29] Bruce Banner: It's automatic"),
+    Dialect('ios-12h',
+            r'^[^\S\n]*' + LRM + r'?\[(' + DATE + r'), (\d{1,2}:\d\d:\d\d' + MERIDIEM + r')\] (?:(.+): )?(.*\S)'
+            r'[^\S\n]*$',
+            rb'^[^\S\n]*(?:' + LRM_BYTES + rb')?\[(' + DATE_BYTES + rb'), \d{1,2}:\d\d:\d\d[^\]\n]{1,8}\]',
+            "[3/29/22, 3:11:29 PM] Bruce Banner: It's automatic"),
+    Dialect('android-24h',
+            r'^[^\S\n]*(' + DATE + r'), (\d{1,2}:\d\d) - (?:([^\n]+?): )?(.*\S)[^\S\n]*$',
+            rb'^[^\S\n]*(' + DATE_BYTES + rb'), \d{1,2}:\d\d - ',
+            "29/03/22, 15:11 - Bruce Banner: It's automatic"),
+    Dialect('android-12h',
+            r'^[^\S\n]*(' + DATE + r'), (\d{1,2}:\d\d' + MERIDIEM + r') - (?:([^\n]+?): )?(.*\S)[^\S\n]*$',
+            rb'^[^\S\n]*(' + DATE_BYTES + rb'), \d{1,2}:\d\d[^\n]{1,8}? - ',
+            "3/29/22, 3:11 PM - Bruce Banner: It's automatic"),
+]}
+
+# Dialect of the chats in which no other one is detected, the only one read before dialects were added
+DEFAULT_DIALECT = DIALECTS['ios-24h']
+
+
+def get_dialect(name):
+    """
+    Returns the registered dialect called name
+
+    Arguments:
+        name (str) - Name of the dialect, e.g. 'android-12h'
+
+    Returns:
+        Dialect
+
+    Raises:
+        ValueError if no dialect has this name
+    """
+    try:
+        return DIALECTS[name]
+    except KeyError:
+        raise ValueError('Unknown chat dialect {!r}'.format(name))
+
+
+def detect_dialect(text):
+    """
+    Returns the dialect with the most message headers in the first SNIFF_CHARS of a chat
+    Dialects don't match each other's headers, so a chat only has a handful of lines (e.g. quoted messages) in
+    other dialects at most.
+
+    Arguments:
+        text (str) - Beginning of the chat, at least SNIFF_CHARS long unless the chat is shorter
+
+    Returns:
+        Dialect or None if no message header was found
+    """
+    text = text[:SNIFF_CHARS]
+    best, best_count = None, 0
+    for dialect in DIALECTS.values():
+        count = sum(1 for _ in dialect.header_pattern.finditer(text))
+        if count > best_count:
+            best, best_count = dialect, count
+    return best
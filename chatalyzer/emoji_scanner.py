@@ -0,0 +1,140 @@
+import re
+import threading
+import numpy as np
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+def get_emoji_set():
+    """
+    Returns the set of every emoji known to the installed emoji package, multi-codepoint sequences included
+
+    Returns:
+        frozenset
+    """
+    import emoji  # only needed to build the scanner, see get_scanner
+
+    if hasattr(emoji, 'EMOJI_DATA'):  # emoji >= 1.7
+        return frozenset(emoji.EMOJI_DATA)
+    unicode_emoji = emoji.UNICODE_EMOJI
+    if 'en' in unicode_emoji:  # emoji 1.x keys it by language
+        unicode_emoji = unicode_emoji['en']
+    return frozenset(unicode_emoji)
+
+
+def get_codepoint_ranges(codepoints, max_gap):
+    """
+    Returns the sorted codepoints coalesced into (first, last) ranges
+    Codepoints at most max_gap apart end up in the same range, except below U+0100 where only consecutive
+    codepoints are merged, so that common punctuation never falls in a range.
+
+    Arguments:
+        codepoints (iterable of int) - Codepoints to cover
+        max_gap (int) - Largest gap bridged by a range
+
+    Returns:
+        list
+    """
+    ranges = []
+    for codepoint in sorted(set(codepoints)):
+        gap = 1 if codepoint < 0x100 else max_gap
+        if ranges and codepoint - ranges[-1][1] <= gap:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return [tuple(r) for r in ranges]
+
+
+class EmojiScanner:
+    """
+    Finds the emojis of a text, longest match first, so that ZWJ sequences, skin tones, keycaps and flags
+    are found as a single emoji
+    A compiled character class over (a superset of) the emoji codepoints finds the candidate runs in C, and
+    only those short runs are split into emojis in Python. Build it once with get_scanner and reuse it.
+    """
+
+    def __init__(self, emojis, max_gap=64):
+        self.emojis = frozenset(emojis)
+        self.max_length = max(len(e) for e in self.emojis)
+        ranges = get_codepoint_ranges((ord(c) for e in self.emojis for c in e), max_gap)
+        char_class = ''.join(re.escape(chr(first)) if first == last else
+                             re.escape(chr(first)) + '-' + re.escape(chr(last)) for first, last in ranges)
+        self.candidate_pattern = re.compile('[' + char_class + ']+')
+
+    def split_run(self, run):
+        """
+        Returns the emojis of a run of candidate characters, longest match first
+
+        Arguments:
+            run (str) - Run of characters matched by candidate_pattern
+
+        Returns:
+            list
+        """
+        if run in self.emojis:
+            return [run]
+
+        found = []
+        i, n = 0, len(run)
+        while i < n:
+            for length in range(min(self.max_length, n - i), 0, -1):
+                if run[i:i + length] in self.emojis:
+                    found.append(run[i:i + length])
+                    i += length
+                    break
+            else:
+                i += 1
+        return found
+
+    def findall(self, text):
+        """
+        Returns the emojis of a text in order of appearance
+
+        Arguments:
+            text (str) - Text to scan
+
+        Returns:
+            list
+        """
+        found = []
+        for run in self.candidate_pattern.findall(text):
+            found.extend(self.split_run(run))
+        return found
+
+    def scan(self, messages):
+        """
+        Returns the emojis of all the messages along with the position of the message each one was found in
+        The messages are joined and scanned in a single pass.
+
+        Arguments:
+            messages (Pandas.Series or list of str) - Texts of the messages
+
+        Returns:
+            (list, numpy.ndarray) - Emojis in order of appearance, and the index of their message in messages
+        """
+        messages = list(messages)
+        # offset of the end of every message in the text joined with '\n'
+        ends = np.cumsum(np.fromiter((len(message) + 1 for message in messages), dtype=np.int64,
+                                     count=len(messages)))
+        found, starts = [], []
+        for match in self.candidate_pattern.finditer('\n'.join(messages)):
+            run_emojis = self.split_run(match.group())
+            found.extend(run_emojis)
+            starts.extend([match.start()] * len(run_emojis))
+        return found, np.searchsorted(ends, np.array(starts, dtype=np.int64), side='right')
+
+
+def get_scanner():
+    """
+    Returns the EmojiScanner of the process, built on first use
+
+    Returns:
+        EmojiScanner
+    """
+    global _scanner
+    if _scanner is None:
+        with _scanner_lock:
+            if _scanner is None:
+                _scanner = EmojiScanner(get_emoji_set())
+    return _scanner
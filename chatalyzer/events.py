@@ -0,0 +1,159 @@
+from operator import methodcaller
+import numpy as np
+import pandas as pd
+from chatalyzer import dialects
+
+KEY_EVENT = 'Event'
+KEY_ACTOR = 'Actor'
+KEY_PARTICIPANT = 'Participant'
+
+EVENT_CREATED = 'created'
+EVENT_JOINED = 'joined'
+EVENT_ADDED = 'added'
+EVENT_LEFT = 'left'
+EVENT_REMOVED = 'removed'
+EVENT_CHANGED = 'changed'  # subject, icon, description or settings of the group
+EVENT_NUMBER_CHANGED = 'number changed'
+
+# Whether the participant of an event is a member of the group after it, for the events changing it
+MEMBERSHIP = {EVENT_CREATED: True, EVENT_JOINED: True, EVENT_ADDED: True, EVENT_LEFT: False, EVENT_REMOVED: False}
+
+# Patterns of the system messages, tried in order on the messages without an author or starting with dialects.LRM.
+# The 'actor' group is who did it and the 'participant' group who it was done to, the actor if there is none.
+# Several participants are separated by ', ' or ' and ', see SEPARATOR_PATTERN.
+EVENT_PATTERNS = [
+    (EVENT_CREATED, r'^(?P<actor>.+?) created (?:group ".*"|this group)$'),
+    (EVENT_JOINED, r"^(?P<actor>.+?) joined(?: using this group's invite link| from the community)?$"),
+    (EVENT_ADDED, r'^(?P<actor>.+?) added (?P<participant>.+)$'),
+    (EVENT_ADDED, r'^(?P<participant>You) were added$'),
+    (EVENT_LEFT, r'^(?P<actor>.+?) left$'),
+    (EVENT_REMOVED, r'^(?P<actor>.+?) removed (?P<participant>.+)$'),
+    (EVENT_NUMBER_CHANGED, r'^(?P<actor>.+?) changed (?:their phone number|to (?P<participant>\+[\d ]+))\b.*$'),
+    (EVENT_CHANGED, r"^(?P<actor>.+?) changed (?:the subject|this group's|the group|the settings)\b.*$"),
+]
+
+SEPARATOR_PATTERN = r', (?:and )?| and '
+
+STARTS_WITH_LRM = methodcaller('startswith', dialects.LRM)
+
+
+def get_run_starts(values):
+    """
+    Returns the mask of the values differing from the previous one, the first value always does
+    """
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = values[1:] != values[:-1]
+    return starts
+
+
+def get_event_candidates(authors, messages):
+    """
+    Returns the mask of the messages which may be system messages: those without an author (Android, and iOS
+    lines without one) and those starting with dialects.LRM (iOS, sent under the name of the group or of the
+    participant who did it)
+
+    Arguments:
+        authors (Pandas.Series) - Author of every message, None if it has none
+        messages (Pandas.Series) - Text of every message
+
+    Returns:
+        Pandas.Series of bool
+    """
+    # str.startswith called through map is several times faster than the str accessor of pandas
+    marked = np.fromiter(map(STARTS_WITH_LRM, messages.to_numpy(dtype=object)), dtype=bool, count=len(messages))
+    return authors.isna() | pd.Series(marked, index=messages.index)
+
+
+def get_event_mask(authors, messages):
+    """
+    Returns the mask of the system events among messages, the candidates classify_events finds an event in
+    These are left out of the message metrics, see analysis.get_event_mask.
+
+    Arguments:
+        authors (Pandas.Series) - Author of every message, None if it has none
+        messages (Pandas.Series) - Text of every message
+
+    Returns:
+        numpy.ndarray of bool
+    """
+    positions = np.flatnonzero(get_event_candidates(authors, messages).to_numpy(dtype=bool))
+    candidates = pd.Series(messages.iloc[positions].to_numpy(dtype=object), index=positions)
+    mask = np.zeros(len(messages), dtype=bool)
+    mask[classify_events(candidates).index.unique().to_numpy(dtype='int64')] = True
+    return mask
+
+
+def classify_events(messages):
+    """
+    Returns the system events of messages, every pattern of EVENT_PATTERNS being tried on all the messages not
+    matched yet at once. Messages matching none are left out.
+
+    Arguments:
+        messages (Pandas.Series) - Text of the messages, see get_event_candidates
+
+    Returns:
+        Pandas.DataFrame ('Event', 'Actor', 'Participant') indexed like messages, with a row per participant
+        for the events done to several of them
+    """
+    remaining = messages.str.strip(dialects.LRM + ' ')
+    found = []
+    for event, pattern in EVENT_PATTERNS:
+        if remaining.empty:
+            break
+        groups = remaining.str.extract(pattern)
+        matched = groups.notna().any(axis=1)
+        groups = groups[matched]
+        actors = groups['actor'] if 'actor' in groups else pd.Series(None, index=groups.index, dtype=object)
+        participants = groups['participant'] if 'participant' in groups else actors
+        found.append(pd.DataFrame({KEY_EVENT: event, KEY_ACTOR: actors,
+                                   KEY_PARTICIPANT: participants.fillna(actors)}, index=groups.index))
+        remaining = remaining[~matched]
+
+    if not found:
+        return pd.DataFrame({KEY_EVENT: [], KEY_ACTOR: [], KEY_PARTICIPANT: []}, dtype=object)
+    events = pd.concat(found).sort_index(kind='stable')
+    events[KEY_PARTICIPANT] = events[KEY_PARTICIPANT].str.split(SEPARATOR_PATTERN, regex=True)
+    events = events.explode(KEY_PARTICIPANT)
+    events[KEY_ACTOR] = events[KEY_ACTOR].replace({np.nan: None})
+    return events
+
+
+def get_membership_intervals(participants, date_times, is_member):
+    """
+    Returns the membership intervals of the participants of membership events, without a loop over the events
+    Events leaving the membership of a participant unchanged (e.g. added twice) are dropped, the remaining ones
+    alternate between a start and an end for every participant. A participant whose first one is an end was
+    a member before the chat starts.
+
+    Arguments:
+        participants (numpy.ndarray) - Participant of every event
+        date_times (numpy.ndarray of datetime64[ns]) - Time of every event
+        is_member (numpy.ndarray of bool) - Whether the participant is a member after the event
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray of bool) - Participant, start and end
+        (NaT when before the chat starts or after it ends) of every interval, and the changes themselves as the
+        mask of the events kept
+    """
+    codes, names = pd.factorize(participants)
+    order = np.lexsort((date_times, codes))
+    participants, date_times, is_member = codes[order], date_times[order], is_member[order]
+    first = get_run_starts(participants)
+    was_member = np.roll(is_member, 1)
+    was_member[first] = ~is_member[first]
+    changed = is_member != was_member
+    kept = np.zeros(len(order), dtype=bool)
+    kept[order[changed]] = True
+
+    participants, date_times, is_member = participants[changed], date_times[changed], is_member[changed]
+    first = get_run_starts(participants)
+    next_date_times = np.roll(date_times, -1)
+    next_date_times[np.roll(first, -1)] = np.datetime64('NaT')  # last event of every participant
+
+    before_start = first & ~is_member
+    interval_participants = np.asarray(names, dtype=object)[np.concatenate([participants[before_start],
+                                                                            participants[is_member]])]
+    starts = np.concatenate([np.full(before_start.sum(), np.datetime64('NaT'), dtype='datetime64[ns]'),
+                             date_times[is_member]])
+    ends = np.concatenate([date_times[before_start], next_date_times[is_member]])
+    return interval_participants, starts, ends, kept
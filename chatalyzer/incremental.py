@@ -0,0 +1,203 @@
+import os
+import json
+import uuid
+import hashlib
+from chatalyzer import aggregates, analysis, compression, metrics, parallel, parsing, store
+
+AGGREGATES_VERSION = 5
+AGGREGATES_SUFFIX = '.aggregates.json'
+FINGERPRINT_SUFFIX = '.fingerprint.json'
+
+# Number of messages at the beginning of a chat identifying it across exports
+FINGERPRINT_MESSAGES = 100
+
+
+def get_aggregates_path(upload_folder, analysis_id):
+    """
+    Returns the path of the saved aggregates of an analysis
+    They sit next to the uploaded chat, so they are evicted along with it by store.evict_uploads.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str
+    """
+    return os.path.join(upload_folder, analysis_id) + AGGREGATES_SUFFIX
+
+
+def get_fingerprint_path(upload_folder, fingerprint):
+    """
+    Returns the path of the file pointing to the latest analysis of the chat having fingerprint
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        fingerprint (str) - Fingerprint of the chat, see get_fingerprint
+
+    Returns:
+        str
+    """
+    return os.path.join(upload_folder, fingerprint) + FINGERPRINT_SUFFIX
+
+
+def write_json(path, data):
+    """
+    Atomically writes data as JSON to path
+    """
+    tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as out_file:
+        json.dump(data, out_file)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """
+    Returns the JSON data of path, or None if it doesn't exist or is corrupt
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as in_file:
+            return json.load(in_file)
+    except (OSError, ValueError):
+        return None
+
+
+@metrics.instrumented
+def get_fingerprint(chatfile, n_messages=FINGERPRINT_MESSAGES):
+    """
+    Returns the fingerprint of a chat, made of its first n_messages messages and their participants
+    Every export of the same chat starts with the same messages, so later and longer exports share it.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        n_messages (int, default FINGERPRINT_MESSAGES) - Number of messages hashed
+
+    Returns:
+        str or None if the chat has fewer than n_messages messages
+    """
+    first_messages = next(parsing.iter_chat_batches(chatfile, batch_size=n_messages, chunk_size=64 * 1024), None)
+    if first_messages is None or first_messages.shape[0] < n_messages:
+        return None
+
+    participants = sorted(first_messages[analysis.KEY_AUTHOR].dropna().unique())
+    sha = hashlib.sha256()
+    sha.update(json.dumps([participants, first_messages.values.tolist()]).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def save_aggregates(upload_folder, analysis_id, chat_aggregates, fingerprint, content_hash, size, date_time_format):
+    """
+    Saves the aggregates of an analysis so that a longer export of the same chat only needs its new messages
+    aggregated, and makes the analysis the latest one of its fingerprint
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+        chat_aggregates (aggregates.ChatAggregates) - Aggregates of the whole chat file
+        fingerprint (str) - Fingerprint of the chat, or None if it has too few messages to have one
+        content_hash (str) - Content hash of the chat file, see store.get_content_hash
+        size (int) - Size of the chat file in bytes
+        date_time_format (str) - Date time format of the chat, see analysis.parse_date_time, or None if unknown
+    """
+    write_json(get_aggregates_path(upload_folder, analysis_id), {
+        'version': AGGREGATES_VERSION,
+        'analysis_version': analysis.ANALYSIS_VERSION,
+        'fingerprint': fingerprint,
+        'content_hash': content_hash,
+        'size': size,
+        'date_time_format': date_time_format,
+        'aggregates': chat_aggregates.to_dict(),
+    })
+    if fingerprint is not None:
+        write_json(get_fingerprint_path(upload_folder, fingerprint), {'analysis_id': analysis_id})
+
+
+def get_tail_start(chatfile, size):
+    """
+    Returns the offset of the first message following the first size bytes of a chat file
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        size (int) - Size of the previous export of the chat, a prefix of this one
+
+    Returns:
+        int or None if the prefix doesn't end at the end of a message, e.g. because the last message of the
+        previous export got more lines
+    """
+    with compression.open_chat(chatfile) as in_file:
+        if size > 0:
+            in_file.seek(size - 1)
+            if in_file.read(1) != b'\n':  # the previous export had no newline at its end
+                if in_file.readline().strip(b'\r\n') != b'':
+                    return None
+        start = in_file.tell()
+        first_line = in_file.readline()
+    if first_line and not parallel.is_message_header(first_line, parsing.detect_file_dialect(chatfile)):
+        return None
+    return start
+
+
+@metrics.instrumented
+def find_previous_analysis(upload_folder, chatfile, fingerprint):
+    """
+    Returns the aggregates of the latest analysis of an earlier export of the same chat, along with where the
+    new messages start in chatfile
+    The earlier export must be a prefix of chatfile, end at the end of a message, and its date format must
+    parse the new messages. Checking this costs a hash of the prefix and a scan of the new messages only.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        chatfile (str) - Path of the new chat file
+        fingerprint (str) - Fingerprint of the new chat file, see get_fingerprint
+
+    Returns:
+        (aggregates.ChatAggregates, int, str) - Aggregates of the earlier export, offset of its first new message
+        and date time format, or None if there is no usable earlier export
+    """
+    if fingerprint is None:
+        return None
+    pointer = read_json(get_fingerprint_path(upload_folder, fingerprint))
+    if pointer is None:
+        return None
+    saved = read_json(get_aggregates_path(upload_folder, pointer['analysis_id']))
+    if saved is None or saved['version'] != AGGREGATES_VERSION or \
+            saved['analysis_version'] != analysis.ANALYSIS_VERSION or saved['fingerprint'] != fingerprint or \
+            saved['date_time_format'] is None:
+        return None
+
+    size = saved['size']
+    if size > compression.get_chat_size(chatfile) or store.get_content_hash(chatfile, size=size) != saved['content_hash']:
+        return None
+    start = get_tail_start(chatfile, size)
+    if start is None:
+        return None
+
+    date_format = saved['date_time_format'].split(' ', 1)[0]
+    try:
+        analysis.parse_dates(parsing.get_distinct_dates(chatfile, start=start), date_format)
+    except ValueError:  # the new messages show the earlier export was read in the wrong date order
+        return None
+
+    return aggregates.ChatAggregates.from_dict(saved['aggregates']), start, saved['date_time_format']
+
+
+@metrics.instrumented
+def aggregate_new_messages(chatfile, previous, batch_size=100000, progress=None):
+    """
+    Returns the aggregates of a chat file from those of an earlier export, aggregating only the new messages
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        previous (tuple) - Result of find_previous_analysis
+        batch_size (int, default 100000) - Number of messages held in memory at a time
+        progress (callable, default None) - Called with the fraction of the new messages read
+
+    Returns:
+        aggregates.ChatAggregates
+    """
+    chat_aggregates, start, date_time_format = previous
+    if start < compression.get_chat_size(chatfile):
+        chat_aggregates.merge(aggregates.aggregate_chat_file(chatfile, batch_size, progress=progress, start=start,
+                                                             date_time_format=date_time_format,
+                                                             capacity=chat_aggregates.capacity))
+    return chat_aggregates
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import uuid
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from chatalyzer import metrics
+
+STATE_QUEUED = 'queued'
+STATE_PARSING = 'parsing'
+STATE_AGGREGATING = 'aggregating'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+STATUS_SUFFIX = '.status.json'
+
+_executor = None
+_executor_workers = None
+
+
+def get_status_path(upload_folder, analysis_id):
+    """
+    Returns the path of the status file of an analysis job
+    Statuses are files next to the uploaded chat so that every server process sees the same status.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str
+    """
+    return os.path.join(upload_folder, analysis_id) + STATUS_SUFFIX
+
+
+def write_status(status_path, state, progress=0.0, error=None):
+    """
+    Atomically writes the status of an analysis job
+
+    Arguments:
+        status_path (str) - Path of the status file
+        state (str) - One of the STATE_* constants
+        progress (float, default 0) - Fraction of the job done, between 0 and 1
+        error (str, default None) - Description of the error of a failed job
+    """
+    status = {'state': state, 'progress': round(min(max(progress, 0.0), 1.0), 3), 'error': error}
+    tmp_path = status_path + '.' + uuid.uuid4().hex + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as out_file:
+        json.dump(status, out_file)
+    os.replace(tmp_path, status_path)
+
+
+def read_status(status_path, timeout=None):
+    """
+    Returns the status of an analysis job
+
+    Arguments:
+        status_path (str) - Path of the status file
+        timeout (float, default None) - Seconds after which a job that didn't report any progress is
+            considered lost, e.g. because its worker died. Lost jobs are reported as failed with 'lost' set
+
+    Returns:
+        dict ('state', 'progress', 'error', 'lost') or None if no job was submitted
+    """
+    try:
+        with open(status_path, 'r', encoding='utf-8') as in_file:
+            status = json.load(in_file)
+        last_update = os.path.getmtime(status_path)
+    except (OSError, ValueError):
+        return None
+
+    status['lost'] = False
+    unfinished = status['state'] not in (STATE_DONE, STATE_FAILED)
+    if unfinished and timeout is not None and time.time() - last_update > timeout:
+        status.update(state=STATE_FAILED, error='The analysis timed out', lost=True)
+    return status
+
+
+def get_executor(max_workers):
+    """
+    Returns the process pool of the current process, created on first use
+
+    Arguments:
+        max_workers (int) - Number of worker processes
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != max_workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(max_workers=max_workers)
+        _executor_workers = max_workers
+    return _executor
+
+
+def run_job(status_path, func, args, metrics_config=None):
+    """
+    Runs func(*args, report=...) in a worker, keeping the status file up to date
+    func calls report(state, progress) to publish its progress. Returns the stage metrics recorded by the job,
+    see metrics.snapshot, so that the submitting process can merge them into its own.
+    """
+    def report(state, progress):
+        write_status(status_path, state, progress)
+
+    if metrics_config is not None:
+        metrics.configure(**metrics_config)
+    metrics.reset()  # forked workers inherit the metrics of the parent
+    try:
+        func(*args, report=report)
+    except Exception:
+        write_status(status_path, STATE_FAILED, error=traceback.format_exc(limit=1))
+        raise
+    write_status(status_path, STATE_DONE, 1.0)
+    return metrics.snapshot(reset=True)
+
+
+def merge_metrics(future):
+    """
+    Done callback of the jobs adding the stage metrics of the worker to those of the current process
+    """
+    if not future.cancelled() and future.exception() is None:
+        metrics.merge(future.result())
+
+
+def submit(status_path, func, args, max_workers):
+    """
+    Queues func(*args, report=...) on the process pool
+
+    Arguments:
+        status_path (str) - Path of the status file of the job
+        func (callable) - Module level function doing the work, accepting a 'report' keyword argument
+        args (tuple) - Positional arguments of func
+        max_workers (int) - Number of worker processes of the pool
+
+    Returns:
+        concurrent.futures.Future
+    """
+    write_status(status_path, STATE_QUEUED)
+    future = get_executor(max_workers).submit(run_job, status_path, func, args, metrics.get_config())
+    future.add_done_callback(merge_metrics)
+    return future
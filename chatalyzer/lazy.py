@@ -0,0 +1,46 @@
+import sys
+import importlib.util
+
+
+def lazy_import(name):
+    """
+    Returns a module whose code only runs on first attribute access, so that importing a module which merely
+    refers to it (e.g. the web app to the pandas based analysis) doesn't pay for loading it
+    The module is registered in sys.modules, later imports of it getting the same lazy module. A module which
+    is already imported is returned as is.
+
+    Arguments:
+        name (str) - Absolute name of the module, e.g. 'chatalyzer.analysis'
+
+    Returns:
+        module
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError('No module named {!r}'.format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def load(module):
+    """
+    Runs the code of a module returned by lazy_import now, e.g. before forking workers which then share it
+
+    Arguments:
+        module (module) - Module, lazy or not
+
+    Returns:
+        module
+    """
+    getattr(module, '__name__')  # any attribute access loads a lazy module
+    return module
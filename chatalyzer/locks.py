@@ -0,0 +1,75 @@
+import os
+from contextlib import contextmanager, suppress
+
+try:
+    import fcntl
+except ImportError:  # Windows, where concurrent computations of the same chat are merely wasted work
+    fcntl = None
+
+LOCK_SUFFIX = '.lock'
+
+
+def get_lock_path(upload_folder, analysis_id, name):
+    """
+    Returns the path of a lock file of an analysis
+    Lock files are next to the uploaded chat, named after the analysis, and only exist while the lock is held,
+    see file_lock.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+        name (str) - What the lock protects, e.g. 'parse'
+
+    Returns:
+        str
+    """
+    return os.path.join(upload_folder, analysis_id) + '.' + name + LOCK_SUFFIX
+
+
+def open_locked(path):
+    """
+    Returns the lock file at path, opened and exclusively locked
+    A holder removes the file before releasing it, so a waiter which gets the lock on a file no longer at path
+    opens the current one and waits on it instead, which makes every holder lock the same file.
+
+    Arguments:
+        path (str) - Path of the lock file, created if missing
+
+    Returns:
+        file
+    """
+    while True:
+        lock_file = open(path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.stat(path), os.fstat(lock_file.fileno())):
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on the file at path for the duration of the with block
+    The lock is shared by every thread and process of the machine, e.g. the gunicorn workers, so that only one
+    of them computes something the others are waiting for. It is released if its holder dies. The file is
+    removed when the lock is released, see open_locked, so that lock files don't pile up in the upload folder.
+
+    Arguments:
+        path (str) - Path of the lock file, created if missing
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_file = open_locked(path)
+    try:
+        yield
+    finally:
+        try:
+            with suppress(FileNotFoundError):  # e.g. removed along with the upload folder entries
+                os.unlink(path)  # before releasing the lock, so that nobody else holds it
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
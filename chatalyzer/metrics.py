@@ -0,0 +1,279 @@
+import os
+import time
+import cProfile
+import threading
+import tracemalloc
+import functools
+from contextlib import contextmanager
+
+# Turned on with configure(). While off, instrumented functions cost a single attribute lookup per call.
+_enabled = False
+_allocations = False
+_stats = {}  # stage -> [calls, seconds, allocated bytes, peak bytes]
+_counters = {}  # name -> total
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(enabled, allocations=False):
+    """
+    Turns the collection of stage metrics on or off
+
+    Arguments:
+        enabled (bool) - If True, the time spent in every stage is recorded
+        allocations (bool, default False) - If True, the memory allocated by every stage is recorded as well,
+            with tracemalloc. This slows Python allocations down noticeably
+    """
+    global _enabled, _allocations
+    allocations = enabled and allocations
+    if allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not allocations and _allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _enabled = enabled
+    _allocations = allocations
+
+
+def get_config():
+    """
+    Returns the keyword arguments of configure matching the current settings, to pass them on to workers
+
+    Returns:
+        dict
+    """
+    return {'enabled': _enabled, 'allocations': _allocations}
+
+
+def is_enabled():
+    """
+    Returns True if metrics are collected, to skip the work done only to report them
+    """
+    return _enabled
+
+
+def increment(name, value=1):
+    """
+    Adds value to the counter name, exposed on /metrics as '<prefix>_<name>_total'
+
+    Arguments:
+        name (str) - Name of the counter
+        value (int or float, default 1) - Amount added
+    """
+    with _stats_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record(name, seconds, allocated=0, peak=0):
+    """
+    Adds a call of a stage to the metrics of the process and of the current request, if any
+
+    Arguments:
+        name (str) - Name of the stage
+        seconds (float) - Time spent in the stage
+        allocated (int, default 0) - Bytes allocated and still held at the end of the stage
+        peak (int, default 0) - Highest number of bytes allocated during the stage
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(name, [0, 0.0, 0, 0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += allocated
+        stats[3] = max(stats[3], peak)
+
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Context manager recording the time (and allocations) of the code it wraps under name
+    Stages can be nested, the time of a stage includes that of the stages it contains.
+
+    Arguments:
+        name (str) - Name of the stage
+    """
+    if not _enabled:
+        yield
+        return
+
+    allocations = _allocations and tracemalloc.is_tracing()
+    if allocations:
+        stack = _local.__dict__.setdefault('peaks', [])
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1] = max(stack[-1], peak)
+        stack.append(current)
+        tracemalloc.reset_peak()
+        start_memory = current
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, stack.pop())
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+            record(name, seconds, current - start_memory, peak - start_memory)
+        else:
+            record(name, seconds)
+
+
+def instrumented(func):
+    """
+    Decorator recording every call of func as the stage '<module>.<qualified name>'
+    """
+    name = '{}.{}'.format(func.__module__.rsplit('.', 1)[-1], func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        with stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def snapshot(reset=False):
+    """
+    Returns a copy of the metrics of the process
+
+    Arguments:
+        reset (bool, default False) - If True, the metrics are cleared
+
+    Returns:
+        dict ('stages', 'counters') - 'stages' maps every stage to [calls, seconds, allocated bytes, peak bytes]
+            and 'counters' every counter to its total
+    """
+    with _stats_lock:
+        stats = {'stages': {name: list(values) for name, values in _stats.items()}, 'counters': dict(_counters)}
+        if reset:
+            _stats.clear()
+            _counters.clear()
+    return stats
+
+
+def reset():
+    """
+    Clears the metrics of the process
+    """
+    with _stats_lock:
+        _stats.clear()
+        _counters.clear()
+
+
+def merge(stats):
+    """
+    Adds the metrics of another process, see snapshot
+
+    Arguments:
+        stats (dict) - Metrics returned by snapshot
+    """
+    with _stats_lock:
+        for name, (calls, seconds, allocated, peak) in stats['stages'].items():
+            totals = _stats.setdefault(name, [0, 0.0, 0, 0])
+            totals[0] += calls
+            totals[1] += seconds
+            totals[2] += allocated
+            totals[3] = max(totals[3], peak)
+        for name, value in stats['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def start_request():
+    """
+    Starts collecting the time of the stages run by the current thread, see get_request_timings
+    """
+    _local.timings = {} if _enabled else None
+    _local.request_start = time.perf_counter()
+
+
+def get_request_timings():
+    """
+    Returns the time of the stages run by the current thread since start_request, along with the 'total'
+    time elapsed, and stops collecting them
+
+    Returns:
+        dict - Key: stage, Value: seconds (empty if metrics are off)
+    """
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    if timings is None:
+        return {}
+    timings['total'] = time.perf_counter() - _local.request_start
+    return timings
+
+
+def get_server_timing(timings):
+    """
+    Returns the value of a Server-Timing header listing the time of every stage in milliseconds
+
+    Arguments:
+        timings (dict) - Key: stage, Value: seconds, see get_request_timings
+
+    Returns:
+        str
+    """
+    return ', '.join('{};dur={:.3f}'.format(name, seconds * 1000) for name, seconds in timings.items())
+
+
+def get_prometheus_text(prefix='chatalyzer'):
+    """
+    Returns the metrics of the process in the Prometheus text exposition format
+
+    Arguments:
+        prefix (str, default 'chatalyzer') - Prefix of the metric names
+
+    Returns:
+        str
+    """
+    metrics = [
+        ('stage_calls_total', 'counter', 'Number of calls of the stage', 0),
+        ('stage_seconds_total', 'counter', 'Time spent in the stage', 1),
+        ('stage_allocated_bytes_total', 'counter', 'Memory allocated and still held at the end of the stage', 2),
+        ('stage_peak_bytes', 'gauge', 'Highest memory allocated during a call of the stage', 3),
+    ]
+    stats = snapshot()
+    lines = []
+    for metric, metric_type, description, i in metrics:
+        if i >= 2 and not _allocations:
+            continue
+        name = '{}_{}'.format(prefix, metric)
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for stage_name, values in sorted(stats['stages'].items()):
+            lines.append('{}{{stage="{}"}} {}'.format(name, stage_name, values[i]))
+    for counter_name, value in sorted(stats['counters'].items()):
+        name = '{}_{}_total'.format(prefix, counter_name)
+        lines.append('# TYPE {} counter'.format(name))
+        lines.append('{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def profile(folder, name):
+    """
+    Context manager dumping a cProfile of the code it wraps to '<folder>/<name>-<timestamp>.prof'
+    Nothing is profiled when folder is None. The dumps can be read with pstats or turned into flamegraphs
+    with tools such as snakeviz or flameprof.
+
+    Arguments:
+        folder (str) - Folder of the dumps, or None
+        name (str) - Prefix of the dump file name
+    """
+    if folder is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(folder, exist_ok=True)
+        profiler.dump_stats(os.path.join(folder, '{}-{}.prof'.format(name, time.strftime('%Y%m%d-%H%M%S'))))
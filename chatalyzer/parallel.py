@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from chatalyzer import aggregates, compression, metrics, parsing
+
+
+def is_message_header(line, dialect):
+    """
+    Returns True if a raw line of the chat file starts a new message
+
+    Arguments:
+        line (bytes) - Line read from the chat file in binary mode
+        dialect (dialects.Dialect) - Dialect of the chat
+
+    Returns:
+        bool
+    """
+    return dialect.header_pattern.match(line.decode('utf-8', errors='replace')) is not None
+
+
+def find_shard_boundaries(chatfile, n_shards, dialect=None):
+    """
+    Returns the byte offsets splitting a chat file into at most n_shards ranges of about the same size
+    Every offset but the first and the last is the beginning of a message header line, so that no message
+    is split across two shards.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        n_shards (int) - Number of shards wanted
+        dialect (dialects.Dialect, default None) - Dialect of the chat, see parsing.detect_file_dialect if None
+
+    Returns:
+        list - Sorted offsets, starting at 0 and ending at the size of the file
+    """
+    if dialect is None:
+        dialect = parsing.detect_file_dialect(chatfile)
+    file_size = compression.get_chat_size(chatfile)
+    boundaries = [0]
+    with compression.open_chat(chatfile) as in_file:
+        for i in range(1, n_shards):
+            offset = max(file_size * i // n_shards, boundaries[-1])
+            in_file.seek(offset)
+            if offset > 0:
+                in_file.readline()  # skips the rest of the line the offset falls in
+            while True:
+                position = in_file.tell()
+                line = in_file.readline()
+                if not line:
+                    position = file_size
+                    break
+                if is_message_header(line, dialect):
+                    break
+            if boundaries[-1] < position < file_size:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return boundaries
+
+
+@metrics.instrumented
+def aggregate_shard(chatfile, start, end, date_time_format, batch_size, dialect, capacity=None):
+    """
+    Returns the aggregates of the byte range [start, end) of a chat file, see find_shard_boundaries
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        start (int) - Offset of the first byte of the shard
+        end (int) - Offset after the last byte of the shard
+        date_time_format (str) - Date time format of the chat, see analysis.parse_date_time
+        batch_size (int) - Number of messages held in memory at a time
+        dialect (dialects.Dialect) - Dialect of the chat
+        capacity (int, default None) - Number of words and emojis held by approximate counts, see
+            aggregates.ChatAggregates
+
+    Returns:
+        aggregates.ChatAggregates
+    """
+    chat_aggregates = aggregates.ChatAggregates(capacity)
+    for batch in parsing.iter_chat_batches(chatfile, batch_size=batch_size, start=start, end=end, dialect=dialect):
+        batch, date_time_format = aggregates.prepare_batch(batch, date_time_format)
+        chat_aggregates.update(batch)
+    return chat_aggregates
+
+
+@metrics.instrumented
+def aggregate_chat_file(chatfile, workers, batch_size=100000, progress=None, capacity=None):
+    """
+    Returns the aggregates of a chat file, parsed and aggregated by shards on several processes
+    The file is split into one shard per worker at message boundaries, each shard is aggregated in a
+    ProcessPoolExecutor and the partial aggregates are merged in file order. The result is the same as
+    that of aggregates.aggregate_chat_file.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        workers (int) - Number of worker processes
+        batch_size (int, default 100000) - Number of messages held in memory at a time by each worker
+        progress (callable, default None) - Called with the fraction of the shards done after each shard
+        capacity (int, default None) - Number of words and emojis held by approximate counts, see
+            aggregates.ChatAggregates. Every shard holds as many, and so does their merge
+
+    Returns:
+        aggregates.ChatAggregates
+    """
+    if workers <= 1:
+        return aggregates.aggregate_chat_file(chatfile, batch_size, progress=progress, capacity=capacity)
+
+    dialect = parsing.detect_file_dialect(chatfile)
+    boundaries = find_shard_boundaries(chatfile, workers, dialect)
+    date_time_format = aggregates.detect_date_format(chatfile, dialect)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(aggregate_shard, chatfile, start, end, date_time_format, batch_size, dialect,
+                                   capacity)
+                   for start, end in zip(boundaries[:-1], boundaries[1:])]
+        chat_aggregates = aggregates.ChatAggregates(capacity)
+        for i, future in enumerate(futures):
+            chat_aggregates.merge(future.result())
+            if progress is not None:
+                progress((i + 1) / len(futures))
+    return chat_aggregates
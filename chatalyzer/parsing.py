@@ -0,0 +1,298 @@
+import io
+import codecs
+import pandas as pd
+from chatalyzer import analysis, compression, dialects, metrics
+
+
+def read_chat_text(chatfile):
+    """
+    Returns the whole content of a chat file with the line endings normalized to '\\n'
+
+    Arguments:
+        chatfile (str) - Path of the chat file, compressed or not
+
+    Returns:
+        str
+    """
+    if not compression.is_compressed(chatfile):
+        with open(chatfile, "r", encoding="utf-8") as in_file:
+            return in_file.read()
+    with io.TextIOWrapper(compression.open_chat(chatfile), encoding="utf-8") as in_file:
+        return in_file.read()
+
+
+def split_lines(segment):
+    """
+    Returns the stripped lines of a chunk of the chat the way readlines() would split it
+
+    Arguments:
+        segment (str) - Chunk of the chat
+
+    Returns:
+        list
+    """
+    if segment == '':
+        return []
+    lines = segment.split('\n')
+    if segment.endswith('\n'):
+        lines.pop()
+    return [line.strip() for line in lines]
+
+
+def detect_file_dialect(chatfile):
+    """
+    Returns the dialect of a chat file, detected on its first dialects.SNIFF_CHARS
+
+    Arguments:
+        chatfile (str) - Path of the chat file, compressed or not
+
+    Returns:
+        dialects.Dialect - dialects.DEFAULT_DIALECT if no message header was found
+    """
+    with compression.open_chat(chatfile) as in_file:
+        text = in_file.read(dialects.SNIFF_CHARS).decode('utf-8', errors='ignore')
+    return dialects.detect_dialect(text) or dialects.DEFAULT_DIALECT
+
+
+@metrics.instrumented
+def parse_chat_text(text, dialect=None):
+    """
+    Returns a Pandas DataFrame of the messages in the chat text
+    The message headers are found with a single scan of the compiled header pattern of the dialect over the
+    whole text, and only the messages followed by continuation lines are touched again in Python to fold those
+    lines in. The output is the same as that of chatalyzer.get_chats_per_line.
+
+    Arguments:
+        text (str) - Content of the chat file
+        dialect (dialects.Dialect, default None) - Dialect of the chat, detected on its beginning if None
+
+    Returns:
+        Pandas.DataFrame ('Date', 'Time', 'Author', 'Message')
+    """
+    if dialect is None:
+        dialect = dialects.detect_dialect(text) or dialects.DEFAULT_DIALECT
+    dates, times, authors, messages = [], [], [], []
+    prev_end = None
+    for match in dialect.header_pattern.finditer(text):
+        start = match.start()
+        if prev_end is None:
+            if start > 0:  # lines before the first message header form a message without an author
+                dates.append(None)
+                times.append(None)
+                authors.append(None)
+                messages.append(' '.join(split_lines(text[:start])))
+        elif start > prev_end + 1:  # continuation lines of the previous message
+            messages[-1] = ' '.join([messages[-1]] + split_lines(text[prev_end + 1:start]))
+
+        date, time, author, message = match.groups()
+        dates.append(date)
+        times.append(time)
+        authors.append(author)
+        messages.append(message)
+        prev_end = match.end()
+
+    if prev_end is None:
+        dates.append(None)
+        times.append(None)
+        authors.append(None)
+        messages.append(' '.join(split_lines(text)))
+    elif prev_end + 1 < len(text):
+        messages[-1] = ' '.join([messages[-1]] + split_lines(text[prev_end + 1:]))
+
+    return pd.DataFrame({
+        analysis.KEY_DATE: dates,
+        analysis.KEY_TIME: times,
+        analysis.KEY_AUTHOR: authors,
+        analysis.KEY_MESSAGE: messages,
+    })
+
+
+@metrics.instrumented
+def get_chats(chatfile, dialect=None):
+    """
+    Returns a Pandas DataFrame of the messages in a chat file
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        dialect (dialects.Dialect, default None) - Dialect of the chat, detected on its beginning if None
+
+    Returns:
+        Pandas.DataFrame ('Date', 'Time', 'Author', 'Message')
+    """
+    return parse_chat_text(read_chat_text(chatfile), dialect)
+
+
+class ChatStreamParser:
+    """
+    Incremental version of parse_chat_text, fed with consecutive chunks of the chat text
+    A message is only returned once the next message header (or the end of the chat) is seen, since
+    continuation lines may still follow it. Rows are (date, time, author, message) tuples and, once the
+    chat is closed, they are the same as the rows of parse_chat_text.
+    Without a dialect, the text is held back until its first dialects.SNIFF_CHARS tell the dialect.
+    """
+
+    def __init__(self, dialect=None):
+        self.dialect = dialect
+        self._buffer = ''  # text not parsed yet, always starting at the beginning of a line
+        self._pending = [None, None, None, []]  # date, time, author and parts of the last message
+        self._seen_header = False
+
+    def feed(self, text):
+        """
+        Parses the complete lines available after appending text and returns the finished messages
+
+        Arguments:
+            text (str) - Next chunk of the chat
+
+        Returns:
+            list - List of (date, time, author, message) tuples
+        """
+        self._buffer += text
+        if self.dialect is None:
+            if len(self._buffer) < dialects.SNIFF_CHARS:
+                return []
+            self.dialect = dialects.detect_dialect(self._buffer) or dialects.DEFAULT_DIALECT
+        cut = self._buffer.rfind('\n') + 1
+        if cut == 0:
+            return []
+        segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._parse(segment)
+
+    def close(self):
+        """
+        Parses the remaining text and returns the last messages
+
+        Returns:
+            list - List of (date, time, author, message) tuples
+        """
+        if self.dialect is None:
+            self.dialect = dialects.detect_dialect(self._buffer) or dialects.DEFAULT_DIALECT
+        rows = self._parse(self._buffer)
+        self._buffer = ''
+        date, time, author, parts = self._pending
+        rows.append((date, time, author, ' '.join(parts)))
+        self._pending = [None, None, None, []]
+        self._seen_header = False
+        return rows
+
+    def _parse(self, segment):
+        rows = []
+        prev_end = -1
+        for match in self.dialect.header_pattern.finditer(segment):
+            start = match.start()
+            self._pending[3].extend(split_lines(segment[prev_end + 1:start]))
+
+            date, time, author, parts = self._pending
+            if self._seen_header or parts:  # lines before the first header form a message without an author
+                rows.append((date, time, author, ' '.join(parts)))
+
+            date, time, author, message = match.groups()
+            self._pending = [date, time, author, [message]]
+            self._seen_header = True
+            prev_end = match.end()
+
+        self._pending[3].extend(split_lines(segment[prev_end + 1:]))
+        return rows
+
+
+def iter_text_chunks(chatfile, chunk_size=4 * 1024 * 1024, start=0, end=None, progress=None):
+    """
+    Yields the text of the byte range [start, end) of a chat file, decoded chunk by chunk
+    Line endings are normalized to '\n' the way open() does in text mode.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        chunk_size (int, default 4 MiB) - Number of bytes read from the file at a time
+        start (int, default 0) - Offset of the first byte, which must be the beginning of a line
+        end (int, default None) - Offset after the last byte, the end of the file if None
+        progress (callable, default None) - Called with the fraction of the range read after every chunk
+
+    Yields:
+        str
+    """
+    if end is None:
+        end = compression.get_chat_size(chatfile)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+    with compression.open_chat(chatfile) as in_file:
+        in_file.seek(start)
+        position = start
+        while position < end:
+            data = in_file.read(min(chunk_size, end - position))
+            if not data:
+                break
+            position += len(data)
+            text = decoder.decode(data)
+            if text:
+                yield text
+            if progress is not None:
+                progress((position - start) / max(end - start, 1))
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def get_distinct_dates(chatfile, chunk_size=4 * 1024 * 1024, start=0, dialect=None):
+    """
+    Returns the distinct dates of the message headers of a chat file, found with a quick scan of its bytes
+    They tell the date format of the whole chat before any of it is parsed, see analysis.detect_date_format.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        chunk_size (int, default 4 MiB) - Number of bytes read from the file at a time
+        start (int, default 0) - Offset of the first byte scanned, which must be the beginning of a line
+        dialect (dialects.Dialect, default None) - Dialect of the chat, see detect_file_dialect if None
+
+    Returns:
+        list - Sorted date strings
+    """
+    if dialect is None:
+        dialect = detect_file_dialect(chatfile)
+    date_pattern = dialect.date_pattern
+    dates = set()
+    rest = b''
+    with compression.open_chat(chatfile) as in_file:
+        in_file.seek(start)
+        while True:
+            data = in_file.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b'\n') + 1
+            dates.update(date_pattern.findall(data, 0, cut))
+            rest = data[cut:]
+    dates.update(date_pattern.findall(rest))
+    return sorted(date.decode('ascii') for date in dates)
+
+
+def iter_chat_batches(chatfile, batch_size=100000, chunk_size=4 * 1024 * 1024, progress=None, start=0, end=None,
+                      dialect=None):
+    """
+    Yields the messages of a chat file as Pandas DataFrames of at most batch_size rows
+    The file is read chunk_size bytes at a time, so memory use doesn't depend on the size of the chat.
+
+    Arguments:
+        chatfile (str) - Path of the chat file
+        batch_size (int, default 100000) - Maximum number of messages per DataFrame
+        chunk_size (int, default 4 MiB) - Number of bytes read from the file at a time
+        progress (callable, default None) - Called with the fraction of the file read after every chunk
+        start (int, default 0) - Offset of the first byte to parse, which must be the beginning of a line
+        end (int, default None) - Offset after the last byte to parse, the end of the file if None
+        dialect (dialects.Dialect, default None) - Dialect of the chat. If None, it is detected on the beginning of
+            the file, even when parsing starts further
+
+    Yields:
+        Pandas.DataFrame ('Date', 'Time', 'Author', 'Message')
+    """
+    if dialect is None and start > 0:
+        dialect = detect_file_dialect(chatfile)
+    columns = [analysis.KEY_DATE, analysis.KEY_TIME, analysis.KEY_AUTHOR, analysis.KEY_MESSAGE]
+    parser = ChatStreamParser(dialect)
+    rows = []
+    for chunk in iter_text_chunks(chatfile, chunk_size, start, end, progress):
+        rows.extend(parser.feed(chunk))
+        while len(rows) >= batch_size:
+            yield pd.DataFrame(rows[:batch_size], columns=columns)
+            del rows[:batch_size]
+    rows.extend(parser.close())
+    for i in range(0, len(rows), batch_size):
+        yield pd.DataFrame(rows[i:i + batch_size], columns=columns)
@@ -0,0 +1,241 @@
+import json
+import datetime
+import importlib.util
+import numpy as np
+
+FORMAT_ROWS = 'rows'  # lists of [x, count] or [author, [[x, count], ...]] rows, as stored in the payload
+FORMAT_COLUMNAR = 'columnar'  # parallel arrays, see to_columnar
+FORMAT_MSGPACK = 'msgpack'  # columnar, as MessagePack
+FORMAT_ARROW = 'arrow'  # columnar, as an Arrow IPC stream
+
+# Media type of every format served by the API
+FORMATS = {
+    FORMAT_ROWS: 'application/json',
+    FORMAT_COLUMNAR: 'application/json',
+    FORMAT_MSGPACK: 'application/msgpack',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+}
+
+# Optional packages the binary formats are encoded with
+FORMAT_MODULES = {FORMAT_MSGPACK: 'msgpack', FORMAT_ARROW: 'pyarrow'}
+
+# Types of the x values of the rows, see to_columnar
+X_DAY = 'day'  # ISO dates, encoded as days since 1970-01-01
+X_HOUR = 'hour'
+X_LABEL = 'label'  # authors, words or emojis
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Frames with fewer rows, or without dates, are converted by df.values.tolist() and their dates left to the
+# JSON encoder, which is faster than converting them column by column, see get_frame_rows
+MIN_ROWS_BY_COLUMN = 200
+
+
+def can_encode(data_format):
+    """
+    Returns True if the package data_format is encoded with is installed
+    """
+    module = FORMAT_MODULES.get(data_format)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def get_iso_dates(values):
+    """
+    Returns the ISO strings of dates, converted at once rather than one by one as json.JSONEncoder.default does
+
+    Arguments:
+        values (numpy.ndarray of datetime.date) - Dates, none of them missing
+
+    Returns:
+        list of str
+    """
+    # datetime.date.toordinal is much faster than numpy's own conversion of date objects
+    days = np.fromiter(map(datetime.date.toordinal, values), dtype='int64', count=len(values)) - EPOCH_ORDINAL
+    return np.datetime_as_string(days.astype('datetime64[D]'), unit='D').tolist()
+
+
+def get_iso_date_times(values):
+    """
+    Returns the ISO strings, to the second, of date times
+
+    Arguments:
+        values (numpy.ndarray of datetime64) - Date times, NaT for the missing ones
+
+    Returns:
+        list of str - None for the missing date times
+    """
+    values = np.asarray(values, dtype='datetime64[s]')
+    strings = np.datetime_as_string(values, unit='s').tolist()
+    missing = np.isnat(values)
+    if missing.any():
+        return [None if is_missing else string for string, is_missing in zip(strings, missing.tolist())]
+    return strings
+
+
+def get_frame_rows(df):
+    """
+    Returns the rows of a DataFrame as lists, like df.values.tolist() but with the columns of dates
+    (datetime.date) converted to ISO strings column by column in frames of at least MIN_ROWS_BY_COLUMN rows.
+    Smaller frames keep their dates, for analysis.DateTimeEncoder to convert.
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame, e.g. ('Busy X', 'Message Count')
+
+    Returns:
+        list
+    """
+    if df.shape[0] < MIN_ROWS_BY_COLUMN:
+        return df.values.tolist()
+    is_date = [is_date_column(column) for _, column in df.items()]
+    if not any(is_date):
+        return df.values.tolist()
+    columns = [get_iso_dates(column.to_numpy()) if date_column else column.to_numpy().tolist()
+               for (_, column), date_column in zip(df.items(), is_date)]
+    return list(map(list, zip(*columns)))
+
+
+def is_date_column(column):
+    """
+    Returns True if a column holds dates (datetime.date but not datetime.datetime), none of them missing
+    """
+    first = column.iat[0] if len(column) else None
+    return isinstance(first, datetime.date) and not isinstance(first, datetime.datetime) and column.notna().all()
+
+
+def to_epoch_days(dates):
+    """
+    Returns dates as the number of days since 1970-01-01
+
+    Arguments:
+        dates (list) - ISO strings, None for the missing dates, or datetime.date, none of them missing
+
+    Returns:
+        list - Integers, None for the missing dates
+    """
+    if dates and isinstance(dates[0], datetime.date):
+        days = np.fromiter(map(datetime.date.toordinal, dates), dtype='int64', count=len(dates)) - EPOCH_ORDINAL
+        return days.tolist()
+    days = np.array(dates, dtype='datetime64[D]')
+    epoch_days = days.astype('int64').tolist()
+    if None in dates:
+        return [None if missing else day for day, missing in zip(epoch_days, np.isnat(days).tolist())]
+    return epoch_days
+
+
+def to_columnar(rows, by_author=False, x_type=X_LABEL):
+    """
+    Returns the rows of a metric as parallel arrays
+    {'x': [...], 'count': [...], 'x_type': x_type} for [x, count] rows. For [author, [[x, count], ...]] rows,
+    the authors are written once in 'authors' and every point refers to its author by index in 'author'. Days
+    are written as integers, see to_epoch_days. Metrics which aren't rows (e.g. num_msgs) are returned as is.
+
+    Arguments:
+        rows (list) - Rows of the metric, as decoded from the analysis payload or as lists of the values of its
+            DataFrame
+        by_author (bool, default False) - True if the rows are [author, [[x, count], ...]]
+        x_type (str, default X_LABEL) - X_DAY, X_HOUR or X_LABEL
+
+    Returns:
+        dict
+    """
+    if not isinstance(rows, list):
+        return rows
+    columnar = {}
+    if by_author:
+        columnar['authors'] = [author for author, _ in rows]
+        columnar['author'] = [code for code, (_, points) in enumerate(rows) for _ in points]
+        rows = [point for _, points in rows for point in points]
+    x = [row[0] for row in rows]
+    columnar['x'] = to_epoch_days(x) if x_type == X_DAY else x
+    columnar['count'] = [row[1] for row in rows]
+    columnar['x_type'] = x_type
+    return columnar
+
+
+def frames_to_columnar(frames, by_author=False, x_type=X_LABEL):
+    """
+    Returns the DataFrames of a metric as the parallel arrays of to_columnar, converted column by column rather
+    than row by row
+
+    Arguments:
+        frames (Pandas.DataFrame or list) - (x, count) DataFrame of the metric, or [author, DataFrame] lists if
+            by_author is True
+        by_author (bool, default False) - True if frames are [author, DataFrame] lists
+        x_type (str, default X_LABEL) - X_DAY, X_HOUR or X_LABEL
+
+    Returns:
+        dict
+    """
+    columnar = {}
+    if by_author:
+        columnar['authors'] = [author for author, _ in frames]
+        sizes = [frame.shape[0] for _, frame in frames]
+        columnar['author'] = np.repeat(np.arange(len(frames)), sizes).tolist()
+        frames = [frame for _, frame in frames]
+    else:
+        frames = [frames]
+    x = np.concatenate([frame.iloc[:, 0].to_numpy() for frame in frames] or [np.zeros(0)]).tolist()
+    columnar['x'] = to_epoch_days(x) if x_type == X_DAY else x
+    columnar['count'] = np.concatenate([frame.iloc[:, 1].to_numpy(dtype='int64') for frame in frames] or
+                                       [np.zeros(0, dtype='int64')]).tolist()
+    columnar['x_type'] = x_type
+    return columnar
+
+
+def to_compact_json(data):
+    """
+    Returns the json string of data without the spaces json.dumps puts after separators
+    """
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+def to_arrow(columnar, metadata=None):
+    """
+    Returns columnar data as an Arrow IPC stream, with the authors dictionary encoded and the days as date32
+
+    Arguments:
+        columnar (dict or int) - Data returned by to_columnar, a single count for the metrics which aren't rows
+        metadata (dict, default None) - Schema metadata, e.g. the metric and its bucket
+
+    Returns:
+        bytes
+    """
+    import pyarrow as pa
+
+    if not isinstance(columnar, dict):
+        columns = {'count': pa.array([columnar], pa.int64())}
+    else:
+        columns = {}
+        if 'authors' in columnar:
+            columns['author'] = pa.DictionaryArray.from_arrays(pa.array(columnar['author'], pa.int32()),
+                                                               pa.array(columnar['authors'], pa.string()))
+        x_types = {X_DAY: pa.date32(), X_HOUR: pa.int8(), X_LABEL: pa.string()}
+        columns['x'] = pa.array(columnar['x'], x_types[columnar['x_type']])
+        columns['count'] = pa.array(columnar['count'], pa.int64())
+    table = pa.table(columns)
+    if metadata:
+        table = table.replace_schema_metadata({key: json.dumps(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(body, data_format):
+    """
+    Returns an API body in a binary format
+
+    Arguments:
+        body (dict) - Body of the metric ('metric', 'bucket', 'data'), its data in the columnar format
+        data_format (str) - FORMAT_MSGPACK or FORMAT_ARROW, see can_encode
+
+    Returns:
+        bytes
+    """
+    if data_format == FORMAT_MSGPACK:
+        import msgpack
+
+        return msgpack.packb(dict(body, format=data_format), use_bin_type=True)
+    if data_format == FORMAT_ARROW:
+        return to_arrow(body['data'], {'metric': body['metric'], 'bucket': body['bucket']})
+    raise ValueError('Unknown binary format: {}'.format(data_format))
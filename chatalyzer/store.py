@@ -0,0 +1,303 @@
+import os
+import json
+import hashlib
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from chatalyzer import analysis, compression, metrics
+
+STORE_VERSION = 4
+STORE_SUFFIX = '.chat'
+
+META_FILE = 'meta.json'
+MESSAGES_FILE = 'messages.txt'
+DATE_TIME_FILE = 'date_time.npy'
+AUTHOR_CODES_FILE = 'author_codes.npy'
+LETTER_COUNT_FILE = 'letter_count.npy'
+WORD_COUNT_FILE = 'word_count.npy'
+
+
+def get_store_path(upload_folder, analysis_id):
+    """
+    Returns the path of the parsed chat store belonging to an analysis
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        analysis_id (str) - Id of the analysis
+
+    Returns:
+        str
+    """
+    return os.path.join(upload_folder, analysis_id) + STORE_SUFFIX
+
+
+def get_source_signature(source_path):
+    """
+    Returns the size and modification time of the raw chat file, used to detect stale stores
+
+    Arguments:
+        source_path (str) - Path of the raw chat file
+
+    Returns:
+        dict
+    """
+    stat = os.stat(source_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+@metrics.instrumented
+def get_content_hash(source_path, chunk_size=1024 * 1024, size=None):
+    """
+    Returns the SHA-256 hex digest of the raw chat file
+
+    Arguments:
+        source_path (str) - Path of the raw chat file
+        chunk_size (int, default 1 MiB) - Number of bytes hashed at a time
+        size (int, default None) - Number of bytes hashed from the beginning of the file, all of them if None
+
+    Returns:
+        str
+    """
+    sha = hashlib.sha256()
+    remaining = float('inf') if size is None else size
+    with compression.open_chat(source_path) as in_file:
+        while remaining > 0:
+            chunk = in_file.read(int(min(chunk_size, remaining)))
+            if not chunk:
+                break
+            sha.update(chunk)
+            remaining -= len(chunk)
+    return sha.hexdigest()
+
+
+@metrics.instrumented
+def save_chats(df, store_path, source_path, content_hash=None):
+    """
+    Writes a parsed chat DataFrame to a columnar on-disk store
+    Authors are stored as categorical codes, 'Date Time' as int64 nanoseconds and the messages as
+    newline separated UTF-8 text. The store is written to a temporary folder and renamed into place,
+    so readers never see a partial store.
+
+    Arguments:
+        df (Pandas.DataFrame) - DataFrame of chats containing 'Author', 'Message', 'Date Time',
+            'Letter Count' and 'Word Count' columns
+        store_path (str) - Path of the store
+        source_path (str) - Path of the raw chat file the DataFrame was parsed from
+        content_hash (str, default None) - Content hash of the raw chat file if already known, see
+            get_content_hash
+    """
+    tmp_path = store_path + '.' + uuid.uuid4().hex + '.tmp'
+    os.mkdir(tmp_path)
+
+    authors = df[analysis.KEY_AUTHOR].astype('category')
+    date_time = df[analysis.KEY_DATE_TIME].values.astype('datetime64[ns]').view('int64')
+
+    np.save(os.path.join(tmp_path, AUTHOR_CODES_FILE), authors.cat.codes.values.astype('int32'))
+    np.save(os.path.join(tmp_path, DATE_TIME_FILE), date_time)
+    np.save(os.path.join(tmp_path, LETTER_COUNT_FILE), df[analysis.KEY_LETTER_COUNT].values.astype('int32'))
+    np.save(os.path.join(tmp_path, WORD_COUNT_FILE), df[analysis.KEY_WORD_COUNT].values.astype('int32'))
+
+    # Messages never contain a newline since get_chats joins multi-line messages with spaces
+    with open(os.path.join(tmp_path, MESSAGES_FILE), 'w', encoding='utf-8') as out_file:
+        out_file.write('\n'.join(df[analysis.KEY_MESSAGE]))
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': get_source_signature(source_path),
+        'content_hash': content_hash or get_content_hash(source_path),
+        'num_rows': int(df.shape[0]),
+        'authors': list(authors.cat.categories),
+    }
+    with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as out_file:
+        json.dump(meta, out_file)
+
+    invalidate_chats(store_path)
+    try:
+        os.rename(tmp_path, store_path)
+    except OSError:  # another process wrote the store in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_meta(store_path, source_path):
+    """
+    Returns the metadata of the on-disk store
+    None is returned if the store doesn't exist or is stale, i.e. it was written by another store version
+    or the raw chat file changed since.
+
+    Arguments:
+        store_path (str) - Path of the store
+        source_path (str) - Path of the raw chat file the store was built from
+
+    Returns:
+        dict or None
+    """
+    try:
+        with open(os.path.join(store_path, META_FILE), 'r', encoding='utf-8') as in_file:
+            meta = json.load(in_file)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != STORE_VERSION or meta.get('source') != get_source_signature(source_path):
+        return None
+    return meta
+
+
+@metrics.instrumented
+def load_chats(store_path, source_path):
+    """
+    Returns the parsed chat DataFrame from the on-disk store
+    The numeric columns are memory-mapped. None is returned if the store doesn't exist or is stale.
+
+    Arguments:
+        store_path (str) - Path of the store
+        source_path (str) - Path of the raw chat file the store was built from
+
+    Returns:
+        Pandas.DataFrame ('Author', 'Message', 'Date Time', 'Letter Count', 'Word Count') or None
+    """
+    meta = read_meta(store_path, source_path)
+    if meta is None:
+        return None
+
+    with open(os.path.join(store_path, MESSAGES_FILE), 'r', encoding='utf-8') as in_file:
+        messages = in_file.read().split('\n')
+
+    author_codes = np.load(os.path.join(store_path, AUTHOR_CODES_FILE), mmap_mode='r')
+    date_time = np.load(os.path.join(store_path, DATE_TIME_FILE), mmap_mode='r')
+
+    df = pd.DataFrame({
+        analysis.KEY_AUTHOR: pd.Categorical.from_codes(author_codes, categories=meta['authors']),
+        analysis.KEY_MESSAGE: messages,
+        analysis.KEY_DATE_TIME: date_time.view('datetime64[ns]'),
+        analysis.KEY_LETTER_COUNT: np.load(os.path.join(store_path, LETTER_COUNT_FILE), mmap_mode='r'),
+        analysis.KEY_WORD_COUNT: np.load(os.path.join(store_path, WORD_COUNT_FILE), mmap_mode='r'),
+    })
+
+    os.utime(os.path.join(store_path, META_FILE))  # records the access for evict_uploads
+    return df
+
+
+def invalidate_chats(store_path):
+    """
+    Removes the on-disk store so that the chat is parsed again on the next load
+
+    Arguments:
+        store_path (str) - Path of the store
+    """
+    if os.path.isdir(store_path):
+        shutil.rmtree(store_path, ignore_errors=True)
+
+
+def get_path_size(path):
+    """
+    Returns the size in bytes of a file or of all the files inside a folder
+
+    Arguments:
+        path (str) - Path of a file or folder
+
+    Returns:
+        int
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def get_last_access(path):
+    """
+    Returns the time a file or a store was last used
+
+    Arguments:
+        path (str) - Path of a file or store
+
+    Returns:
+        float - Seconds since the epoch
+    """
+    meta_path = os.path.join(path, META_FILE)
+    if os.path.isfile(meta_path):
+        return os.path.getmtime(meta_path)
+    return os.path.getmtime(path)
+
+
+def evict_uploads(upload_folder, max_bytes, keep=()):
+    """
+    Removes the least recently used analyses from the upload folder until it fits in max_bytes
+    An analysis is the raw chat file together with everything derived from it, i.e. all the entries
+    named '<analysis_id>.*'.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        max_bytes (int) - Maximum size of the upload folder in bytes
+        keep (iterable of str) - Ids of the analyses that must not be evicted
+
+    Returns:
+        list - Ids of the evicted analyses
+    """
+    entries = {}
+    for name in os.listdir(upload_folder):
+        analysis_id = name.split('.', 1)[0]
+        path = os.path.join(upload_folder, name)
+        try:
+            size, last_access = get_path_size(path), get_last_access(path)
+        except OSError:  # removed by a concurrent eviction
+            continue
+        total_size, latest_access, paths = entries.get(analysis_id, (0, 0.0, []))
+        entries[analysis_id] = (total_size + size, max(latest_access, last_access), paths + [path])
+
+    total_bytes = sum(size for size, _, _ in entries.values())
+    evicted = []
+    for analysis_id, (size, _, paths) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total_bytes <= max_bytes:
+            break
+        if analysis_id in keep:
+            continue
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        total_bytes -= size
+        evicted.append(analysis_id)
+
+    return evicted
+
+
+def migrate_uploads(upload_folder, level=compression.DEFAULT_LEVEL):
+    """
+    Compresses the plain chat files of the upload folder, see compression.CompressedChatWriter
+    The stores built from a chat are kept valid, and so are the cached results and the saved aggregates since
+    they are keyed by the content of the chat rather than by its file.
+
+    Arguments:
+        upload_folder (str) - Folder containing the uploaded chats
+        level (int, default compression.DEFAULT_LEVEL) - zlib compression level
+
+    Returns:
+        list - (analysis id, plain size, compressed size) of every chat compressed
+    """
+    migrated = []
+    for name in sorted(os.listdir(upload_folder)):
+        analysis_id, suffix = os.path.splitext(name)
+        source_path = os.path.join(upload_folder, name)
+        if suffix != compression.CHAT_SUFFIX or '.' in analysis_id or not os.path.isfile(source_path):
+            continue
+
+        store_path = get_store_path(upload_folder, analysis_id)
+        meta = read_meta(store_path, source_path)
+        target_path = os.path.join(upload_folder, analysis_id) + compression.COMPRESSED_SUFFIX
+        compression.compress_chat(source_path, target_path, level)
+        if meta is not None:
+            meta['source'] = get_source_signature(target_path)
+            tmp_path = os.path.join(store_path, META_FILE) + '.' + uuid.uuid4().hex + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as out_file:
+                json.dump(meta, out_file)
+            os.replace(tmp_path, os.path.join(store_path, META_FILE))
+        migrated.append((analysis_id, os.path.getsize(source_path), os.path.getsize(target_path)))
+        os.remove(source_path)
+    return migrated
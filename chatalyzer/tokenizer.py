@@ -0,0 +1,113 @@
+import os
+import re
+import string
+import threading
+from collections import Counter
+from chatalyzer import emoji_scanner
+
+MISC_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", "misc")
+
+# Stopword lists shipped with the package, one word per line
+STOPWORD_FILES = {
+    'en': os.path.join(MISC_FOLDER, "trivial_words.txt"),
+}
+
+DEFAULT_LANGUAGE = 'en'
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+class Tokenizer:
+    """
+    Splits messages into words and counts them, leaving out stopwords, digits and emojis
+    Stopwords are matched case insensitively. Build it once with get_tokenizer and reuse it.
+    """
+
+    def __init__(self, stopwords):
+        self.stopwords = frozenset(word.casefold() for word in stopwords) | frozenset(string.digits)
+        self.emojis = emoji_scanner.get_emoji_set()
+        self.punctuation_pattern = re.compile('[' + re.escape(string.punctuation) + ']')
+
+    def is_unwanted(self, word):
+        """
+        Returns True if word is a stopword, a digit or an emoji
+        """
+        return word.casefold() in self.stopwords or word in self.emojis
+
+    def tokenize(self, message):
+        """
+        Returns the words of a message, punctuation removed
+
+        Arguments:
+            message (str) - Text of the message
+
+        Returns:
+            list
+        """
+        return self.punctuation_pattern.sub('', message).split()
+
+    def count_words(self, messages):
+        """
+        Returns a Counter of the wanted words of the messages
+        All the messages are processed at once: punctuation is removed from the joined text with a single
+        regex pass, the words are counted and the unwanted ones are dropped from the (much smaller) set of
+        distinct words. Words are in order of first appearance, as if counted message by message.
+
+        Arguments:
+            messages (iterable of str) - Texts of the messages, e.g. the 'Message' column of the chats
+
+        Returns:
+            collections.Counter
+        """
+        counter = Counter(self.tokenize('\n'.join(messages)))
+        for word in [word for word in counter if self.is_unwanted(word)]:
+            del counter[word]
+        return counter
+
+
+def read_stopwords(path):
+    """
+    Returns the words of a stopword file, one word per line
+
+    Arguments:
+        path (str) - Path of the stopword file
+
+    Returns:
+        list
+    """
+    with open(path, 'r', encoding='utf-8') as in_file:
+        return [line.strip() for line in in_file if line.strip()]
+
+
+def register_stopwords(language, stopwords):
+    """
+    Adds or replaces the stopword list of a language
+
+    Arguments:
+        language (str) - Language code, e.g. 'en'
+        stopwords (str or iterable of str) - Path of a stopword file, or the stopwords themselves
+    """
+    with _tokenizers_lock:
+        STOPWORD_FILES[language] = stopwords
+        _tokenizers.pop(language, None)
+
+
+def get_tokenizer(language=DEFAULT_LANGUAGE):
+    """
+    Returns the Tokenizer of a language, built on first use and shared by the whole process
+
+    Arguments:
+        language (str, default 'en') - Language code of a registered stopword list
+
+    Returns:
+        Tokenizer
+    """
+    tokenizer = _tokenizers.get(language)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            stopwords = STOPWORD_FILES[language]
+            if isinstance(stopwords, str):
+                stopwords = read_stopwords(stopwords)
+            tokenizer = _tokenizers[language] = Tokenizer(stopwords)
+    return tokenizer
@@ -0,0 +1,153 @@
+import numpy as np
+from collections import Counter
+
+# Bytes held by every item of a FrequentItems, a short str key and an int value in a dict, see get_capacity
+BYTES_PER_ITEM = 120
+
+# Items held at most while counting, per item of capacity: up to twice the capacity in the summary while a batch
+# is added (see FrequentItems.update) and the exact counts of a batch of at most capacity items
+PEAK_ITEMS_PER_CAPACITY = 3
+
+
+def get_capacity(memory_bytes):
+    """
+    Returns the capacity of a FrequentItems which, fed batches of at most that many items, is counted within
+    about memory_bytes, see analysis.get_top_k_batches
+
+    Arguments:
+        memory_bytes (int) - Memory cap
+
+    Returns:
+        int
+    """
+    return max(int(memory_bytes // (BYTES_PER_ITEM * PEAK_ITEMS_PER_CAPACITY)), 1)
+
+
+class FrequentItems:
+    """
+    Approximate counts of the most frequent items of a stream, holding at most capacity items (Misra-Gries)
+    Items are added a batch at a time, e.g. the Counter of the words of a batch of messages. Whenever more than
+    capacity items are held after a batch, or twice the capacity while one is added, the count of the
+    (capacity + 1)th most frequent one is taken off every count and the items left without any are dropped.
+    So a count is never above the true count, and at most error below it, error being at most
+    total / (capacity + 1). Every item more frequent than that is held.
+    Summaries of consecutive (or any) parts of a stream combine with update(), their errors adding up, so that
+    batches, shards and incremental analyses can be counted separately.
+    The interface is the part of collections.Counter used by the analysis: update(), most_common() and items().
+    """
+
+    def __init__(self, capacity, counts=None, total=0, error=0):
+        if capacity < 1:
+            raise ValueError('The capacity of a FrequentItems must be at least 1')
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self.total = total  # sum of the true counts of every item added
+        self.error = error  # bound of the difference between a true count and the count held
+
+    def __len__(self):
+        return len(self.counts)
+
+    def update(self, other):
+        """
+        Adds counts to the summary
+
+        Arguments:
+            other (collections.Counter, dict or FrequentItems) - Counts of items
+        """
+        if isinstance(other, FrequentItems):
+            self.total += other.total
+            self.error += other.error
+            other = other.counts
+        else:
+            self.total += sum(other.values())
+        counts = self.counts
+        limit = 2 * self.capacity
+        for item, count in other.items():
+            counts[item] = counts.get(item, 0) + count
+            if len(counts) >= limit:
+                self._prune()
+                counts = self.counts
+        if len(counts) > self.capacity:
+            self._prune()
+
+    def _prune(self):
+        items = list(self.counts)
+        counts = np.fromiter(self.counts.values(), dtype='int64', count=len(items))
+        # count of the (capacity + 1)th most frequent item
+        threshold = int(np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1])
+        counts -= threshold
+        kept = np.flatnonzero(counts > 0)
+        self.counts = {items[i]: int(counts[i]) for i in kept}
+        self.error += threshold
+
+    def most_common(self, n=None):
+        """
+        Returns the n most frequent items held and their counts, see collections.Counter.most_common
+
+        Arguments:
+            n (int, default None) - Number of items required, all of them if None
+
+        Returns:
+            list - List of (item, count) tuples
+        """
+        return Counter(self.counts).most_common(n)
+
+    def items(self):
+        return self.counts.items()
+
+    def to_dict(self):
+        """
+        Returns the summary as JSON serializable data, see from_dict
+        """
+        return {'capacity': self.capacity, 'counts': list(self.counts.items()), 'total': self.total,
+                'error': self.error}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the summary saved with to_dict
+        """
+        return cls(data['capacity'], dict(data['counts']), data['total'], data['error'])
+
+
+def new_counter(capacity=None):
+    """
+    Returns an empty counter of items, exact or approximate
+
+    Arguments:
+        capacity (int, default None) - Number of items held by the FrequentItems returned, None for an exact
+            collections.Counter
+
+    Returns:
+        collections.Counter or FrequentItems
+    """
+    if capacity is None:
+        return Counter()
+    return FrequentItems(capacity)
+
+
+def get_total(counter):
+    """
+    Returns the sum of the true counts of the items of a counter, exact or approximate
+    """
+    if isinstance(counter, FrequentItems):
+        return counter.total
+    return sum(counter.values())
+
+
+def counter_to_dict(counter):
+    """
+    Returns a counter, exact or approximate, as JSON serializable data, see counter_from_dict
+    """
+    if isinstance(counter, FrequentItems):
+        return counter.to_dict()
+    return list(counter.items())
+
+
+def counter_from_dict(data):
+    """
+    Returns the counter saved with counter_to_dict
+    """
+    if isinstance(data, dict):
+        return FrequentItems.from_dict(data)
+    return Counter(dict(data))
@@ -0,0 +1,278 @@
+import io
+import zlib
+import uuid
+import codecs
+import struct
+import hashlib
+import pandas as pd
+from chatalyzer import analysis, compression, dialects, parsing
+
+ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+ZIP_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Largest piece of a zip entry decompressed at a time, so that size limits apply before zip bombs expand
+INFLATE_PIECE_BYTES = 1024 * 1024
+
+# A chat must have a message header within its first SNIFF_BYTES to be accepted
+SNIFF_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Raised when an uploaded chat is rejected, with the message shown to the user and the HTTP status
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ZipChatStream:
+    """
+    Extracts the chat of a WhatsApp zip export from consecutive chunks of the zip file
+    Only the local file headers are read, so the chat is decompressed as the zip arrives rather than once its
+    central directory, at the end, is received. The chat is the first '.txt' entry, entries before it (e.g.
+    media) are skipped and everything after it is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._state = 'header'  # 'header', 'copy', 'inflate', 'descriptor' or 'done'
+        self._remaining = 0  # bytes left of a stored entry
+        self._inflater = None
+        self._is_chat = False
+        self._has_descriptor = False
+        self._entries = 0
+        self.found = False
+
+    def feed(self, data):
+        """
+        Yields the pieces of the chat decompressed from the next chunk of the zip file
+
+        Arguments:
+            data (bytes) - Next chunk of the zip file
+
+        Yields:
+            bytes
+        """
+        self._buffer += data
+        while self._buffer:
+            if self._state == 'done':
+                self._buffer = b''
+            elif self._state == 'header':
+                if len(self._buffer) < ZIP_LOCAL_HEADER.size:
+                    return
+                if not self._read_header():
+                    return
+            elif self._state == 'copy':
+                n = min(self._remaining, len(self._buffer))
+                if self._is_chat and n:
+                    yield self._buffer[:n]
+                self._buffer = self._buffer[n:]
+                self._remaining -= n
+                if self._remaining == 0:
+                    self._end_entry()
+            elif self._state == 'inflate':
+                piece = self._inflater.decompress(self._buffer, INFLATE_PIECE_BYTES)
+                if self._inflater.eof:
+                    self._buffer = self._inflater.unused_data
+                else:
+                    self._buffer = self._inflater.unconsumed_tail
+                if self._is_chat and piece:
+                    yield piece
+                if self._inflater.eof:
+                    self._end_entry()
+            elif self._state == 'descriptor':
+                size = 16 if self._buffer.startswith(ZIP_DESCRIPTOR_SIGNATURE) else 12
+                if len(self._buffer) < size:
+                    return
+                self._buffer = self._buffer[size:]
+                self._state = 'header'
+
+    def close(self):
+        """
+        Checks that the whole chat was extracted
+        """
+        if not self.found:
+            raise UploadError('No chat was found in the zip file')
+
+    def _read_header(self):
+        signature, _, flags, method, _, _, _, compressed_size, _, name_length, extra_length = \
+            ZIP_LOCAL_HEADER.unpack_from(self._buffer)
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            if self._entries == 0:
+                raise UploadError('Not a zip file')
+            raise UploadError('No chat was found in the zip file')  # central directory reached
+        header_size = ZIP_LOCAL_HEADER.size + name_length + extra_length
+        if len(self._buffer) < header_size:
+            return False
+
+        name = self._buffer[ZIP_LOCAL_HEADER.size:ZIP_LOCAL_HEADER.size + name_length].decode('utf-8', 'replace')
+        self._buffer = self._buffer[header_size:]
+        self._entries += 1
+        self._is_chat = name.lower().endswith('.txt') and not name.startswith('__MACOSX/')
+        self._has_descriptor = bool(flags & 0x08)
+        if flags & 0x01:
+            raise UploadError('Encrypted zip files are not supported')
+        if method == ZIP_DEFLATED:
+            self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._state = 'inflate'
+        elif method == ZIP_STORED and not self._has_descriptor and compressed_size != 0xFFFFFFFF:
+            self._remaining = compressed_size
+            self._state = 'copy'
+            if self._remaining == 0:
+                self._end_entry()
+        else:
+            raise UploadError('Unsupported zip compression')
+        return True
+
+    def _end_entry(self):
+        if self._is_chat:
+            self.found = True
+            self._state = 'done'
+        elif self._has_descriptor:
+            self._state = 'descriptor'
+        else:
+            self._state = 'header'
+
+
+class ChatUpload(io.RawIOBase):
+    """
+    Writable stream receiving an uploaded chat (or zip export) as the request body arrives
+    The chat is written to the upload folder, compressed if compress is set, hashed, and parsed with
+    parsing.ChatStreamParser on the fly, so that it never needs to be read again from disk unless it is at
+    least parse_max_bytes large.
+    Uploads larger than max_bytes, and chats without a message header in their first SNIFF_BYTES, are rejected
+    with an UploadError as soon as it shows.
+    """
+
+    def __init__(self, upload_folder, filename, max_bytes, parse_max_bytes, compress=False,
+                 level=compression.DEFAULT_LEVEL):
+        super().__init__()
+        self.analysis_id = uuid.uuid4().hex
+        self._out = compression.open_chat_writer(upload_folder, self.analysis_id, compress, level)
+        self.path = self._out.path
+        self.content_hash = None
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.parse_max_bytes = parse_max_bytes
+        self._received = 0
+        self._sha = hashlib.sha256()
+        self._zip = ZipChatStream() if filename.lower().endswith('.zip') else None
+        self._decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+        self._sniff = ''
+        self._sniffed = False
+        self._parser = parsing.ChatStreamParser()
+        self._rows = []
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._received
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # werkzeug rewinds the stream once the upload is complete, but nothing is read back, so the position
+        # stays at the end of what was received
+        return self._received
+
+    def write(self, data):
+        """
+        Writes and parses the next chunk of the upload
+
+        Arguments:
+            data (bytes) - Next chunk of the uploaded file
+
+        Returns:
+            int - Number of bytes consumed
+        """
+        try:
+            self._received += len(data)
+            if self._received > self.max_bytes:
+                raise UploadError('The file is larger than {:g} MiB'.format(round(self.max_bytes / 1024 ** 2, 1)), 413)
+            if self._zip is None:
+                self._write_chat(data)
+            else:
+                for piece in self._zip.feed(data):
+                    self._write_chat(piece)
+        except (UploadError, UnicodeDecodeError) as error:
+            self.discard()
+            if isinstance(error, UnicodeDecodeError):
+                raise UploadError('The chat is not UTF-8 text')
+            raise
+        return len(data)
+
+    def _write_chat(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadError('The chat is larger than {:g} MiB'.format(round(self.max_bytes / 1024 ** 2, 1)), 413)
+        self._out.write(data)
+        self._sha.update(data)
+
+        if self._parser is not None and self.size > self.parse_max_bytes:  # left to the streaming analysis
+            self._parser, self._rows = None, None
+        if self._parser is None and self._sniffed:
+            # nothing is decoded anymore, so a character split by the last chunk decoded isn't an error
+            self._decoder = None
+            return
+        text = self._decoder.decode(data)
+        if self._parser is not None:
+            self._rows.extend(self._parser.feed(text))
+        if not self._sniffed:
+            self._sniff += text
+            if len(self._sniff) >= SNIFF_BYTES:
+                self._check_sniff()
+
+    def _check_sniff(self):
+        self._sniffed = True
+        if dialects.detect_dialect(self._sniff) is None:
+            raise UploadError('The file is not a WhatsApp chat export')
+        self._sniff = ''
+
+    def finish(self):
+        """
+        Completes the upload, moving the chat to path
+
+        Returns:
+            Pandas.DataFrame ('Date', 'Time', 'Author', 'Message') of the messages, or None if the chat is too
+            large to be parsed on the fly
+        """
+        try:
+            if self._zip is not None:
+                self._zip.close()
+            if self._decoder is not None:
+                text = self._decoder.decode(b'', final=True)
+                if self._parser is not None:
+                    self._rows.extend(self._parser.feed(text))
+            if not self._sniffed:
+                self._check_sniff()
+        except UnicodeDecodeError:
+            self.discard()
+            raise UploadError('The chat is not UTF-8 text')
+        except UploadError:
+            self.discard()
+            raise
+
+        self._out.close()
+        self.content_hash = self._sha.hexdigest()
+        if self._parser is None:
+            return None
+        self._rows.extend(self._parser.close())
+        columns = [analysis.KEY_DATE, analysis.KEY_TIME, analysis.KEY_AUTHOR, analysis.KEY_MESSAGE]
+        df = pd.DataFrame(self._rows, columns=columns)
+        self._parser, self._rows = None, None
+        return df
+
+    def discard(self):
+        """
+        Drops the upload and its partially written chat
+        """
+        self._parser, self._rows = None, None
+        self._out.discard()
+
+    def close(self):
+        self.discard()  # no-op once finish() moved the chat into place
+        super().close()
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+# The synthetic exports of the benchmarks are the fixtures of the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic_chat import write_chat  # noqa: E402
+
+
+@pytest.fixture
+def make_chat(tmp_path):
+    """
+    Returns a function writing a synthetic chat export to tmp_path and returning its path, see
+    synthetic_chat.generate_lines for the keyword arguments
+    """
+    def make(n_messages=2000, name='chat.txt', **kwargs):
+        path = str(tmp_path / name)
+        write_chat(path, n_messages, **kwargs)
+        return path
+    return make
@@ -0,0 +1,60 @@
+import datetime
+import json
+import numpy as np
+import pytest
+from chatalyzer import activity, analysis, chatalyzer
+
+
+def assert_same_cube(cube, expected):
+    assert cube.authors == expected.authors
+    assert cube.first_day == expected.first_day
+    assert cube.undated == expected.undated
+    for name in activity.CUBE_ARRAYS:
+        np.testing.assert_array_equal(getattr(cube, name), getattr(expected, name))
+
+
+@pytest.fixture
+def chat(make_chat):
+    return chatalyzer.parse_chats(make_chat(5000, platform='android', membership_ratio=0.01))
+
+
+RANGES = [(None, None), (datetime.date(2018, 1, 20), datetime.date(2018, 2, 10)), (None, datetime.date(2018, 1, 3)),
+          (datetime.date(2018, 2, 1), None), (datetime.date(2030, 1, 1), None), (None, datetime.date(2000, 1, 1))]
+
+
+def test_merge_of_parts_is_the_cube_of_the_whole(chat):
+    cube = analysis.get_activity_cube(chat)
+    merged = activity.ActivityCube.empty()
+    for start in range(0, chat.shape[0], 1700):
+        merged.merge(analysis.get_activity_cube(chat.iloc[start:start + 1700]))
+    assert_same_cube(merged, cube)
+
+
+def test_select_matches_the_metrics_of_the_messages_of_the_range(chat):
+    cube = analysis.get_activity_cube(chat)
+    start, end = datetime.date(2018, 1, 20), datetime.date(2018, 2, 10)
+    days = chat[analysis.KEY_DATE_TIME].dt.date
+    expected = analysis.get_activity_cube(chat[(days >= start) & (days <= end)])
+    selected = cube.select(start, end)
+    assert selected.first_day == expected.first_day
+    assert analysis.get_metric(None, 'top_message_senders', selected) == \
+        analysis.get_metric(None, 'top_message_senders', expected)
+    assert analysis.get_metric(None, 'daywise_message_count', selected) == \
+        analysis.get_metric(None, 'daywise_message_count', expected)
+
+
+@pytest.mark.parametrize('start, end', RANGES)
+def test_binary_round_trip(chat, start, end):
+    cube = analysis.get_activity_cube(chat)
+    assert_same_cube(activity.ActivityCube.from_bytes(cube.to_bytes(), start, end), cube.select(start, end))
+
+
+def test_dict_round_trip(chat):
+    cube = analysis.get_activity_cube(chat)
+    assert_same_cube(activity.ActivityCube.from_dict(json.loads(json.dumps(cube.to_dict()))), cube)
+
+
+def test_empty_cube_round_trip():
+    cube = activity.ActivityCube.empty()
+    assert_same_cube(activity.ActivityCube.from_bytes(cube.to_bytes()), cube)
+    assert analysis.get_metric(None, 'top_message_senders', cube) == '[]'
@@ -0,0 +1,109 @@
+import json
+import shutil
+from datetime import date, timedelta
+import pytest
+from chatalyzer import analysis, chatalyzer, serialization
+
+
+@pytest.fixture
+def make_client(tmp_path, make_chat):
+    """
+    Returns a function creating a test client of an app whose upload folder holds a synthetic chat 'chat'
+    """
+    def make(**config):
+        upload_folder = tmp_path / 'uploads'
+        upload_folder.mkdir(exist_ok=True)
+        shutil.copy(make_chat(3000, membership_ratio=0.01), str(upload_folder / 'chat.txt'))
+        app = chatalyzer.create_app(dict({'UPLOAD_FOLDER': str(upload_folder),
+                                          'RESULT_CACHE_FOLDER': str(tmp_path / 'results'),
+                                          'ANALYSIS_JOBS': False}, **config))
+        return app.test_client()
+    return make
+
+
+@pytest.mark.parametrize('cube_cache_max_bytes', [8 * 1024 ** 2, 0])
+def test_date_range_metrics(make_client, cube_cache_max_bytes):
+    client = make_client(CUBE_CACHE_MAX_BYTES=cube_cache_max_bytes)
+    assert client.get('/analysis/chat').status_code == 200
+    with client.application.app_context():
+        df = chatalyzer.load_chats('chat')
+    days = df[analysis.KEY_DATE_TIME].dt.strftime('%Y-%m-%d')
+    expected = analysis.get_metric(df[(days >= '2018-01-10') & (days <= '2018-01-20')], 'top_message_senders')
+
+    response = client.get('/api/analysis/chat/top_message_senders?start=2018-01-10&end=2018-01-20')
+    assert response.status_code == 200
+    assert response.get_json()['data'] == json.loads(expected)
+
+
+def from_columnar(data):
+    """
+    Returns the rows of the columnar data of a metric, see serialization.to_columnar
+    """
+    if not isinstance(data, dict) or 'x_type' not in data:
+        return data
+    x = data['x']
+    if data['x_type'] == serialization.X_DAY:
+        x = [None if day is None else (date(1970, 1, 1) + timedelta(days=day)).isoformat() for day in x]
+    if 'authors' not in data:
+        return [[value, count] for value, count in zip(x, data['count'])]
+    rows = [[author, []] for author in data['authors']]
+    for code, value, count in zip(data['author'], x, data['count']):
+        rows[code][1].append([value, count])
+    return rows
+
+
+@pytest.mark.parametrize('cube_cache_max_bytes', [8 * 1024 ** 2, 0])
+@pytest.mark.parametrize('query', ['', 'bucket=week&', 'bucket=month&', 'start=2018-01-10&end=2018-01-20&'])
+def test_columnar_format_holds_the_rows(make_client, query, cube_cache_max_bytes):
+    client = make_client(CUBE_CACHE_MAX_BYTES=cube_cache_max_bytes)
+    assert client.get('/analysis/chat').status_code == 200  # caches the payload, and the cube if it fits
+    for metric in analysis.METRICS:
+        if ('start' in query and metric not in analysis.ACTIVITY_METRICS or
+                'bucket' in query and metric not in analysis.TIMELINE_METRICS):
+            continue
+        rows = client.get('/api/analysis/chat/{}?{}'.format(metric, query)).get_json()
+        columnar = client.get('/api/analysis/chat/{}?{}format=columnar'.format(metric, query)).get_json()
+        assert columnar['format'] == serialization.FORMAT_COLUMNAR
+        assert columnar['bucket'] == rows['bucket']
+        assert from_columnar(columnar['data']) == rows['data'], metric
+
+
+def test_formats_are_negotiated(make_client, monkeypatch):
+    client = make_client()
+    url = '/api/analysis/chat/authorwise_daywise_message_count?format=columnar'
+    response = client.get(url)
+    assert response.status_code == 200
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/analysis/chat/word_count?format=xml').status_code == 400
+    assert client.get('/api/analysis/chat/group_timeline?format=arrow').status_code == 406
+
+    monkeypatch.setattr(serialization, 'can_encode', lambda data_format: False)
+    assert client.get('/api/analysis/chat/word_count?format=msgpack').status_code == 406
+
+
+def test_binary_bodies_are_encoded_from_the_columnar_data_and_cached(make_client, monkeypatch):
+    client = make_client()
+    encoded = []
+
+    def encode(body, data_format):
+        encoded.append(body)
+        return json.dumps(body).encode('utf-8')
+
+    monkeypatch.setattr(serialization, 'can_encode', lambda data_format: True)
+    monkeypatch.setattr(serialization, 'encode', encode)
+    url = '/api/analysis/chat/authorwise_busiest_time?format=msgpack'
+    first, second = client.get(url), client.get(url)
+    assert first.status_code == second.status_code == 200
+    assert first.mimetype == serialization.FORMATS[serialization.FORMAT_MSGPACK]
+    assert first.data == second.data
+    assert len(encoded) == 1
+    columnar = client.get('/api/analysis/chat/authorwise_busiest_time?format=columnar').get_json()
+    assert encoded[0] == {'metric': 'authorwise_busiest_time', 'bucket': None, 'data': columnar['data']}
+
+
+def test_msgpack_format():
+    msgpack = pytest.importorskip('msgpack')
+    body = {'metric': 'word_count', 'bucket': 'day', 'format': serialization.FORMAT_COLUMNAR,
+            'data': serialization.to_columnar([['Bruce', 3], ['Tony', 2]])}
+    decoded = msgpack.unpackb(serialization.encode(body, serialization.FORMAT_MSGPACK), raw=False)
+    assert decoded == dict(body, format=serialization.FORMAT_MSGPACK)
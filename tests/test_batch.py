@@ -0,0 +1,23 @@
+import os
+from chatalyzer import batch, compression
+
+
+def test_compressed_chats_report_the_size_of_their_text(tmp_path, make_chat):
+    chat_path = make_chat(2000)
+    compressed_path = str(tmp_path / 'chat.txtz')
+    compression.compress_chat(chat_path, compressed_path)
+    assert os.path.getsize(compressed_path) < os.path.getsize(chat_path)
+
+    rows = [batch.analyze_to_file(path, str(tmp_path / name), 64 * 1024 ** 2, 100000)
+            for path, name in [(chat_path, 'plain.json'), (compressed_path, 'compressed.json')]]
+    assert [row['status'] for row in rows] == ['ok', 'ok']
+    assert rows[0]['bytes'] == rows[1]['bytes'] == os.path.getsize(chat_path)
+    assert rows[0]['num_msgs'] == rows[1]['num_msgs']
+
+
+def test_unreadable_compressed_chat_is_reported(tmp_path):
+    broken_path = tmp_path / 'broken.txtz'
+    broken_path.write_bytes(b'not compressed')
+    row = batch.analyze_to_file(str(broken_path), str(tmp_path / 'broken.json'), 64 * 1024 ** 2, 100000)
+    assert row['status'] == 'error'
+    assert row['bytes'] is None
@@ -0,0 +1,68 @@
+import shutil
+import sqlite3
+import time
+from chatalyzer import cache
+
+
+def get_disk_keys(folder):
+    with sqlite3.connect(str(folder / cache.DATABASE_FILE)) as connection:
+        return sorted(key for key, in connection.execute('SELECT key FROM results'))
+
+
+def test_values_are_shared_through_the_disk(tmp_path):
+    writer = cache.ResultCache(str(tmp_path), 1024 ** 2, 1024 ** 2)
+    writer.set('payload', {'num_msgs': 3})
+    writer.set('cube', b'\x00\x01binary')
+    reader = cache.ResultCache(str(tmp_path), 1024 ** 2, 1024 ** 2)
+    assert reader.get('payload') == {'num_msgs': 3}
+    assert reader.get('cube') == b'\x00\x01binary'
+    assert reader.get('missing') is None
+
+
+def test_least_recently_used_entries_are_evicted_from_the_disk(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path), 0, 3500)
+    for i in range(5):
+        result_cache.set('k{}'.format(i), {'body': 'x' * 1000})
+        time.sleep(0.01)
+    assert get_disk_keys(tmp_path) == ['k2', 'k3', 'k4']
+
+    result_cache.get('k2')
+    result_cache.set('k5', {'body': 'x' * 1000})
+    assert get_disk_keys(tmp_path) == ['k2', 'k4', 'k5']
+
+
+def test_memory_level_is_bounded(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path), 2500, 1024 ** 2)
+    for i in range(3):
+        result_cache.set('k{}'.format(i), {'body': 'x' * 1000})
+    assert list(result_cache._entries) == ['k1', 'k2']
+    assert result_cache._memory_bytes <= 2500
+
+
+def test_removed_folder_is_created_again(tmp_path):
+    folder = tmp_path / 'results'
+    result_cache = cache.ResultCache(str(folder), 0, 1024 ** 2)
+    result_cache.set('k0', {'body': 'x'})
+    shutil.rmtree(str(folder))
+    result_cache.set('k1', {'body': 'y'})
+    assert result_cache.get('k1') == {'body': 'y'}
+    assert result_cache.get('k0') is None
+
+
+def test_unwritable_database_is_skipped(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a folder')
+    result_cache = cache.ResultCache(str(blocker / 'results'), 1024, 1024 ** 2)
+    result_cache.set('k0', {'body': 'x'})  # kept in memory only
+    assert result_cache.get('k0') == {'body': 'x'}
+
+
+def test_remembered_values_stay_in_memory(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path), 2500, 1024 ** 2)
+    value = object()
+    result_cache.remember('decoded', value, 1000)
+    assert result_cache.recall('decoded') is value
+    assert result_cache.get('decoded') is value
+    result_cache.remember('too large', object(), 3000)
+    assert result_cache.recall('too large') is None
+    assert not (tmp_path / cache.DATABASE_FILE).exists()
@@ -0,0 +1,70 @@
+import io
+import random
+import pytest
+from chatalyzer import compression, parallel, parsing, store
+
+
+@pytest.fixture
+def compressed_chat(tmp_path, make_chat):
+    """
+    Returns the text of a synthetic chat and the path of its compressed copy, cut into small frames
+    """
+    with open(make_chat(3000), 'rb') as in_file:
+        data = in_file.read()
+    path = str(tmp_path / 'chat.txtz')
+    writer = compression.CompressedChatWriter(path, frame_bytes=16 * 1024)
+    for start in range(0, len(data), 10000):
+        writer.write(data[start:start + 10000])
+    writer.close()
+    return data, path
+
+
+def test_random_offsets_are_read_from_their_frame(compressed_chat):
+    data, path = compressed_chat
+    assert compression.get_chat_size(path) == len(data)
+    with open(path, 'rb') as in_file:
+        assert len(compression.read_index(in_file)[1]) > 10
+
+    rng = random.Random(0)
+    with compression.CompressedChatReader(path) as reader, compression.open_chat(path) as buffered:
+        for _ in range(200):
+            offset, size = rng.randrange(len(data) + 100), rng.randrange(1, 40000)
+            reader.seek(offset)
+            buffered.seek(offset)
+            chunk = reader.read(size)  # at most the rest of the frame holding offset
+            assert chunk == data[offset:offset + len(chunk)]
+            assert chunk or offset >= len(data)
+            assert buffered.read(size) == data[offset:offset + size]
+            assert buffered.tell() == min(offset + size, max(offset, len(data)))
+        reader.seek(-100, io.SEEK_END)
+        assert reader.readall() == data[-100:]
+        reader.seek(0)
+        assert reader.readall() == data
+
+
+def test_byte_ranges_are_parsed_as_from_the_plain_chat(compressed_chat, tmp_path):
+    data, path = compressed_chat
+    plain_path = str(tmp_path / 'plain.txt')
+    with open(plain_path, 'wb') as out_file:
+        out_file.write(data)
+    start = data.index(b'\n', len(data) // 3) + 1
+    end = data.index(b'\n', 2 * len(data) // 3) + 1
+    for args in [(0, None), (start, end), (end, None)]:
+        assert ''.join(parsing.iter_text_chunks(path, 5000, *args)) == \
+            ''.join(parsing.iter_text_chunks(plain_path, 5000, *args))
+    assert parsing.get_chats(path).equals(parsing.get_chats(plain_path))
+    assert parallel.find_shard_boundaries(path, 4) == parallel.find_shard_boundaries(plain_path, 4)
+
+
+def test_migrated_uploads_are_compressed(tmp_path, make_chat):
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    with open(make_chat(1000), 'rb') as in_file:
+        data = in_file.read()
+    (upload_folder / 'abc.txt').write_bytes(data)
+    migrated = store.migrate_uploads(str(upload_folder))
+    assert [analysis_id for analysis_id, _, _ in migrated] == ['abc']
+    path = compression.find_chat(str(upload_folder), 'abc')
+    assert compression.is_compressed(path)
+    with compression.open_chat(path) as in_file:
+        assert in_file.read() == data
@@ -0,0 +1,44 @@
+import json
+import pytest
+from chatalyzer import aggregates, analysis, chatalyzer, parallel
+
+GROUP_NAME = 'Avengers'
+
+
+@pytest.fixture(params=['ios', 'android'])
+def event_chat(request, make_chat):
+    return make_chat(3000, platform=request.param, membership_ratio=0.05, seed=3)
+
+
+def test_events_are_left_out_of_message_metrics(event_chat):
+    df = chatalyzer.parse_chats(event_chat)
+    event_mask = analysis.get_event_mask(df)
+    assert event_mask.sum() == analysis.get_events(df).index.nunique() > 0
+
+    payload = analysis.get_analysis(df)
+    senders = dict(json.loads(payload['top_message_senders']))
+    assert GROUP_NAME not in senders
+    assert GROUP_NAME not in dict(json.loads(payload['word_count']))
+    assert sum(senders.values()) == df[~event_mask][analysis.KEY_AUTHOR].notna().sum()
+    words = dict(json.loads(payload['most_used_words']))
+    assert 'added' not in words and 'left' not in words
+    assert payload['num_msgs'] == df.shape[0]
+
+
+def test_aggregated_paths_match_the_dataframe(event_chat):
+    expected = analysis.get_analysis(chatalyzer.parse_chats(event_chat))
+    assert aggregates.aggregate_chat_file(event_chat, batch_size=700).get_analysis() == expected
+    assert parallel.aggregate_chat_file(event_chat, 3, batch_size=700).get_analysis() == expected
+
+    saved = aggregates.ChatAggregates.from_dict(json.loads(json.dumps(
+        aggregates.aggregate_chat_file(event_chat).to_dict())))
+    assert saved.get_analysis() == expected
+
+
+def test_group_timeline_metric(event_chat):
+    df = chatalyzer.parse_chats(event_chat)
+    timeline = json.loads(analysis.get_metric(df, 'group_timeline'))
+    intervals, membership = analysis.get_group_timeline(df)
+    assert len(timeline['members']) == intervals.shape[0]
+    assert [count for _, count in timeline['member_count']] == membership[analysis.KEY_MEMBER_COUNT].tolist()
+    assert timeline['member_count'][0][0] == df[analysis.KEY_DATE_TIME].min().isoformat()
@@ -0,0 +1,56 @@
+import os
+import pytest
+from chatalyzer import analysis, chatalyzer, incremental
+
+
+@pytest.fixture
+def app(tmp_path):
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    app = chatalyzer.create_app({'UPLOAD_FOLDER': str(upload_folder), 'RESULT_CACHE_FOLDER': str(tmp_path / 'results'),
+                                 'ANALYSIS_JOBS': False, 'INCREMENTAL_MIN_BYTES': 0})
+    with app.app_context():
+        yield app
+
+
+def cut_at_message(data, fraction):
+    """
+    Returns the beginning of an iOS export, up to the first message header after fraction of it
+    """
+    position = data.index(b'\n[', int(len(data) * fraction)) + 1
+    return data[:position]
+
+
+def put_chat(app, analysis_id, data):
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], analysis_id + '.txt'), 'wb') as out_file:
+        out_file.write(data)
+
+
+def test_longer_export_is_aggregated_from_the_previous_one(app, make_chat, monkeypatch):
+    # month first, as the days of the first part alone are ambiguous and would be read month first
+    data = open(make_chat(4000, multiline_ratio=0.1, membership_ratio=0.01, date_order='mdy'), 'rb').read()
+    put_chat(app, 'first', cut_at_message(data, 0.6))
+    chatalyzer.compute_analysis('first')
+
+    previous = []
+    find_previous_analysis = incremental.find_previous_analysis
+    monkeypatch.setattr(incremental, 'find_previous_analysis',
+                        lambda *args: previous.append(find_previous_analysis(*args)) or previous[-1])
+    put_chat(app, 'second', data)
+    payload = chatalyzer.compute_analysis('second')
+
+    assert previous[0] is not None
+    assert previous[0][1] == len(cut_at_message(data, 0.6))
+    assert payload == analysis.get_analysis(chatalyzer.parse_chats(os.path.join(app.config['UPLOAD_FOLDER'],
+                                                                                'second.txt')))
+
+
+def test_aggregates_are_only_saved_for_chats_which_can_be_recognized(app, make_chat):
+    put_chat(app, 'short', open(make_chat(incremental.FINGERPRINT_MESSAGES - 1), 'rb').read())
+    chatalyzer.compute_analysis('short')
+    app.config['INCREMENTAL_MIN_BYTES'] = 1024 ** 3
+    put_chat(app, 'small', open(make_chat(1000, name='small.txt'), 'rb').read())
+    chatalyzer.compute_analysis('small')
+
+    for analysis_id in ('short', 'small'):
+        assert not os.path.exists(incremental.get_aggregates_path(app.config['UPLOAD_FOLDER'], analysis_id))
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+import pytest
+from chatalyzer import locks
+
+
+def test_lock_is_exclusive_and_removed_when_released(tmp_path):
+    path = locks.get_lock_path(str(tmp_path), 'chat', 'analysis')
+    holders, overlaps = [], []
+
+    def work():
+        for _ in range(20):
+            with locks.file_lock(path):
+                holders.append(threading.get_ident())
+                if len(holders) > 1:
+                    overlaps.append(list(holders))
+                time.sleep(0.001)
+                holders.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_stale_lock_file_is_reused(tmp_path):
+    path = locks.get_lock_path(str(tmp_path), 'chat', 'parse')
+    open(path, 'a').close()  # left by a holder which died
+    with locks.file_lock(path):
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_lock_file_removed_while_held(tmp_path):
+    path = locks.get_lock_path(str(tmp_path), 'chat', 'parse')
+    with pytest.raises(KeyError):
+        with locks.file_lock(path):
+            os.remove(path)  # e.g. evicted along with the upload
+            raise KeyError('body')  # not replaced by the missing lock file
+    with locks.file_lock(path):  # released all the same
+        pass
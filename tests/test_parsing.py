@@ -0,0 +1,34 @@
+import pytest
+from chatalyzer import chatalyzer, parsing
+
+DIALECTS = [(platform, clock, date_order) for platform in ('ios', 'android') for clock in ('24h', '12h')
+            for date_order in ('dmy', 'mdy')]
+
+
+@pytest.mark.parametrize('platform, clock, date_order', DIALECTS)
+def test_regex_scan_matches_the_line_by_line_parser(make_chat, platform, clock, date_order):
+    chat_path = make_chat(2000, multiline_ratio=0.2, membership_ratio=0.02, platform=platform, clock=clock,
+                          date_order=date_order)
+    df = parsing.get_chats(chat_path)
+    assert df.shape[0] > 2000
+    assert df.equals(chatalyzer.get_chats_per_line(chat_path))
+
+
+@pytest.mark.parametrize('platform, clock, date_order', DIALECTS)
+def test_stream_parser_matches_the_regex_scan(make_chat, platform, clock, date_order):
+    chat_path = make_chat(2000, multiline_ratio=0.2, platform=platform, clock=clock, date_order=date_order)
+    text = parsing.read_chat_text(chat_path)
+    stream_parser = parsing.ChatStreamParser()
+    rows = []
+    for start in range(0, len(text), 977):  # chunks ending in the middle of lines
+        rows.extend(stream_parser.feed(text[start:start + 977]))
+    rows.extend(stream_parser.close())
+    assert rows == list(parsing.parse_chat_text(text).itertuples(index=False, name=None))
+
+
+def test_lines_before_the_first_header_form_a_message_without_author():
+    text = 'exported chat\n[01/02/2018, 10:00:00] Bruce: Hello\nsecond line\n'
+    expected = [(None, None, None, 'exported chat'), ('01/02/2018', '10:00:00', 'Bruce', 'Hello second line')]
+    assert list(parsing.parse_chat_text(text).itertuples(index=False, name=None)) == expected
+    stream_parser = parsing.ChatStreamParser()
+    assert stream_parser.feed(text) + stream_parser.close() == expected
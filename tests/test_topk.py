@@ -0,0 +1,78 @@
+from collections import Counter
+import numpy as np
+from chatalyzer import aggregates, analysis, chatalyzer, topk
+
+
+def get_stream(n_items=20000, vocabulary=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return ['w{}'.format(rank) for rank in np.minimum(rng.zipf(1.3, n_items), vocabulary)]
+
+
+def assert_within_error(summary, exact):
+    assert summary.total == sum(exact.values())
+    assert summary.error <= summary.total / (summary.capacity + 1)
+    for item, count in summary.items():
+        assert exact[item] - summary.error <= count <= exact[item]
+    for item, count in exact.items():
+        if count > summary.error:
+            assert item in summary.counts
+
+
+def test_counts_are_within_the_error_bound():
+    stream = get_stream()
+    summary = topk.FrequentItems(50)
+    for start in range(0, len(stream), 1000):
+        summary.update(Counter(stream[start:start + 1000]))
+    assert len(summary) <= 50
+    assert_within_error(summary, Counter(stream))
+
+
+def test_summary_never_holds_twice_its_capacity_while_updating():
+    class Watched(topk.FrequentItems):
+        peak = 0
+
+        def _prune(self):
+            Watched.peak = max(Watched.peak, len(self.counts))
+            super()._prune()
+
+    stream = get_stream()
+    summary = Watched(50)
+    summary.update(Counter(stream))
+    assert Watched.peak <= 100
+    assert_within_error(summary, Counter(stream))
+
+
+def test_merged_summaries_are_within_the_error_bound():
+    stream = get_stream()
+    parts = [topk.FrequentItems(50) for _ in range(4)]
+    for part, start in zip(parts, range(0, len(stream), 5000)):
+        part.update(Counter(stream[start:start + 5000]))
+    merged = topk.FrequentItems.from_dict(parts[0].to_dict())
+    for part in parts[1:]:
+        merged.update(part)
+    assert_within_error(merged, Counter(stream))
+
+
+def test_batches_hold_at_most_capacity_items():
+    sizes = np.array([3, 0, 5, 12, 1, 1, 4, 2])
+    batches = analysis.get_top_k_batches(sizes, 6)
+    assert batches[0][0] == 0 and batches[-1][1] == len(sizes)
+    assert all(end == start for (_, end), (start, _) in zip(batches, batches[1:]))
+    for start, end in batches:
+        assert end - start == 1 or sizes[start:end].sum() <= 6
+
+
+def test_approximate_words_match_the_exact_counts(make_chat):
+    df = chatalyzer.parse_chats(make_chat(3000))
+    exact = analysis.count_words(df)
+    assert_within_error(analysis.count_words(df, capacity=40), exact)
+
+    chat_aggregates = aggregates.ChatAggregates(40)
+    for start in range(0, df.shape[0], 1000):
+        chat_aggregates.update(df.iloc[start:start + 1000])
+    assert_within_error(chat_aggregates.word_counter, exact)
+
+
+def test_capacity_leaves_room_for_a_batch():
+    assert topk.get_capacity(topk.BYTES_PER_ITEM * topk.PEAK_ITEMS_PER_CAPACITY * 100) == 100
+    assert topk.get_capacity(0) == 1
@@ -0,0 +1,94 @@
+import io
+import zipfile
+import pytest
+from chatalyzer import chatalyzer, parsing, upload_stream
+
+
+class UnseekableFile(io.RawIOBase):
+    """
+    Write-only file making zipfile write a data descriptor after every entry, as streaming zip tools do
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = b''
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += bytes(data)
+        return len(data)
+
+
+def make_zip(chat_path, compression=zipfile.ZIP_DEFLATED, seekable=True):
+    out_file = io.BytesIO() if seekable else UnseekableFile()
+    with zipfile.ZipFile(out_file, 'w', compression) as zip_file:
+        zip_file.writestr('IMG-20180101-WA0001.jpg', bytes(range(256)) * 64)
+        zip_file.write(chat_path, 'WhatsApp Chat with Avengers.txt')
+        zip_file.writestr('VID-20180101-WA0002.mp4', b'\x00' * 1000)
+    return out_file.getvalue() if seekable else out_file.data
+
+
+def upload(tmp_path, data, filename, chunk_size=4093, max_bytes=1024 ** 3, compress=False):
+    chat_upload = upload_stream.ChatUpload(str(tmp_path), filename, max_bytes, 1024 ** 3, compress)
+    for start in range(0, len(data), chunk_size):  # odd chunks, splitting some UTF-8 sequences
+        chat_upload.write(data[start:start + chunk_size])
+    assert chat_upload.tell() == len(data)
+    assert chat_upload.seek(0) == len(data)
+    return chat_upload, chat_upload.finish()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_chat_is_parsed_as_it_is_received(tmp_path, make_chat, compress):
+    chat_path = make_chat(3000, multiline_ratio=0.2, emoji_ratio=0.5)
+    with open(chat_path, 'rb') as in_file:
+        data = in_file.read()
+    chat_upload, df = upload(tmp_path, data, 'chat.txt', compress=compress)
+    expected = parsing.get_chats(chat_path)
+    assert df.equals(expected)
+    assert parsing.get_chats(chat_upload.path).equals(expected)
+
+
+def test_character_split_before_the_streaming_threshold(tmp_path, make_chat):
+    with open(make_chat(5000, emoji_ratio=0.5), 'rb') as in_file:
+        data = in_file.read()
+    split = next(i for i in range(2 * upload_stream.SNIFF_BYTES, len(data)) if data[i] >= 0xF0) + 1
+    chat_upload = upload_stream.ChatUpload(str(tmp_path), 'chat.txt', 1024 ** 3, split + 10)
+    chat_upload.write(data[:split])  # the last chunk decoded ends inside an emoji
+    chat_upload.write(data[split:])
+    assert chat_upload.finish() is None
+    with open(chat_upload.path, 'rb') as in_file:
+        assert in_file.read() == data
+
+
+@pytest.mark.parametrize('compression, seekable', [(zipfile.ZIP_DEFLATED, True), (zipfile.ZIP_STORED, True),
+                                                   (zipfile.ZIP_DEFLATED, False)])
+def test_chat_is_extracted_from_a_zip_export(tmp_path, make_chat, compression, seekable):
+    chat_path = make_chat(3000)
+    data = make_zip(chat_path, compression, seekable)
+    if not seekable:
+        assert zipfile.ZipFile(io.BytesIO(data)).infolist()[0].flag_bits & 0x08  # data descriptors
+    _, df = upload(tmp_path, data, 'chat.zip', chunk_size=1000)
+    assert df.equals(parsing.get_chats(chat_path))
+
+
+def test_uploads_which_are_not_chats_are_rejected(tmp_path, make_chat):
+    with pytest.raises(upload_stream.UploadError, match='not a WhatsApp chat'):
+        upload(tmp_path, b'just some text\n' * 10000, 'notes.txt')
+    with pytest.raises(upload_stream.UploadError, match='Not a zip file'):
+        upload(tmp_path, b'just some text\n' * 10, 'chat.zip')
+    with pytest.raises(upload_stream.UploadError) as error:
+        upload(tmp_path, b'x' * 5000, 'chat.txt', max_bytes=4096)
+    assert error.value.status == 413
+    assert list(tmp_path.iterdir()) == []  # partial chats are discarded
+
+
+def test_upload_endpoint(tmp_path, make_chat):
+    app = chatalyzer.create_app({'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                                 'RESULT_CACHE_FOLDER': str(tmp_path / 'results'), 'ANALYSIS_JOBS': False})
+    data = make_zip(make_chat(500))
+    response = app.test_client().post('/uploader', data={'file': (io.BytesIO(data), 'chat.zip')},
+                                      content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert app.test_client().get(response.headers['Location']).status_code == 200